@@ -0,0 +1,111 @@
+"""
+Orçamento de comandos WebDriver por fluxo.
+
+Cada comando do KMMIEDriver é um round trip HTTP até o IEDriverServer, e é
+isso que domina o tempo de uma emissão. Aqui os fluxos rodam contra o
+driver falso (bench/fake_driver.py) e o total de comandos de cada operação
+de negócio (contado pelo hook do command_executor, ver kmm.helper.metrics)
+é comparado com o orçamento versionado em bench/command_budgets.json.
+
+Uso (a partir de src/):
+    python -m bench.command_budget              # falha (exit 1) se algum fluxo estourar
+    python -m bench.command_budget --update     # regrava o orçamento após mudança intencional
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from bench.fake_driver import FakeKMM, fake_webdriver
+from bench.kmm_stub import StubConfig
+from bench.runner import build_flows
+from kmm.helper.metrics import METRICS
+from kmm.ie_driver.ie_driver import IEDriverConfig
+from kmm.services.kmm_actions import KMMActions, LoginParams
+
+BUDGETS_PATH = Path(__file__).with_name("command_budgets.json")
+
+# Fluxo do runner -> operação (etapa do KMMActions) cujos comandos são contados
+FLOW_OPERATIONS: Dict[str, str] = {
+    "login": "login",
+    "lotacao": "belgo_load_user_profile",
+    "repomfretea": "emitting_contract_repomfretea",
+    "payment": "payment",
+}
+
+SERVICE = "CommandBudget"
+
+
+def measure(flows: List[str]) -> Dict[str, Dict[str, int]]:
+    """Roda os fluxos no driver falso e devolve {fluxo: {comando: n}}."""
+    config = IEDriverConfig(metrics_dir=None, poll_stats_path=None, kill_processes_on_stop=False)
+    stub = StubConfig()
+    kmm = KMMActions(service=SERVICE, config=config)
+    kmm.driver.attach(fake_webdriver(FakeKMM(driver_name=stub.driver_name)))
+    available = build_flows(kmm, LoginParams(url="http://fake-kmm/admin.cfm", username="BENCH", password="bench"),
+                            stub, state={})
+
+    counts = {}
+    for flow in flows:
+        METRICS.reset()
+        available[flow]()
+        counts[flow] = METRICS.command_counts(SERVICE).get(FLOW_OPERATIONS[flow], {})
+    kmm.stop()
+    return counts
+
+
+def check(counts: Dict[str, Dict[str, int]], budgets: dict) -> List[str]:
+    problems = []
+    for flow, commands in counts.items():
+        total = sum(commands.values())
+        budget = budgets.get(flow)
+        if budget is None:
+            problems.append(f"{flow}: sem orçamento (rode com --update)")
+            continue
+        limit = budget["max_commands"]
+        if total > limit:
+            diff = {
+                cmd: n - budget["commands"].get(cmd, 0)
+                for cmd, n in sorted(commands.items())
+                if n > budget["commands"].get(cmd, 0)
+            }
+            problems.append(f"{flow}: {total} comandos, orçamento {limit} (a mais: {diff})")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Orçamento de comandos WebDriver por fluxo")
+    parser.add_argument("--flows", default=",".join(FLOW_OPERATIONS))
+    parser.add_argument("--update", action="store_true", help="regrava command_budgets.json com as contagens atuais")
+    args = parser.parse_args()
+
+    flows = [f.strip() for f in args.flows.split(",") if f.strip()]
+    counts = measure(flows)
+    budgets = json.loads(BUDGETS_PATH.read_text(encoding="utf-8")) if BUDGETS_PATH.exists() else {}
+
+    for flow, commands in counts.items():
+        limit = budgets.get(flow, {}).get("max_commands", "-")
+        print(f"{flow:<12} {sum(commands.values()):>4} comandos (orçamento {limit})")
+
+    if args.update:
+        for flow, commands in counts.items():
+            budgets[flow] = {
+                "operation": FLOW_OPERATIONS[flow],
+                "max_commands": sum(commands.values()),
+                "commands": dict(sorted(commands.items())),
+            }
+        BUDGETS_PATH.write_text(json.dumps(budgets, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Orçamento gravado em {BUDGETS_PATH}")
+        return 0
+
+    problems = check(counts, budgets)
+    for problem in problems:
+        print(f"ESTOUROU {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
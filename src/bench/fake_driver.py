@@ -0,0 +1,266 @@
+"""
+WebDriver falso para contar round trips dos fluxos sem IE nem KMM.
+
+FakeConnection substitui o RemoteConnection: em vez de falar HTTP com o
+IEDriverServer, responde cada comando do protocolo JSON wire (o que o
+Selenium 3 usa com o IE) a partir de um estado mínimo em memória —
+janelas, frame corrente, alerta aberto e valores digitados. Todos os
+elementos existem, estão visíveis e habilitados; os scripts injetados pelo
+KMMIEDriver (fill_form, extract_table, esperas) recebem respostas de
+"página pronta".
+
+Serve para contar comandos, não para validar o KMM: o comportamento das
+telas se resume às regras de FakeKMM (qual clique abre alerta, qual texto
+cada célula retorna etc.).
+
+Uso:
+    kmm = KMMActions(service="Bench", config=IEDriverConfig(...))
+    kmm.driver.attach(fake_webdriver())
+"""
+from __future__ import annotations
+
+import itertools
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+from selenium.webdriver.remote.webdriver import WebDriver
+
+from kmm.ie_driver import forms, tables, waits
+from kmm.ie_driver.ie_driver import CURRENT_FRAME_JS
+from kmm.services.kmm_actions import SESSION_STATE_JS
+
+_HOME = "kmm-home"
+_REPOM = "kmm-repom"
+
+# Códigos de erro do protocolo JSON wire
+_NO_SUCH_WINDOW = 23
+_NO_ALERT_OPEN = 27
+
+
+@dataclass
+class FakeKMM:
+    """Regras das telas que os fluxos medidos precisam."""
+    driver_name: str = "GIVANILDO NICACIO DA SILVA"
+    contract_number: str = "901234"
+    home_title: str = "Sistema KMM"
+    repom_title: str = "Engenharia de Sistemas"
+    # Segundos até o número aparecer na janela de retorno da REPOM
+    repom_delay_s: float = 0.0
+    # Latência simulada por comando (0 = só contar)
+    latency_s: float = 0.0
+
+
+class FakeConnection(RemoteConnection):
+    def __init__(self, kmm: Optional[FakeKMM] = None):
+        super().__init__("http://fake-iedriver", keep_alive=False, resolve_ip=False)
+        self.kmm = kmm or FakeKMM()
+        self._ids = itertools.count(1)
+        self._elements: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, str] = {"MOTORISTA": self.kmm.driver_name}
+        self.handles: List[str] = [_HOME]
+        # Janela de retorno da REPOM -> (número do contrato, quando fica pronto)
+        self.repom: Dict[str, Tuple[str, float]] = {}
+        self.current = _HOME
+        self.frame: Optional[Tuple[str, str]] = None
+        self.alert: Optional[str] = None
+        self.screen = ""
+
+    # --- protocolo ---
+
+    def execute(self, command: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.kmm.latency_s:
+            time.sleep(self.kmm.latency_s)
+        handler = getattr(self, f"_cmd_{command}", None)
+        try:
+            value = handler(params) if handler else None
+        except _WireError as e:
+            return {"status": e.status, "sessionId": "fake", "value": {"message": e.message}}
+        return {"status": 0, "sessionId": "fake", "value": value}
+
+    # --- elementos ---
+
+    def _element(self, using: str, value: str) -> Dict[str, str]:
+        element_id = f"el-{next(self._ids)}"
+        self._elements[element_id] = (using, value)
+        return {"ELEMENT": element_id}
+
+    def _locator(self, params: Dict[str, Any]) -> Tuple[str, str]:
+        return self._elements.get(params.get("id"), ("", ""))
+
+    def _key(self, params: Dict[str, Any]) -> str:
+        using, value = self._locator(params)
+        match = re.search(r"@id=['\"]([^'\"]+)", value)
+        return match.group(1) if match else value
+
+    def _cmd_findElement(self, params):
+        return self._element(params["using"], params["value"])
+
+    def _cmd_findElements(self, params):
+        return [self._element(params["using"], params["value"])]
+
+    _cmd_findChildElement = _cmd_findElement
+    _cmd_findChildElements = _cmd_findElements
+
+    def _cmd_isElementDisplayed(self, params):
+        return True
+
+    def _cmd_isElementEnabled(self, params):
+        return True
+
+    def _cmd_isElementSelected(self, params):
+        return False
+
+    def _cmd_getElementTagName(self, params):
+        return "select"
+
+    def _cmd_clearElement(self, params):
+        self._values[self._key(params)] = ""
+
+    def _cmd_sendKeysToElement(self, params):
+        key = self._key(params)
+        text = "".join(params.get("value") or [])
+        self._values[key] = self._values.get(key, "") + text
+        if key == "ACESSO_RAPIDO":
+            self.screen = self._values[key].upper()
+
+    def _cmd_getElementAttribute(self, params):
+        if params.get("name") == "value":
+            return self._values.get(self._key(params), "")
+        return None
+
+    def _cmd_getElementText(self, params):
+        _, value = self._locator(params)
+        if "td_titulo_pagina" in value:
+            return "Integrar Contrato"
+        if value.endswith("tr[3]/td[2]"):
+            number, ready_at = self.repom.get(self.current, (self.kmm.contract_number, 0.0))
+            return number if time.monotonic() >= ready_at else ""
+        return ""
+
+    def _cmd_clickElement(self, params):
+        _, value = self._locator(params)
+        if "btn_confirmar" in value and self.screen.startswith("REPOMFRETE") and self.current == _HOME:
+            self.alert = "Contrato enviado a REPOM com sucesso"
+            # Cada envio abre a sua janela de retorno, com o seu número
+            seq = len(self.repom)
+            handle = f"{_REPOM}-{seq + 1}"
+            number = str(int(self.kmm.contract_number) + seq)
+            self.repom[handle] = (number, time.monotonic() + self.kmm.repom_delay_s)
+            self.handles.append(handle)
+        elif value.endswith("tr[3]/td/button[2]"):
+            self.alert = "Contrato quitado com sucesso"
+        elif "Lotar" in value:
+            self.alert = "Usuario lotado com sucesso"
+
+    # --- scripts ---
+
+    def _cmd_executeScript(self, params):
+        script, args = params["script"], params.get("args") or []
+        if script == forms.FILL_FORM_JS:
+            return {key: {"found": True, "tag": "input", "value": value} for key, value in args[0]}
+        if script == tables.EXTRACT_TABLE_JS:
+            return self._table(args)
+        if script == waits.PAGE_STATE_JS:
+            return {"ready": True, "overlay": False, "pending": 0, "idle_ms": 60000}
+        if script == waits.FRAME_MARK_JS:
+            return True
+        if script == CURRENT_FRAME_JS:
+            return self._current_frame()
+        if script == SESSION_STATE_JS:
+            return {"principal": True, "login": False}
+        return None
+
+    def _table(self, args) -> List[Dict[str, Any]]:
+        # Lotação: a filial procurada já aparece como lotada (destaque)
+        match = re.search(r"normalize-space\(\)='([^']+)'", args[2] or "")
+        if match:
+            return [{"cells": [match.group(1)], "class": "destaque"}]
+        return []
+
+    def _current_frame(self):
+        if self.frame is None:
+            return None
+        using, value = self.frame
+        return [value if using == "id" else "", value if using == "name" else ""]
+
+    # --- frames / janelas ---
+
+    def _cmd_switchToFrame(self, params):
+        ref = params.get("id")
+        if ref is None:
+            self.frame = None
+        elif isinstance(ref, dict):
+            self.frame = self._elements.get(ref.get("ELEMENT"), ("", ""))
+        else:
+            self.frame = ("name", str(ref))
+
+    def _cmd_switchToParentFrame(self, params):
+        self.frame = None
+
+    def _cmd_getCurrentWindowHandle(self, params):
+        return self.current
+
+    def _cmd_getWindowHandles(self, params):
+        return list(self.handles)
+
+    def _cmd_switchToWindow(self, params):
+        handle = params.get("name") or params.get("handle")
+        if handle not in self.handles:
+            raise _WireError(_NO_SUCH_WINDOW, f"Janela {handle} não existe")
+        self.current = handle
+        self.frame = None
+
+    def _cmd_getTitle(self, params):
+        return self.kmm.repom_title if self.current.startswith(_REPOM) else self.kmm.home_title
+
+    def _cmd_close(self, params):
+        if self.current in self.handles:
+            self.handles.remove(self.current)
+
+    def _cmd_get(self, params):
+        self.frame = None
+
+    def _cmd_refresh(self, params):
+        self.frame = None
+
+    # --- alertas ---
+
+    def _cmd_getAlertText(self, params):
+        if self.alert is None:
+            raise _WireError(_NO_ALERT_OPEN, "Nenhum alerta aberto")
+        return self.alert
+
+    def _cmd_acceptAlert(self, params):
+        if self.alert is None:
+            raise _WireError(_NO_ALERT_OPEN, "Nenhum alerta aberto")
+        self.alert = None
+
+    _cmd_dismissAlert = _cmd_acceptAlert
+
+    # --- sessão ---
+
+    def _cmd_newSession(self, params):
+        return {"browserName": "internet explorer"}
+
+    def _cmd_getCurrentUrl(self, params):
+        return "http://fake-kmm/principal.cfm"
+
+    def _cmd_getPageSource(self, params):
+        return "<html></html>"
+
+    def _cmd_screenshot(self, params):
+        return ""
+
+
+class _WireError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def fake_webdriver(kmm: Optional[FakeKMM] = None) -> WebDriver:
+    return WebDriver(command_executor=FakeConnection(kmm), desired_capabilities={"browserName": "internet explorer"})
@@ -0,0 +1,651 @@
+"""
+Servidor local que imita as telas do KMM usadas pelos fluxos do KMMActions.
+
+Cobre apenas o necessário para rodar os fluxos de ponta a ponta:
+  - login (admin.cfm) com sessão por cookie
+  - frames `principal` / `iconteudo` e o campo ACESSO_RAPIDO
+  - telas lot, REPOMFRETEA, REPOMFRETED, LTREPOMFRETE e ectecomp
+  - janela "Integrar Contrato" da REPOM, alertas e tabela de impostos
+
+Latências são configuráveis para simular o KMM lento de produção.
+
+Uso:
+    python -m bench.kmm_stub --port 8765 --latency 0.3 --repom-delay 8
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from typing import Optional
+from urllib.parse import parse_qs, quote, urlparse
+
+
+@dataclass
+class StubConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+
+    # Latência aplicada a toda requisição (segundos)
+    latency: float = 0.2
+    # Latência extra das chamadas "ajax" (busca de motorista, cálculos, etc.)
+    api_latency: float = 0.5
+    # Tempo até a REPOM devolver o número do contrato
+    repom_delay: float = 5.0
+    # Tempo de vida da sessão de login (0 = nunca expira)
+    session_ttl: float = 0.0
+
+    driver_name: str = "GIVANILDO NICACIO DA SILVA"
+    license_plate: str = "1234"
+    # Quantidade de complementos já emitidos que o alerta do ectecomp informa
+    emitted_complements: int = 0
+
+
+# -----------------------------
+# Templates (ES5 puro: IE11)
+# -----------------------------
+
+_COMMON_JS = """
+function kmm_ajax(url, cb) {
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', url, true);
+    xhr.onreadystatechange = function () {
+        if (xhr.readyState === 4) { cb(xhr.status === 200 ? JSON.parse(xhr.responseText) : null); }
+    };
+    xhr.send(null);
+}
+function kmm_val(id) { var el = document.getElementById(id); return el ? el.value : ''; }
+function kmm_set(id, v) { var el = document.getElementById(id); if (el) { el.value = v; } }
+"""
+
+_LOGIN = Template("""<!DOCTYPE html>
+<html><head><meta http-equiv="X-UA-Compatible" content="IE=edge"><title>Sistema KMM - Login</title></head>
+<body>
+<form method="post" action="/admin.cfm">
+  <input type="text" id="USUARIO" name="USUARIO">
+  <input type="password" id="SENHA" name="SENHA">
+  <label><input type="radio" name="EMPRESA" value="levo">Levolog Transportes</label>
+  <label><input type="radio" name="EMPRESA" value="freto" checked>Freto Log</label>
+  <button type="submit" title="Entrar">Entrar</button>
+</form>
+</body></html>""")
+
+_MAIN = Template("""<!DOCTYPE html>
+<html><head><meta http-equiv="X-UA-Compatible" content="IE=edge"><title>Sistema KMM</title></head>
+<body>
+<table><tbody><tr><td>
+  <iframe id="principal" name="principal" src="/principal.cfm" width="100%" height="900"></iframe>
+</td></tr></tbody></table>
+</body></html>""")
+
+_PRINCIPAL = Template("""<!DOCTYPE html>
+<html><head><meta http-equiv="X-UA-Compatible" content="IE=edge"><title>principal</title>
+<script>
+$common
+function f_aguarde(show) { document.getElementById('div_aguarde').style.display = show ? 'block' : 'none'; }
+function f_acesso_rapido() {
+    f_aguarde(true);
+    document.getElementById('imodal').style.display = 'none';
+    frames['iconteudo'].location.href = '/tela.cfm?t=' + encodeURIComponent(kmm_val('ACESSO_RAPIDO'));
+}
+function f_confirmar() {
+    var w = frames['iconteudo'];
+    if (w.f_confirmar) { w.f_confirmar(); }
+}
+function f_abre_modal(src) {
+    var m = document.getElementById('imodal');
+    m.style.display = 'block';
+    frames['imodal'].location.href = src;
+}
+</script></head>
+<body>
+<table id="tb_layout"><tbody>
+<tr>
+  <td>Menu</td>
+  <td>
+    <table><tbody>
+      <tr><td>Acesso rápido <input type="text" id="ACESSO_RAPIDO"><button type="button" class="botao-16x16" onclick="f_acesso_rapido()">Ir</button></td></tr>
+      <tr><td><iframe id="iconteudo" name="iconteudo" src="/blank.cfm" width="100%" height="600" onload="f_aguarde(false)"></iframe></td></tr>
+      <tr><td><button type="button" id="btn_confirmar" onclick="f_confirmar()">Confirmar</button></td></tr>
+      <tr><td><iframe id="imodal" name="imodal" src="/blank.cfm" style="display:none" width="100%" height="200"></iframe></td></tr>
+    </tbody></table>
+  </td>
+</tr>
+</tbody></table>
+<div id="div_aguarde" style="display:none">Aguarde, carregando...</div>
+</body></html>""")
+
+_BLANK = "<!DOCTYPE html><html><head><title></title></head><body></body></html>"
+
+_SCREEN = Template("""<!DOCTYPE html>
+<html><head><meta http-equiv="X-UA-Compatible" content="IE=edge"><title>$title</title>
+<script>
+$common
+$script
+</script></head>
+<body>
+$body
+</body></html>""")
+
+_LOT_BODY = """
+<form>
+  <select id="USUARIO" name="USUARIO">
+    <option value=""></option>
+    <option value="EMISSAO.AUTOMATICA">EMISSAO.AUTOMATICA</option>
+    <option value="FABIANA.HONORATO">FABIANA.HONORATO</option>
+  </select>
+  <button type="button" class="botao-16x16" onclick="f_pesquisar()">Pesquisar</button>
+  <table id="tb_lotacoes" style="display:none"><tbody>$rows</tbody></table>
+</form>
+"""
+
+_LOT_JS = """
+function f_pesquisar() { document.getElementById('tb_lotacoes').style.display = ''; }
+function f_lotar(filial) {
+    kmm_ajax('/api/lotar?filial=' + encodeURIComponent(filial), function (r) {
+        alert('Usuário lotado com sucesso na filial ' + filial);
+        location.reload();
+    });
+}
+"""
+
+_REPOMFRETEA_BODY = """
+<form>
+<table><tbody>
+  <tr><td>Placa</td><td><input type="text" id="PLACA_CONTROLE" onchange="f_busca_placa()"></td></tr>
+  <tr><td>Motorista</td><td><input type="text" id="MOTORISTA" readonly></td></tr>
+  <tr><td>Natureza</td><td><input type="text" id="NUM_NATUREZA"></td></tr>
+  <tr><td>Operação</td><td><input type="text" id="OPERACAO_ID"></td></tr>
+  <tr><td>Rota</td><td><input type="text" id="ROTA_ID"></td></tr>
+  <tr><td>Vale pedágio</td><td><select id="UTILIZA_VALE_PEDAGIO"><option value="1">Sim</option><option value="0">Não</option></select></td></tr>
+  <tr><td>Cartão</td><td><input type="text" id="CARTAO_NUMERO"></td></tr>
+  <tr><td>Remetente</td><td><input type="text" id="REM_CNPJ"></td></tr>
+  <tr><td>Destinatário</td><td><input type="text" id="DEST_CNPJ" onchange="f_calcula_frete()"></td></tr>
+  <tr><td>Valor unitário</td><td><input type="text" id="VALOR_UNITARIO" disabled></td></tr>
+  <tr><td>Peso</td><td><input type="text" id="PESO"></td></tr>
+  <tr><td>Volume</td><td><input type="text" id="VOLUME"></td></tr>
+  <tr><td>Unidade</td><td><select id="CON_UNIDADE_COMBO"><option value="Ton">Ton</option><option value="Kg">Kg</option></select></td></tr>
+  <tr><td>Usuário liberação</td><td><input type="text" id="USUARIO_LIBERACAO"></td></tr>
+  <tr><td>Senha liberação</td><td><input type="password" id="SENHA_LIBERACAO"></td></tr>
+  <tr><td>Observação</td><td><textarea id="OBSERVACAO"></textarea></td></tr>
+</tbody></table>
+</form>
+"""
+
+_REPOMFRETEA_JS = """
+function f_busca_placa() {
+    kmm_set('MOTORISTA', '');
+    kmm_ajax('/api/motorista?placa=' + encodeURIComponent(kmm_val('PLACA_CONTROLE')), function (r) {
+        if (r) { kmm_set('MOTORISTA', r.motorista); }
+    });
+}
+function f_calcula_frete() {
+    kmm_ajax('/api/calculo', function (r) { document.getElementById('VALOR_UNITARIO').disabled = false; });
+}
+function f_confirmar() {
+    var campos = ['PLACA_CONTROLE', 'NUM_NATUREZA', 'OPERACAO_ID', 'ROTA_ID', 'CARTAO_NUMERO', 'REM_CNPJ',
+                  'DEST_CNPJ', 'PESO', 'USUARIO_LIBERACAO', 'SENHA_LIBERACAO'];
+    for (var i = 0; i < campos.length; i++) {
+        if (!kmm_val(campos[i])) { alert('Campo obrigatório não preenchido: ' + campos[i]); return; }
+    }
+    kmm_ajax('/api/contrato', function (r) {
+        alert('Contrato enviado com sucesso para a REPOM');
+        window.open('/repom.cfm?id=' + r.id, '_blank');
+    });
+}
+"""
+
+_REPOMFRETED_BODY = """
+<form>
+<table><tbody>
+  <tr><td>Tipo diária</td><td><select id="TIPO_DIARIA"><option value="0"></option><option value="1">Descarga</option></select></td></tr>
+  <tr><td>CTRC</td><td><input type="text" id="DIARIA_NUM_CTRC"></td></tr>
+  <tr><td>Série</td><td><select id="CTRC_DIARIA_SERIE"><option value="1">1</option><option value="2">2</option><option value="3">3</option></select></td></tr>
+  <tr><td>Rota</td><td><input type="text" id="ROTA_ID"></td></tr>
+  <tr><td>Placa</td><td><input type="text" id="PLACA_CONTROLE" readonly></td></tr>
+  <tr><td>Valor unitário</td><td><input type="text" id="VALOR_UNITARIO"></td></tr>
+  <tr><td>Usuário liberação</td><td><select id="USUARIO_LIBERACAO">
+      <option value=""></option><option value="FABIANA.HONORATO">FABIANA.HONORATO</option>
+      <option value="EMISSAO.AUTOMATICA">EMISSAO.AUTOMATICA</option></select></td></tr>
+  <tr><td>Senha liberação</td><td><input type="password" id="SENHA_LIBERACAO"></td></tr>
+  <tr><td>Observação</td><td><textarea id="OBSERVACAO"></textarea></td></tr>
+</tbody></table>
+</form>
+"""
+
+_REPOMFRETED_JS = """
+function f_busca_rota() {
+    kmm_ajax('/api/rota?ctrc=' + encodeURIComponent(kmm_val('DIARIA_NUM_CTRC')), function (r) {
+        if (r) { kmm_set('PLACA_CONTROLE', r.placa); }
+    });
+}
+function f_change_valor_unitario(flag) { return true; }
+function f_confirmar() {
+    if (!kmm_val('PLACA_CONTROLE') || !kmm_val('SENHA_LIBERACAO')) { alert('Formulário incompleto'); return; }
+    kmm_ajax('/api/contrato', function (r) {
+        alert('Contrato enviado com sucesso para a REPOM');
+        window.open('/repom.cfm?id=' + r.id, '_blank');
+    });
+}
+"""
+
+_LTREPOMFRETE_BODY = """
+<form>
+  <input type="text" id="PROCESSO_TRANSPORTE_CODIGO">
+  <table id="tb_resultado" style="display:none"><tbody><tr><td>
+    <div><table><tbody><tr>
+      <td>1</td><td>2</td><td>3</td><td>4</td><td>5</td><td>6</td><td id="td_contrato"></td>
+      <td><button type="button" onclick="f_quitacao()"><img alt="Quitar"></button></td>
+    </tr></tbody></table></div>
+  </td></tr></tbody></table>
+  <div id="div_quitacao" style="display:none">
+    <select id="COD_PESSOA_FILIAL"><option value=""></option><option value="1">Matriz</option><option value="2">Filial MG</option><option value="3">Filial RJ</option></select>
+    <select id="COD_CENTRO_CUSTO"><option value=""></option><option value="370">370</option></select>
+    <input type="text" id="PESO_ENTREGA">
+  </div>
+</form>
+"""
+
+_LTREPOMFRETE_JS = """
+function f_confirmar() {
+    kmm_ajax('/api/pesquisa?contrato=' + encodeURIComponent(kmm_val('PROCESSO_TRANSPORTE_CODIGO')), function (r) {
+        document.getElementById('td_contrato').innerHTML = kmm_val('PROCESSO_TRANSPORTE_CODIGO');
+        document.getElementById('tb_resultado').style.display = '';
+    });
+}
+function f_quitacao() {
+    document.getElementById('div_quitacao').style.display = '';
+    parent.f_abre_modal('/quitacao.cfm');
+}
+"""
+
+_QUITACAO = Template("""<!DOCTYPE html>
+<html><head><meta http-equiv="X-UA-Compatible" content="IE=edge"><title>Quitação</title>
+<script>
+$common
+function f_quitar() {
+    var doc = parent.frames['iconteudo'].document;
+    var filial = doc.getElementById('COD_PESSOA_FILIAL').value;
+    var cc = doc.getElementById('COD_CENTRO_CUSTO').value;
+    var peso = doc.getElementById('PESO_ENTREGA').value;
+    if (!filial || !cc || !peso) { alert('Preencha filial, centro de custo e peso'); return; }
+    kmm_ajax('/api/quitar', function (r) { alert('Contrato quitado com sucesso'); });
+}
+</script></head>
+<body>
+<form><div><table><tbody>
+  <tr><td>Confirma a quitação?</td></tr>
+  <tr><td>&nbsp;</td></tr>
+  <tr><td><button type="button">Cancelar</button><button type="button" onclick="f_quitar()">Quitar</button></td></tr>
+</tbody></table></div></form>
+</body></html>""")
+
+_ECTECOMP_BODY = """
+<form>
+<table id="tbl_abas"><tbody><tr><td>Dados</td><td onclick="f_aba('negociacao')">Negociação</td></tr></tbody></table>
+<table><tbody>
+  <tr><td>Tipo</td><td><select id="CONHECIMENTO_TIPO_ID"><option value="0">Normal</option><option value="1">Conhecimento de Complemento</option></select></td></tr>
+  <tr><td>Tipo complemento</td><td><select id="TIPO_COMPLEMENTO_ID"><option value="0"></option><option value="1">CTe de Complemento</option></select></td></tr>
+  <tr><td>CT-e</td><td><input type="text" id="NUM_CONHECIMENTO_COMPLEMENTO"></td></tr>
+  <tr><td>Série</td><td><select id="SERIE_COMPLEMENTO" onchange="f_status_cte()"><option value=""></option><option value="1">1</option><option value="2">2</option></select></td></tr>
+  <tr><td>Motorista</td><td><input type="text" id="MOTORISTA" readonly></td></tr>
+</tbody></table>
+<div id="td_impostos_title" onclick="f_impostos()">Impostos</div>
+<table id="tb_lista_IMPOSTOS" style="display:none"><tbody>
+  <tr><th>Imposto</th><th>Alíquota</th><th>Descrição</th></tr>
+  <tr id="tr_lista_IMPOSTOS_1"><td class="linha_1">ICMS ST</td>
+      <td class="linha_1"><input id="ALIQUOTA_IMPOSTOS_1" value="12,00"></td>
+      <td class="linha_1"><input id="DESCRICAO_IMPOSTOS_1" value="icms presumido"></td></tr>
+  <tr id="tr_lista_IMPOSTOS_2"><td class="linha_1">ICMS</td>
+      <td class="linha_1"><input id="ALIQUOTA_IMPOSTOS_2" value="12,00"></td>
+      <td class="linha_1"><input id="DESCRICAO_IMPOSTOS_2" value="icms normal"></td></tr>
+  <tr id="tr_lista_IMPOSTOS_3"><td class="linha_1">PIS</td>
+      <td class="linha_1"><input id="ALIQUOTA_IMPOSTOS_3" value="0,65"></td>
+      <td class="linha_1"><input id="DESCRICAO_IMPOSTOS_3" value="pis"></td></tr>
+</tbody></table>
+<div id="div_negociacao" style="display:none">
+  <input type="text" id="VARIAVEL_VALORUNITARIOFRETE_CALC">
+  <input type="hidden" id="VARIAVEL_VALORUNITARIOFRETE">
+  <input type="text" id="VARIAVEL_FRETEPESO_CALC">
+  <input type="hidden" id="VARIAVEL_FRETEPESO">
+</div>
+</form>
+"""
+
+_ECTECOMP_JS = """
+function f_status_cte() {
+    kmm_ajax('/api/status_cte?cte=' + encodeURIComponent(kmm_val('NUM_CONHECIMENTO_COMPLEMENTO')), function (r) {
+        kmm_set('MOTORISTA', r.motorista);
+        alert(r.mensagem);
+    });
+}
+function f_impostos() {
+    kmm_ajax('/api/impostos', function (r) { document.getElementById('tb_lista_IMPOSTOS').style.display = ''; });
+}
+function f_aba(nome) { document.getElementById('div_negociacao').style.display = ''; }
+function f_calculos() {
+    kmm_ajax('/api/calculo', function (r) { return true; });
+}
+function f_confirmar() {
+    kmm_ajax('/api/cte', function (r) {
+        alert('CT-e de complemento gerado com sucesso');
+        window.open('/cte.cfm?numero=' + r.numero, '_blank');
+    });
+}
+"""
+
+_POPUP = Template("""<!DOCTYPE html>
+<html><head><meta http-equiv="X-UA-Compatible" content="IE=edge"><title>Engenharia de Sistemas</title></head>
+<body>
+<table><tbody><tr><td id="td_titulo_pagina">$titulo</td></tr></tbody></table>
+<iframe id="principal" name="principal" src="$src" width="100%" height="500"></iframe>
+</body></html>""")
+
+_POPUP_PRINCIPAL = Template("""<!DOCTYPE html>
+<html><head><title>principal</title></head>
+<body><iframe id="iconteudo" name="iconteudo" src="$src" width="100%" height="450"></iframe></body></html>""")
+
+_REPOM_CONTENT = Template("""<!DOCTYPE html>
+<html><head><title>Integrar Contrato</title></head>
+<body>
+<form><table><tbody><tr><td><fieldset><table><tbody>
+  <tr><td>Status</td><td>$status</td></tr>
+  <tr><td>Protocolo</td><td>$id</td></tr>
+  <tr><td>Contrato</td><td>$numero</td></tr>
+  <tr><td>&nbsp;</td><td></td></tr>
+  <tr><td>&nbsp;</td><td></td></tr>
+  <tr><td>&nbsp;</td><td></td></tr>
+  <tr><td>&nbsp;</td><td></td></tr>
+  <tr><td>Atualizar</td><td><button type="button" onclick="location.reload()">Atualizar</button></td></tr>
+</tbody></table></fieldset></td></tr></tbody></table></form>
+</body></html>""")
+
+_CTE_CONTENT = Template("""<!DOCTYPE html>
+<html><head><title>CT-e</title></head>
+<body>
+<form><table><tbody><tr><td><fieldset><table><tbody>
+  <tr><td>CT-e de complemento</td><td></td></tr>
+  <tr><td>Número</td><td>$numero</td></tr>
+</tbody></table></fieldset></td><td></td></tr></tbody></table></form>
+</body></html>""")
+
+_ALERTA = Template("""<!DOCTYPE html>
+<html><head><title>Alerta</title></head>
+<body><form><input type="hidden" name="MENSAGEM" value="$mensagem"></form></body></html>""")
+
+_SCREENS = {
+    "lot": ("Lotação", _LOT_BODY, _LOT_JS),
+    "repomfretea": ("REPOMFRETEA", _REPOMFRETEA_BODY, _REPOMFRETEA_JS),
+    "repomfreted": ("REPOMFRETED", _REPOMFRETED_BODY, _REPOMFRETED_JS),
+    "ltrepomfrete": ("LTREPOMFRETE", _LTREPOMFRETE_BODY, _LTREPOMFRETE_JS),
+    "ectecomp": ("ECTECOMP", _ECTECOMP_BODY, _ECTECOMP_JS),
+}
+
+_LOTATIONS = (
+    "LEVO LOG - MATRIZ SP",
+    "LEVO LOG - FILIAL MG",
+    "FRETO LOG - MATRIZ",
+    "FRETO LOG - MG",
+    "FRETO LOG - FILIAL RJ",
+)
+
+
+# -----------------------------
+# Estado do servidor
+# -----------------------------
+
+class StubState:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._sessions: dict[str, dict] = {}
+        self._contracts: dict[int, float] = {}
+        self._ids = itertools.count(1000)
+
+    def create_session(self, username: str) -> str:
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[token] = {"user": username, "created": time.monotonic(), "lotation": _LOTATIONS[0]}
+        return token
+
+    def session(self, token: Optional[str]) -> Optional[dict]:
+        if not token:
+            return None
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            ttl = self.config.session_ttl
+            if ttl and time.monotonic() - session["created"] > ttl:
+                del self._sessions[token]
+                return None
+            return session
+
+    def new_contract(self) -> int:
+        with self._lock:
+            contract_id = next(self._ids)
+            self._contracts[contract_id] = time.monotonic()
+        return contract_id
+
+    def contract_number(self, contract_id: int) -> str:
+        with self._lock:
+            created = self._contracts.get(contract_id)
+        if created is None or time.monotonic() - created < self.config.repom_delay:
+            return ""
+        return str(900000 + contract_id)
+
+
+# -----------------------------
+# Handler HTTP
+# -----------------------------
+
+class KMMStubHandler(BaseHTTPRequestHandler):
+    server_version = "KMMStub/1.0"
+    state: StubState
+
+    def log_message(self, format, *args):  # noqa: A002 - assinatura do BaseHTTPRequestHandler
+        pass
+
+    # --- helpers ---
+
+    def _token(self) -> Optional[str]:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        morsel = cookie.get("KMMSESSION")
+        return morsel.value if morsel else None
+
+    def _send(self, body: str, status: int = 200, content_type: str = "text/html; charset=utf-8", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _json(self, payload: dict):
+        time.sleep(self.state.config.api_latency)
+        self._send(json.dumps(payload), content_type="application/json; charset=utf-8")
+
+    def _screen(self, term: str):
+        key = term.strip().lower()
+        if key not in _SCREENS:
+            self._send(_BLANK)
+            return
+        title, body, script = _SCREENS[key]
+        if key == "lot":
+            session = self.state.session(self._token()) or {}
+            rows = "".join(
+                f"<tr class=\"linha{' destaque' if session.get('lotation') == lot else ''}\">"
+                f"<td>{lot}</td><td><button type=\"button\" onclick=\"f_lotar('{lot}')\">"
+                f"<img alt=\"Lotar\"></button></td></tr>"
+                for lot in _LOTATIONS
+            )
+            body = Template(body).substitute(rows=rows)
+        self._send(_SCREEN.substitute(title=title, common=_COMMON_JS, script=script, body=body))
+
+    # --- verbs ---
+
+    def do_POST(self):
+        time.sleep(self.state.config.latency)
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        username = (form.get("USUARIO") or [""])[0]
+        password = (form.get("SENHA") or [""])[0]
+        if not username or not password:
+            self._send(_LOGIN.substitute())
+            return
+        token = self.state.create_session(username)
+        self._send(
+            "",
+            status=302,
+            headers={"Location": "/admin.cfm", "Set-Cookie": f"KMMSESSION={token}; Path=/"},
+        )
+
+    def do_GET(self):
+        time.sleep(self.state.config.latency)
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        config = self.state.config
+
+        if path in ("/", "/admin.cfm"):
+            if self.state.session(self._token()):
+                self._send(_MAIN.substitute())
+            else:
+                self._send(_LOGIN.substitute())
+            return
+
+        if not self.state.session(self._token()):
+            # Sessão expirada: KMM redireciona para a tela de login
+            self._send("", status=302, headers={"Location": "/admin.cfm"})
+            return
+
+        if path == "/principal.cfm":
+            self._send(_PRINCIPAL.substitute(common=_COMMON_JS))
+        elif path == "/blank.cfm":
+            self._send(_BLANK)
+        elif path == "/tela.cfm":
+            self._screen(query.get("t", ""))
+        elif path == "/quitacao.cfm":
+            self._send(_QUITACAO.substitute(common=_COMMON_JS))
+        elif path == "/repom.cfm":
+            src = f"/repom_principal.cfm?id={query.get('id', '')}"
+            self._send(_POPUP.substitute(titulo="Integrar Contrato", src=src))
+        elif path == "/repom_principal.cfm":
+            self._send(_POPUP_PRINCIPAL.substitute(src=f"/repom_conteudo.cfm?id={query.get('id', '')}"))
+        elif path == "/repom_conteudo.cfm":
+            contract_id = int(query.get("id", "0") or 0)
+            number = self.state.contract_number(contract_id)
+            status = "Integrado" if number else "Aguardando retorno da REPOM"
+            self._send(_REPOM_CONTENT.substitute(status=status, id=contract_id, numero=number))
+        elif path == "/cte.cfm":
+            src = f"/cte_principal.cfm?numero={query.get('numero', '')}"
+            self._send(_POPUP.substitute(titulo="CT-e de Complemento", src=src))
+        elif path == "/cte_principal.cfm":
+            self._send(_POPUP_PRINCIPAL.substitute(src=f"/cte_conteudo.cfm?numero={query.get('numero', '')}"))
+        elif path == "/cte_conteudo.cfm":
+            self._send(_CTE_CONTENT.substitute(numero=query.get("numero", "")))
+        elif path == "/alerta.cfm":
+            self._send(_ALERTA.substitute(mensagem=quote(query.get("mensagem", ""))))
+        elif path == "/api/motorista":
+            self._json({"motorista": config.driver_name})
+        elif path == "/api/rota":
+            self._json({"placa": config.license_plate})
+        elif path == "/api/status_cte":
+            self._json({
+                "motorista": config.driver_name,
+                "mensagem": f"Este CT-e possui {config.emitted_complements} complemento(s) emitido(s)",
+            })
+        elif path == "/api/lotar":
+            session = self.state.session(self._token())
+            session["lotation"] = query.get("filial", "")
+            self._json({"ok": True})
+        elif path == "/api/contrato":
+            self._json({"id": self.state.new_contract()})
+        elif path == "/api/cte":
+            self._json({"numero": str(next(self.state._ids))})
+        elif path.startswith("/api/"):
+            self._json({"ok": True})
+        else:
+            self._send(_BLANK, status=404)
+
+
+# -----------------------------
+# Ciclo de vida
+# -----------------------------
+
+class KMMStubServer:
+    """
+    Sobe o servidor em uma thread daemon. Pode ser usado como context manager:
+
+        with KMMStubServer(StubConfig(latency=0.5)) as stub:
+            kmm.login(LoginParams(url=stub.url, ...))
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None):
+        self.config = config or StubConfig()
+        self.state = StubState(self.config)
+        handler = type("BoundKMMStubHandler", (KMMStubHandler,), {"state": self.state})
+        self._httpd = ThreadingHTTPServer((self.config.host, self.config.port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/admin.cfm"
+
+    def start(self) -> "KMMStubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="kmm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "KMMStubServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita as telas do KMM")
+    parser.add_argument("--host", default=StubConfig.host)
+    parser.add_argument("--port", type=int, default=StubConfig.port)
+    parser.add_argument("--latency", type=float, default=StubConfig.latency)
+    parser.add_argument("--api-latency", type=float, default=StubConfig.api_latency)
+    parser.add_argument("--repom-delay", type=float, default=StubConfig.repom_delay)
+    parser.add_argument("--session-ttl", type=float, default=StubConfig.session_ttl)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        api_latency=args.api_latency,
+        repom_delay=args.repom_delay,
+        session_ttl=args.session_ttl,
+    )
+    server = KMMStubServer(config)
+    print(f"Stub do KMM em {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
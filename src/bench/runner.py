@@ -0,0 +1,259 @@
+"""
+Benchmark de ponta a ponta dos fluxos do KMMActions contra o stub local do KMM.
+
+Para cada fluxo reporta:
+  - tempo total (wall time)
+  - tempo por etapa (métodos do KMMActions chamados durante o fluxo)
+  - quantidade de comandos WebDriver enviados ao IEDriverServer, por tipo
+
+Uso (a partir de src/, com o IEDriverServer disponível):
+    python -m bench.runner --flows login,repomfretea,payment --iterations 3 --latency 0.3
+    python -m bench.runner --json output/bench/resultado.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from statistics import mean
+from typing import Callable, Optional
+
+from bench.kmm_stub import KMMStubServer, StubConfig
+from kmm.ie_driver.ie_driver import IEDriverConfig
+from kmm.services.kmm_actions import KMMActions, LoginParams
+
+# Métodos do KMMActions medidos como etapas
+STEPS = (
+    "login",
+    "quick_access",
+    "_load_user_profile",
+    "_status_cte",
+    "_get_driver_name",
+    "_get_taxes",
+    "_click_on_negotiation_menu",
+    "_find_contract_number_window_handle",
+    "_get_contract_number",
+)
+
+
+@dataclass
+class FlowResult:
+    flow: str
+    iteration: int
+    wall_s: float
+    ok: bool
+    error: str = ""
+    steps: dict = field(default_factory=dict)
+    commands: dict = field(default_factory=dict)
+
+    @property
+    def total_commands(self) -> int:
+        return sum(self.commands.values())
+
+
+class _Recorder:
+    """Acumula tempos de etapas e contagem de comandos do fluxo em execução."""
+
+    def __init__(self):
+        self.steps: dict[str, float] = defaultdict(float)
+        self.commands: Counter = Counter()
+        self._depth: dict[str, int] = defaultdict(int)
+
+    def reset(self) -> None:
+        self.steps = defaultdict(float)
+        self.commands = Counter()
+
+    def wrap_step(self, name: str, fn: Callable) -> Callable:
+        def _timed(*args, **kwargs):
+            # Etapas recursivas/aninhadas com o mesmo nome contam só uma vez
+            self._depth[name] += 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._depth[name] -= 1
+                if not self._depth[name]:
+                    self.steps[name] += time.perf_counter() - start
+        return _timed
+
+    def wrap_executor(self, execute: Callable) -> Callable:
+        def _counted(command, params):
+            self.commands[command] += 1
+            return execute(command, params)
+        return _counted
+
+
+def _instrument(kmm: KMMActions, recorder: _Recorder) -> None:
+    for name in STEPS:
+        setattr(kmm, name, recorder.wrap_step(name, getattr(kmm, name)))
+
+    executor = kmm.driver.driver.command_executor
+    executor.execute = recorder.wrap_executor(executor.execute)
+
+
+def build_flows(kmm: KMMActions, params: LoginParams, stub: StubConfig, state: dict) -> dict[str, Callable[[], object]]:
+    def repomfretea():
+        state["contract_number"] = kmm.emitting_contract_repomfretea(
+            license_plate=stub.license_plate,
+            driver_name=stub.driver_name,
+            nature="1",
+            operation="10",
+            route="15",
+            card="6000000000000000",
+            sender="11222333000181",
+            recipient="11444777000161",
+            liberation_user="EMISSAO.AUTOMATICA",
+            control_number=21,
+            weight="1000",
+        )
+        return state["contract_number"]
+
+    def repomfreted():
+        return kmm.emitting_contract_repomfreted(
+            contract_value="100,00",
+            complement_cte="44404",
+            serie="1",
+            submotive="descarga",
+            transport="12341234",
+            liberation_user="FABIANA.HONORATO",
+        )
+
+    def cte():
+        return kmm.emitting_cte(
+            cte="145243",
+            serie="1",
+            cte_value=512.41,
+            management="freto",
+            driver_name=stub.driver_name,
+            taxes=True,
+        )
+
+    def payment():
+        return kmm.payment(
+            contract_number=state.get("contract_number") or "901000",
+            cod_pessoa_filial="1",
+        )
+
+    return {
+        "login": lambda: kmm.login(params, management="levo"),
+        "lotacao": lambda: kmm.belgo_load_user_profile(user="EMISSAO.AUTOMATICA", management="levo", lotation="mg"),
+        "repomfretea": repomfretea,
+        "repomfreted": repomfreted,
+        "cte": cte,
+        "payment": payment,
+    }
+
+
+def run(
+    flows: list[str],
+    iterations: int = 1,
+    stub_config: Optional[StubConfig] = None,
+    driver_config: Optional[IEDriverConfig] = None,
+) -> list[FlowResult]:
+    stub_config = stub_config or StubConfig()
+    driver_config = driver_config or IEDriverConfig(driver_path=os.getenv("WEBDRIVER_PATH"))
+    results: list[FlowResult] = []
+
+    with KMMStubServer(stub_config) as stub:
+        params = LoginParams(url=stub.url, username="BENCH", password="bench")
+        with KMMActions(service="Benchmark", config=driver_config) as kmm:
+            recorder = _Recorder()
+            _instrument(kmm, recorder)
+            available = build_flows(kmm, params, stub_config, state={})
+
+            for iteration in range(1, iterations + 1):
+                for name in flows:
+                    recorder.reset()
+                    start = time.perf_counter()
+                    ok, error = True, ""
+                    try:
+                        available[name]()
+                    except Exception as e:
+                        ok, error = False, f"{type(e).__name__}: {e}"
+                    wall = time.perf_counter() - start
+                    results.append(FlowResult(
+                        flow=name,
+                        iteration=iteration,
+                        wall_s=round(wall, 3),
+                        ok=ok,
+                        error=error,
+                        steps={k: round(v, 3) for k, v in recorder.steps.items()},
+                        commands=dict(recorder.commands),
+                    ))
+    return results
+
+
+def summarize(results: list[FlowResult]) -> dict:
+    by_flow: dict[str, list[FlowResult]] = defaultdict(list)
+    for result in results:
+        by_flow[result.flow].append(result)
+
+    summary = {}
+    for flow, runs in by_flow.items():
+        steps: dict[str, list[float]] = defaultdict(list)
+        for run_ in runs:
+            for step, seconds in run_.steps.items():
+                steps[step].append(seconds)
+        summary[flow] = {
+            "runs": len(runs),
+            "failures": sum(not r.ok for r in runs),
+            "wall_s_mean": round(mean(r.wall_s for r in runs), 3),
+            "wall_s_min": min(r.wall_s for r in runs),
+            "wall_s_max": max(r.wall_s for r in runs),
+            "commands_mean": round(mean(r.total_commands for r in runs), 1),
+            "steps_s_mean": {k: round(mean(v), 3) for k, v in steps.items()},
+        }
+    return summary
+
+
+def _print_report(results: list[FlowResult], summary: dict) -> None:
+    print(f"{'fluxo':<14}{'iter':>5}{'ok':>5}{'tempo(s)':>10}{'comandos':>10}")
+    for r in results:
+        print(f"{r.flow:<14}{r.iteration:>5}{'S' if r.ok else 'N':>5}{r.wall_s:>10.2f}{r.total_commands:>10}")
+        if r.error:
+            print(f"    erro: {r.error}")
+
+    for flow, data in summary.items():
+        print(f"\n[{flow}] média {data['wall_s_mean']}s | {data['commands_mean']} comandos | falhas {data['failures']}")
+        for step, seconds in sorted(data["steps_s_mean"].items(), key=lambda kv: -kv[1]):
+            print(f"    {step:<38}{seconds:>8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos fluxos do KMMActions contra o stub local")
+    parser.add_argument("--flows", default="login,repomfretea,payment,repomfreted,cte")
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--port", type=int, default=StubConfig.port)
+    parser.add_argument("--latency", type=float, default=StubConfig.latency)
+    parser.add_argument("--api-latency", type=float, default=StubConfig.api_latency)
+    parser.add_argument("--repom-delay", type=float, default=StubConfig.repom_delay)
+    parser.add_argument("--json", dest="json_path", default=None, help="Arquivo para salvar o resultado")
+    args = parser.parse_args()
+
+    flows = [f.strip() for f in args.flows.split(",") if f.strip()]
+    stub_config = StubConfig(
+        port=args.port,
+        latency=args.latency,
+        api_latency=args.api_latency,
+        repom_delay=args.repom_delay,
+    )
+
+    results = run(flows=flows, iterations=args.iterations, stub_config=stub_config)
+    summary = summarize(results)
+    _print_report(results, summary)
+
+    if args.json_path:
+        path = Path(args.json_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps({"results": [asdict(r) for r in results], "summary": summary}, indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -42,4 +42,34 @@ class KMMComplementCTEAlreadyEmitted(KMMProcess):
     pass
 
 class KMMPayementError(KMMProcess):
-    pass
\ No newline at end of file
+    pass
+
+class KMMContractPendingError(KMMProcess):
+    """Contrato já enviado à REPOM sem número registrado no diário: não reenviar."""
+    pass
+
+
+class KMMAlreadyProcessedError(KMMProcess):
+    """Operação (contrato / complemento) já concluída para a mesma chave de negócio."""
+    pass
+
+
+class KMMOperationInProgressError(KMMProcess):
+    """Operação reservada por outro worker ou enviada sem resultado registrado."""
+    pass
+
+
+class KMMCircuitOpenError(KMMProcess):
+    """KMM instável (circuit breaker aberto): falha rápida para o item ser adiado."""
+
+    def __init__(self, message: str = "", retry_after_s: float = 0.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class KMMPreflightError(KMMProcess):
+    """Item reprovado na validação local, antes de qualquer trabalho no navegador."""
+
+    def __init__(self, message: str = "", reasons=()):
+        super().__init__(message)
+        self.reasons = list(reasons)
@@ -0,0 +1,302 @@
+"""
+Métricas de latência e contadores dos robôs, exportadas ao fim de cada
+execução.
+
+    - kmm_step_seconds{service,step}: histograma por etapa de negócio
+      (login, quick_access, emitting_contract_repomfretea, payment...) e por
+      espera ("wait:repom_retorno", "wait:quick_access"...)
+    - kmm_webdriver_command_seconds{command}: histograma por tipo de comando
+      enviado ao IEDriverServer (findElement, executeScript, clickElement...)
+    - kmm_step_total{service,step,outcome}: ok / retry / failed
+    - kmm_webdriver_commands_total{service,step,command}: comandos enviados
+      durante cada etapa, inclusive os das etapas aninhadas (o
+      quick_access dentro do emitting_contract_repomfretea conta nos dois)
+    - kmm_service_total{service,outcome}: o mesmo só das etapas de topo
+      (ex.: JMN.process = um item da fila), com todas as retentativas
+
+Uso:
+    with METRICS.step("J Mendes", "payment"):
+        ...
+
+    METRICS.export("output/metrics", "kmm_1234")
+      -> kmm_1234.prom (formato texto do Prometheus, p/ node_exporter textfile)
+      -> kmm_1234.json (p50/p95/p99 por etapa e por comando)
+"""
+from __future__ import annotations
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from kmm.helper.polling import percentile
+
+# Limites (segundos) dos buckets: comandos do IE ficam na casa de ms, a
+# REPOM na casa de minutos
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+OUTCOMES = ("ok", "retry", "failed")
+
+# (serviço, etapa) corrente, para quem não conhece o serviço (ex.: retries no driver)
+_current: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("kmm_metrics_step", default=("", ""))
+# Etapas abertas, da mais externa para a mais interna
+_path: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("kmm_metrics_path", default=())
+# Tempo acumulado por etapa do item corrente (ver collect_timings)
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("kmm_metrics_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, reservoir: int = 2048):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        # Amostras recentes para os percentis do resumo JSON
+        self.samples: Deque[float] = deque(maxlen=reservoir)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[int]:
+        out, total = [], 0
+        for c in self.counts:
+            total += c
+            out.append(total)
+        return out
+
+    def summary(self) -> dict:
+        values = list(self.samples)
+        return {
+            "count": self.count,
+            "sum_s": round(self.sum, 3),
+            "p50_s": round(percentile(values, 50), 3),
+            "p95_s": round(percentile(values, 95), 3),
+            "p99_s": round(percentile(values, 99), 3),
+            "max_s": round(max(values), 3) if values else 0.0,
+        }
+
+
+def _labels(**labels: str) -> str:
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _bound(value: float) -> str:
+    return f"{value:g}"
+
+
+class Metrics:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._steps: Dict[Tuple[str, str], Histogram] = {}
+        self._commands: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._totals: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._command_counts: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.started_at = time.time()
+
+    # --- registro ---
+
+    def observe_step(self, service: str, step: str, seconds: float) -> None:
+        with self._lock:
+            hist = self._steps.get((service, step))
+            if hist is None:
+                hist = self._steps[(service, step)] = Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def observe_command(self, command: str, seconds: float) -> None:
+        service = _current.get()[0]
+        steps = set(_path.get())
+        with self._lock:
+            hist = self._commands.get(command)
+            if hist is None:
+                hist = self._commands[command] = Histogram(self.buckets)
+            hist.observe(seconds)
+            for step in steps:
+                self._command_counts[(service, step, command)] += 1
+
+    def command_counts(self, service: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """{etapa: {comando: n}} dos comandos enviados dentro de cada etapa."""
+        out: Dict[str, Dict[str, int]] = defaultdict(dict)
+        with self._lock:
+            for (svc, step, command), value in self._command_counts.items():
+                if service is None or svc == service:
+                    out[step][command] = out[step].get(command, 0) + value
+        return dict(out)
+
+    def incr(self, service: str, step: str, outcome: str, top_level: bool = False) -> None:
+        with self._lock:
+            self._counters[(service, step, outcome)] += 1
+            if top_level or outcome == "retry":
+                self._totals[(service, outcome)] += 1
+
+    @staticmethod
+    def current() -> Tuple[str, str]:
+        return _current.get()
+
+    def retry(self) -> None:
+        """Conta uma nova tentativa na etapa corrente."""
+        service, step = _current.get()
+        self.incr(service, step, "retry")
+
+    @contextmanager
+    def step(self, service: str, name: str) -> Iterator[None]:
+        top_level = not _current.get()[1]
+        token = _current.set((service, name))
+        path_token = _path.set(_path.get() + (name,))
+        start = time.perf_counter()
+        outcome = "failed"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            _path.reset(path_token)
+            self.observe_step(service, name, elapsed)
+            self.incr(service, name, outcome, top_level=top_level)
+            timings = _timings.get()
+            if timings is not None:
+                timings[name] = timings.get(name, 0.0) + elapsed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._steps.clear()
+            self._commands.clear()
+            self._counters.clear()
+            self._totals.clear()
+            self._command_counts.clear()
+            self.started_at = time.time()
+
+    # --- exportação ---
+
+    def summary(self) -> dict:
+        with self._lock:
+            steps: Dict[str, Dict[str, dict]] = defaultdict(dict)
+            for (service, step), hist in sorted(self._steps.items()):
+                data = hist.summary()
+                for outcome in OUTCOMES:
+                    data[outcome] = self._counters.get((service, step, outcome), 0)
+                steps[service or "-"][step] = data
+
+            commands_by_step: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(lambda: defaultdict(dict))
+            for (service, step, command), value in sorted(self._command_counts.items()):
+                commands_by_step[service or "-"][step][command] = value
+
+            services: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(OUTCOMES, 0))
+            for (service, outcome), value in self._totals.items():
+                services[service or "-"][outcome] += value
+
+            return {
+                "started_at": self.started_at,
+                "exported_at": time.time(),
+                "services": dict(services),
+                "steps": dict(steps),
+                "commands": {cmd: hist.summary() for cmd, hist in sorted(self._commands.items())},
+                "commands_by_step": {svc: dict(steps_) for svc, steps_ in commands_by_step.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def _histogram(name: str, help_text: str, items: List[Tuple[dict, Histogram]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in items:
+                for bound, total in zip(hist.buckets, hist.cumulative()):
+                    lines.append(f"{name}_bucket{_labels(**labels, le=_bound(bound))} {total}")
+                lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+                lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+        with self._lock:
+            _histogram(
+                "kmm_step_seconds",
+                "Duracao das etapas do robo.",
+                [({"service": s, "step": st}, h) for (s, st), h in sorted(self._steps.items())],
+            )
+            _histogram(
+                "kmm_webdriver_command_seconds",
+                "Duracao dos comandos enviados ao IEDriverServer.",
+                [({"command": c}, h) for c, h in sorted(self._commands.items())],
+            )
+            lines.append("# HELP kmm_step_total Etapas por resultado (ok, retry, failed).")
+            lines.append("# TYPE kmm_step_total counter")
+            for (service, step, outcome), value in sorted(self._counters.items()):
+                lines.append(f"kmm_step_total{_labels(service=service, step=step, outcome=outcome)} {value}")
+            lines.append("# HELP kmm_webdriver_commands_total Comandos do WebDriver por etapa (inclui etapas aninhadas).")
+            lines.append("# TYPE kmm_webdriver_commands_total counter")
+            for (service, step, command), value in sorted(self._command_counts.items()):
+                lines.append(
+                    f"kmm_webdriver_commands_total{_labels(service=service, step=step, command=command)} {value}"
+                )
+            lines.append("# HELP kmm_service_total Etapas de topo por resultado e retentativas, por servico.")
+            lines.append("# TYPE kmm_service_total counter")
+            for (service, outcome), value in sorted(self._totals.items()):
+                lines.append(f"kmm_service_total{_labels(service=service, outcome=outcome)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str, name: Optional[str] = None) -> Dict[str, str]:
+        """Grava <name>.prom e <name>.json em `directory` (troca atômica)."""
+        name = name or f"kmm_{os.getpid()}"
+        target = Path(directory)
+        target.mkdir(parents=True, exist_ok=True)
+        paths = {}
+        for suffix, content in (
+            ("prom", self.to_prometheus()),
+            ("json", json.dumps(self.summary(), indent=2, ensure_ascii=False)),
+        ):
+            path = target / f"{name}.{suffix}"
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_text(content, encoding="utf-8")
+            tmp.replace(path)
+            paths[suffix] = str(path)
+        return paths
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """{etapa: segundos} das etapas que rodarem dentro do bloco (ex.: um item da fila)."""
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def timed(step: Optional[str] = None) -> Callable:
+    """Decorator para métodos de objetos com atributo `service` (ex.: KMMActions)."""
+
+    def decorator(fn: Callable) -> Callable:
+        name = step or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with METRICS.step(getattr(self, "service", ""), name):
+                return fn(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,195 @@
+"""
+Polling adaptativo com backoff, jitter, prazo total e estatística de
+tempo-até-pronto.
+
+Uso:
+    schedule = PollSchedule(initial_interval_s=2, factor=1.5, max_interval_s=15, deadline_s=180)
+    number = poll(read_number, schedule, name="repom_retorno", on_retry=click_refresh)
+
+Cada poll registra (nome, segundos, tentativas, ok) em POLL_STATS. As amostras
+podem ser gravadas em JSONL e resumidas depois para calibrar os schedules:
+
+    python -m kmm.helper.polling output/poll_stats.jsonl
+"""
+from __future__ import annotations
+
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class PollSchedule:
+    # Espera antes da primeira checagem (0 = checa na hora)
+    first_delay_s: float = 0.0
+    # Intervalo após a primeira checagem sem sucesso
+    initial_interval_s: float = 1.0
+    # Multiplicador do intervalo a cada tentativa (1 = intervalo fixo)
+    factor: float = 1.5
+    max_interval_s: float = 10.0
+    # Fração de variação aleatória do intervalo (0.2 = ±20%)
+    jitter: float = 0.1
+    # Prazo total; None = quem chama define (ex.: orçamento da etapa)
+    deadline_s: Optional[float] = None
+
+    def with_deadline(self, deadline_s: float) -> "PollSchedule":
+        return replace(self, deadline_s=deadline_s)
+
+    def intervals(self, rng: Optional[random.Random] = None) -> Iterator[float]:
+        rng = rng or random.Random()
+        interval = self.initial_interval_s
+        while True:
+            spread = interval * self.jitter
+            yield max(0.0, interval + rng.uniform(-spread, spread))
+            interval = min(self.max_interval_s, interval * self.factor)
+
+
+# -----------------------------
+# Estatísticas
+# -----------------------------
+
+@dataclass(frozen=True)
+class PollSample:
+    name: str
+    elapsed_s: float
+    attempts: int
+    ok: bool
+    ts: float
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summarize(samples: List[PollSample]) -> Dict[str, dict]:
+    by_name: Dict[str, List[PollSample]] = defaultdict(list)
+    for sample in samples:
+        by_name[sample.name].append(sample)
+
+    summary = {}
+    for name, items in by_name.items():
+        ready = [s.elapsed_s for s in items if s.ok]
+        summary[name] = {
+            "count": len(items),
+            "timeouts": sum(not s.ok for s in items),
+            "p50_s": round(percentile(ready, 50), 3),
+            "p90_s": round(percentile(ready, 90), 3),
+            "p99_s": round(percentile(ready, 99), 3),
+            "max_s": round(max(ready), 3) if ready else 0.0,
+            "mean_attempts": round(sum(s.attempts for s in items) / len(items), 2),
+        }
+    return summary
+
+
+class PollStats:
+    """Amostras de tempo-até-pronto em memória, com gravação opcional em JSONL."""
+
+    def __init__(self, maxlen: int = 5000):
+        self._lock = threading.Lock()
+        self._samples: Deque[PollSample] = deque(maxlen=maxlen)
+        # Sem flush (poll_stats_path=None) as pendentes não crescem sem limite:
+        # ficam só as últimas `maxlen`, como em _samples
+        self._unflushed: Deque[PollSample] = deque(maxlen=maxlen)
+
+    def record(self, name: str, elapsed_s: float, attempts: int, ok: bool) -> None:
+        sample = PollSample(name, round(elapsed_s, 3), attempts, ok, time.time())
+        with self._lock:
+            self._samples.append(sample)
+            self._unflushed.append(sample)
+
+    def samples(self, name: Optional[str] = None) -> List[PollSample]:
+        with self._lock:
+            return [s for s in self._samples if name is None or s.name == name]
+
+    def summary(self) -> Dict[str, dict]:
+        return summarize(self.samples())
+
+    def flush(self, path: str) -> None:
+        """Acrescenta as amostras ainda não gravadas em `path` (JSONL)."""
+        with self._lock:
+            pending = list(self._unflushed)
+            self._unflushed.clear()
+        if not pending:
+            return
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("a", encoding="utf-8") as fh:
+            for s in pending:
+                fh.write(json.dumps(s.__dict__) + "\n")
+
+
+POLL_STATS = PollStats()
+
+
+def load_samples(path: str) -> List[PollSample]:
+    samples = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                samples.append(PollSample(**json.loads(line)))
+    return samples
+
+
+# -----------------------------
+# Poll
+# -----------------------------
+
+def poll(
+    check: Callable[[], T],
+    schedule: PollSchedule,
+    name: str,
+    on_retry: Optional[Callable[[], None]] = None,
+    stats: Optional[PollStats] = POLL_STATS,
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> Optional[T]:
+    """
+    Chama `check` até retornar algo "truthy" ou estourar o prazo. Entre as
+    tentativas dorme conforme o schedule e chama `on_retry` (ex.: clicar em
+    atualizar). Retorna o resultado do check ou None no timeout.
+    """
+    deadline = schedule.deadline_s if schedule.deadline_s is not None else float("inf")
+    start = clock()
+    attempts = 0
+    intervals = schedule.intervals()
+
+    if schedule.first_delay_s:
+        sleep(min(schedule.first_delay_s, deadline))
+
+    while True:
+        attempts += 1
+        result = check()
+        if result:
+            if stats is not None:
+                stats.record(name, clock() - start, attempts, True)
+            return result
+
+        remaining = deadline - (clock() - start)
+        if remaining <= 0:
+            if stats is not None:
+                stats.record(name, clock() - start, attempts, False)
+            return None
+
+        sleep(min(next(intervals), remaining))
+        if on_retry is not None:
+            on_retry()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python -m kmm.helper.polling <arquivo.jsonl>")
+        sys.exit(1)
+    print(json.dumps(summarize(load_samples(sys.argv[1])), indent=2, ensure_ascii=False))
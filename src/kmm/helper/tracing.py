@@ -0,0 +1,107 @@
+"""
+Spans de rastreamento do KMMIEDriver sobre o logger do projeto (loguru).
+
+Cada span vira UMA linha de log ao terminar, com operação, locator,
+tentativa, duração e status nos extras:
+
+    with tracing.span("safe_click", locator=locator) as sp:
+        for attempt in ...:
+            sp.attempt = attempt + 1
+            ...
+
+O nível dos spans vem de KMM_TRACE_LEVEL (padrão DEBUG). Se ele estiver
+abaixo do LOG_LEVEL, span() devolve um span nulo compartilhado: não cria
+objeto, não lê relógio e não formata nada. A mensagem só é formatada pelo
+loguru quando algum sink aceita o registro.
+"""
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, Optional
+
+from shared.logger import LOG_LEVEL, logger
+
+TRACE_LEVEL = os.getenv("KMM_TRACE_LEVEL", "DEBUG")
+
+_enabled = False
+
+
+def set_level(trace_level: str = TRACE_LEVEL, log_level: str = LOG_LEVEL) -> None:
+    """Recalcula se os spans estão ligados (ex.: após mudar os sinks)."""
+    global TRACE_LEVEL, _enabled
+    TRACE_LEVEL = trace_level
+    _enabled = logger.level(trace_level).no >= logger.level(log_level).no
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    attempt = 0
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        pass
+
+    def set(self, **fields: Any) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("operation", "locator", "attempt", "fields", "_start")
+
+    def __init__(self, operation: str, locator: Any = None, **fields: Any):
+        self.operation = operation
+        self.locator = locator
+        self.attempt = 1
+        self.fields = fields
+        self._start = 0.0
+
+    def set(self, **fields: Any) -> None:
+        self.fields.update(fields)
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        status = "ok" if exc_type is None else exc_type.__name__
+        logger.opt(depth=1).log(
+            TRACE_LEVEL,
+            "{operation} {status} em {duration_ms:.0f}ms",
+            operation=self.operation,
+            locator=self.locator,
+            attempt=self.attempt,
+            duration_ms=round(duration_ms, 1),
+            status=status,
+            **self.fields,
+        )
+        return False
+
+
+def span(operation: str, locator: Any = None, **fields: Any):
+    if not _enabled:
+        return NULL_SPAN
+    return Span(operation, locator, **fields)
+
+
+def event(operation: str, message: str, **fields: Any) -> None:
+    """Linha avulsa dentro de uma operação (mesmo nível/gate dos spans)."""
+    if _enabled:
+        logger.opt(depth=1).log(TRACE_LEVEL, message, operation=operation, **fields)
+
+
+set_level()
@@ -0,0 +1,201 @@
+"""
+Gravação de evidências (screenshot, HTML, metadados) fora do caminho crítico.
+
+O dump_state só captura os bytes na sessão (screenshot, page_source, url) e
+entrega para o EvidenceWriter, que grava numa thread em segundo plano:
+  - HTML comprimido (gzip) e deduplicado por hash do conteúdo
+    (html/<sha1>.html.gz, compartilhado entre evidências iguais)
+  - PNG como veio (já é comprimido)
+  - .txt de metadados apontando para o HTML
+  - poda por idade e por tamanho total do diretório
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class EvidenceCapture:
+    label: str
+    base_name: str
+    url: str
+    png: Optional[bytes]
+    html: Optional[str]
+    ts: float
+
+
+class EvidenceWriter:
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: Optional[int] = None,
+        max_age_s: Optional[float] = None,
+        compress: bool = True,
+        queue_size: int = 32,
+        prune_every: int = 20,
+    ):
+        self.directory = Path(directory)
+        self.html_dir = self.directory / "html"
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.compress = compress
+        self.prune_every = prune_every
+        self._queue: "queue.Queue[Optional[EvidenceCapture]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._written = 0
+        self.dropped = 0
+
+        self.html_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- caminhos ---
+
+    def paths_for(self, capture: EvidenceCapture) -> Dict[str, str]:
+        base = self.directory / capture.base_name
+        return {"png": str(base) + ".png", "meta": str(base) + ".txt", "url": capture.url}
+
+    def _html_path(self, html: str) -> Path:
+        digest = hashlib.sha1(html.encode("utf-8", errors="ignore")).hexdigest()
+        suffix = ".html.gz" if self.compress else ".html"
+        return self.html_dir / f"{digest}{suffix}"
+
+    # --- API ---
+
+    def submit(self, capture: EvidenceCapture) -> Dict[str, str]:
+        """Enfileira a gravação sem bloquear; com a fila cheia a evidência é descartada."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(capture)
+        except queue.Full:
+            self.dropped += 1
+        return self.paths_for(capture)
+
+    def write(self, capture: EvidenceCapture) -> Dict[str, str]:
+        """Gravação síncrona (modo evidence_async=False)."""
+        paths = self._write(capture)
+        self._after_write()
+        return paths
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera a fila esvaziar até `timeout`. Retorna False se sobrou trabalho."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def close(self, timeout: float = 5.0) -> None:
+        self.flush(timeout)
+        if self._thread and self._thread.is_alive():
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=0.5)
+        self._thread = None
+
+    # --- thread ---
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="kmm-evidence", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            capture = self._queue.get()
+            try:
+                if capture is None:
+                    return
+                self._write(capture)
+                self._after_write()
+            except Exception:
+                pass
+            finally:
+                self._queue.task_done()
+
+    def _after_write(self) -> None:
+        self._written += 1
+        if self._written % self.prune_every == 1:
+            self.prune()
+
+    # --- gravação ---
+
+    def _write(self, capture: EvidenceCapture) -> Dict[str, str]:
+        paths = self.paths_for(capture)
+
+        if capture.png:
+            try:
+                Path(paths["png"]).write_bytes(capture.png)
+            except Exception:
+                pass
+
+        html_ref = ""
+        if capture.html is not None:
+            html_path = self._html_path(capture.html)
+            html_ref = str(html_path)
+            try:
+                if html_path.exists():
+                    # HTML repetido: só renova a data para não ser podado
+                    os.utime(html_path)
+                else:
+                    data = capture.html.encode("utf-8", errors="ignore")
+                    tmp = html_path.with_suffix(html_path.suffix + ".tmp")
+                    if self.compress:
+                        tmp.write_bytes(gzip.compress(data, compresslevel=6))
+                    else:
+                        tmp.write_bytes(data)
+                    tmp.replace(html_path)
+            except Exception:
+                pass
+
+        try:
+            Path(paths["meta"]).write_text(
+                f"url={capture.url}\nlabel={capture.label}\nts={capture.ts}\nhtml={html_ref}\n",
+                encoding="utf-8",
+                errors="ignore",
+            )
+        except Exception:
+            pass
+
+        paths["html"] = html_ref
+        return paths
+
+    # --- poda ---
+
+    def prune(self) -> None:
+        if not self.max_bytes and not self.max_age_s:
+            return
+
+        files = []
+        for path in self.directory.rglob("*"):
+            if not path.is_file() or path.suffix == ".tmp":
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            too_old = self.max_age_s is not None and now - mtime > self.max_age_s
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not too_old and not too_big:
+                # Ordenado por data: se este não é velho e já cabe, os próximos também
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,105 @@
+"""
+Preenchimento de formulários do KMM em um único execute_script.
+
+Cada safe_type custa vários round trips no IEDriverServer (wait, clear,
+click, send_keys). Aqui os valores são escritos direto no DOM e os eventos
+que os scripts do KMM escutam (keyup, change, blur) são disparados na mão.
+O script devolve o valor lido de volta de cada campo para conferência.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Mapping, Optional, Tuple
+
+from kmm.helper.str_handler import str_to_float
+
+# Campos que o KMM reformata no keyup/blur (máscara de CNPJ, número, peso):
+# o valor lido de volta não é o escrito, então só o conteúdo é comparado e
+# a divergência vai para o log em vez de falhar o preenchimento
+MASKED_FIELDS = frozenset({
+    "REM_CNPJ", "DEST_CNPJ", "CARTAO_NUMERO", "PESO", "VOLUME", "VALOR_UNITARIO", "PESO_ENTREGA",
+})
+
+# arguments[0]: lista de [chave, valor]. chave = "ID", "id:ID" ou "name:NOME".
+# Retorna {chave: {found, tag, value}}.
+FILL_FORM_JS = """
+var fields = arguments[0], out = {};
+function kmmFind(key) {
+    var idx = key.indexOf(':');
+    if (idx > 0) {
+        var kind = key.substring(0, idx), val = key.substring(idx + 1);
+        if (kind === 'name') { return document.getElementsByName(val)[0] || null; }
+        if (kind === 'id') { return document.getElementById(val); }
+    }
+    return document.getElementById(key);
+}
+function kmmFire(el, type) {
+    var ev = document.createEvent('HTMLEvents');
+    ev.initEvent(type, true, true);
+    el.dispatchEvent(ev);
+}
+for (var i = 0; i < fields.length; i++) {
+    var key = fields[i][0], value = fields[i][1];
+    var el = kmmFind(key);
+    if (!el) { out[key] = {found: false, tag: '', value: null}; continue; }
+    var tag = (el.tagName || '').toLowerCase();
+    el.value = value;
+    if (tag !== 'select') { kmmFire(el, 'keyup'); }
+    kmmFire(el, 'change');
+    kmmFire(el, 'blur');
+    out[key] = {found: true, tag: tag, value: el.value};
+}
+return out;
+"""
+
+
+def normalize_field(key: str) -> str:
+    """'id:FOO' e 'FOO' são o mesmo campo; 'name:FOO' continua por nome."""
+    if ":" in key:
+        kind, value = key.split(":", 1)
+        kind = kind.strip().lower()
+        if kind == "id":
+            return value.strip()
+        if kind == "name":
+            return f"name:{value.strip()}"
+        raise ValueError(f"fill_form só aceita campos por id ou name: {key!r}")
+    return key.strip()
+
+
+def to_locator(key: str) -> str:
+    return key if key.startswith("name:") else f"id:{key}"
+
+
+def batches(fields: Mapping[str, str], keystroke_fields: set) -> List[Tuple[bool, List[Tuple[str, str]]]]:
+    """
+    Agrupa os campos em lotes consecutivos mantendo a ordem do dicionário.
+    Retorna [(digitar?, [(campo, valor), ...]), ...]: os lotes de script vão
+    em um execute_script só; os campos com digitação real vão um a um.
+    """
+    groups: List[Tuple[bool, List[Tuple[str, str]]]] = []
+    for raw_key, value in fields.items():
+        key = normalize_field(raw_key)
+        typed = key in keystroke_fields
+        if groups and groups[-1][0] == typed and not typed:
+            groups[-1][1].append((key, "" if value is None else str(value)))
+        else:
+            groups.append((typed, [(key, "" if value is None else str(value))]))
+    return groups
+
+
+def normalize_value(value: Optional[str]) -> str:
+    """Valor comparável: o IE devolve as quebras de linha do textarea como \\r\\n."""
+    return str(value or "").replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def masked_equal(written: str, current: Optional[str]) -> bool:
+    """Mesmo conteúdo apesar da máscara: mesmos dígitos ou mesmo número (1 == 1.00)."""
+    if normalize_value(written) == normalize_value(current):
+        return True
+    digits_written, digits_current = re.sub(r"\D", "", written or ""), re.sub(r"\D", "", current or "")
+    if digits_written and digits_written == digits_current:
+        return True
+    try:
+        return str_to_float(written) == str_to_float(current or "")
+    except ValueError:
+        return False
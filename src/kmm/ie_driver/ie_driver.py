@@ -2,10 +2,11 @@ from __future__ import annotations
 
 import time
 import uuid
-import subprocess
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Tuple, Union, Callable, Any
+from typing import Optional, Tuple, Union, Callable, Any, Dict, Iterable, Iterator, List, Mapping
+from urllib.parse import urlsplit
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -17,22 +18,75 @@ from selenium.webdriver.support import expected_conditions as EC
 
 from selenium.common.exceptions import (
     TimeoutException,
+    NoAlertPresentException,
     NoSuchElementException,
+    NoSuchFrameException,
+    NoSuchWindowException,
     StaleElementReferenceException,
     WebDriverException,
     ElementClickInterceptedException,
     ElementNotInteractableException,
+    UnexpectedAlertPresentException,
 )
 
 # Selenium 3.141.0: DesiredCapabilities é o caminho mais estável para IE
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from dotenv import load_dotenv
 
+from kmm.helper import metrics, polling, tracing
+from kmm.helper.polling import PollSchedule
+from kmm.ie_driver import forms, processes, retry, tables, waits, windows
+from kmm.ie_driver.evidence import EvidenceCapture, EvidenceWriter
+from kmm.ie_driver.retry import RetryPolicy
+from kmm.ie_driver.waits import Outcome, WaitTiming
+from shared.logger import logger
+
 load_dotenv(dotenv_path=r"src\.env")
 # -----------------------------
 # Configs / Tipos
 # -----------------------------
 
+# Orçamento (segundos) de cada etapa de espera. Para as esperas que
+# substituíram sleeps fixos, o orçamento é o antigo sleep: no pior caso o
+# fluxo leva o mesmo tempo de antes, no caso comum sai assim que a página
+# fica pronta.
+DEFAULT_STEP_BUDGETS: Dict[str, float] = {
+    "login": 30,
+    "quick_access": 30,
+    "lotacao": 3,
+    "impostos": 20,
+    "motorista": 10,
+    # Confirmação do motorista já conhecido (cache placa -> motorista)
+    "motorista_cache": 3,
+    "calculos": 7,
+    "valor_unitario": 15,
+    "rota": 5,
+    "liberacao": 3,
+    "placa": 30,
+    "repom_retorno": 180,
+    "repom_atualizar": 30,
+    # Resultado do btn_confirmar (alerta / janela "Alerta" / janela REPOM)
+    "cte_confirmar": 20,
+    "contrato_confirmar": 30,
+    "repomfreted_confirmar": 180,
+    "quitacao_confirmar": 10,
+}
+
+# Schedules de polling por etapa; etapas fora daqui usam intervalo fixo de
+# poll_frequency. O prazo vem do orçamento da etapa quando deadline_s é None.
+DEFAULT_POLL_SCHEDULES: Dict[str, PollSchedule] = {
+    "motorista": PollSchedule(initial_interval_s=0.2, factor=1.5, max_interval_s=1.0),
+    "placa": PollSchedule(initial_interval_s=0.3, factor=1.5, max_interval_s=2.0),
+    # REPOM: checagem imediata, depois 3s crescendo até 15s, com jitter
+    "repom_retorno": PollSchedule(initial_interval_s=3.0, factor=1.5, max_interval_s=15.0, jitter=0.2),
+    # wait_any: cada rodada checa todos os resultados; começa rápido e alivia
+    "cte_confirmar": PollSchedule(initial_interval_s=0.3, factor=1.5, max_interval_s=1.5),
+    "contrato_confirmar": PollSchedule(initial_interval_s=0.3, factor=1.5, max_interval_s=1.5),
+    "repomfreted_confirmar": PollSchedule(initial_interval_s=0.5, factor=1.5, max_interval_s=5.0),
+    "quitacao_confirmar": PollSchedule(initial_interval_s=0.3, factor=1.5, max_interval_s=1.0),
+}
+
+
 @dataclass(frozen=True)
 class IEDriverConfig:
     # Caminho opcional do IEDriverServer.exe; se None, usa o PATH
@@ -45,6 +99,12 @@ class IEDriverConfig:
 
     # Evidências
     evidence_dir: str = "output/evidence"
+    # Grava em thread separada (o bot não espera o disco)
+    evidence_async: bool = True
+    evidence_compress: bool = True
+    # Orçamento do diretório: tamanho total e idade máxima (None = sem limite)
+    evidence_max_bytes: Optional[int] = 500 * 1024 * 1024
+    evidence_max_age_s: Optional[float] = 14 * 24 * 3600
 
     # Políticas IE (ajuste conforme seu ambiente)
     ignore_zoom_level: bool = True
@@ -56,12 +116,45 @@ class IEDriverConfig:
     # Page load strategy: "normal" costuma ser mais previsível no IE
     page_load_strategy: str = "normal"
 
+    # Confere (1 script) que o frame rastreado ainda é o corrente antes de
+    # pular a troca de frame
+    verify_frame_context: bool = True
+
     # Mata processos no stop() se necessário
     kill_processes_on_stop: bool = True
 
+    # Esperas por condição
+    poll_frequency: float = 0.2
+    step_budgets: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_STEP_BUDGETS))
+    poll_schedules: Dict[str, PollSchedule] = field(default_factory=lambda: dict(DEFAULT_POLL_SCHEDULES))
+    # Amostras de tempo-até-pronto (JSONL, gravadas no stop); None desliga
+    poll_stats_path: Optional[str] = "output/poll_stats.jsonl"
+    # ids dos overlays de "carregando" do KMM (procurados em todos os frames)
+    loading_overlay_ids: Tuple[str, ...] = ("div_aguarde", "div_carregando", "div_loading")
+    # Quanto tempo sem requisições pendentes para considerar a página quieta
+    requests_quiet_s: float = 0.3
+
+    # Métricas (kmm.helper.metrics): histograma por tipo de comando do
+    # WebDriver e exportação .prom/.json no stop(); None não exporta
+    command_metrics: bool = True
+    metrics_dir: Optional[str] = "output/metrics"
+
+    # Retry (kmm.ie_driver.retry): classificação retry/fatal; None = padrão
+    retry_policy: Optional[RetryPolicy] = None
+    # Circuit breaker por host do KMM, compartilhado pelas sessões do processo
+    breaker_failure_threshold: int = 5
+    breaker_reset_s: float = 60.0
+
 
 Locator = Union[str, Tuple[str, str]]  # "id:foo" ou ("id", "foo")
 
+# Caminhos de frame do KMM, a partir do default content
+PRINCIPAL_PATH: Tuple[str, ...] = ("id:principal",)
+ICONTEUDO_PATH: Tuple[str, ...] = ("id:principal", "name:iconteudo")
+
+# Identifica o frame corrente (id/name do frameElement) em um round trip
+CURRENT_FRAME_JS = "var f = window.frameElement; return f ? [f.id || '', f.name || ''] : null;"
+
 
 class KMMIEDriver:
     """
@@ -78,8 +171,31 @@ class KMMIEDriver:
         self.config = config or IEDriverConfig()
         self._driver: Optional[WebDriver] = None
 
+        # Contexto rastreado: janela e caminho de frames (None = desconhecido)
+        self._current_handle: Optional[str] = None
+        self._frame_path: Optional[Tuple[str, ...]] = None
+        # Janelas conhecidas (título, papel, ordem de criação)
+        self.windows = windows.WindowRegistry()
+
+        self.retry_policy = self.config.retry_policy or retry.DEFAULT_POLICY
+        # Definido no primeiro open(url): breaker do host do KMM
+        self.breaker: Optional[retry.CircuitBreaker] = None
+
+        # Processos desta sessão (IEDriverServer + iexplore filhos)
+        self.service_pid: Optional[int] = None
+        self.session_pids: list = []
+
+        # Histórico das esperas (quanto cada uma realmente levou)
+        self.wait_timings: deque = deque(maxlen=500)
+
         # Garante pasta de evidências
         Path(self.config.evidence_dir).mkdir(parents=True, exist_ok=True)
+        self.evidence = EvidenceWriter(
+            directory=self.config.evidence_dir,
+            max_bytes=self.config.evidence_max_bytes,
+            max_age_s=self.config.evidence_max_age_s,
+            compress=self.config.evidence_compress,
+        )
 
     # -----------------------------
     # Ciclo de vida
@@ -142,60 +258,136 @@ class KMMIEDriver:
         # IMPORTANTÍSSIMO: não usar implicit wait
         self._driver.implicitly_wait(0)
 
-        self.home_page_id = self._driver.current_window_handle
-        return self._driver
+        self._track_session_processes()
+        return self.attach(self._driver)
+
+    def attach(self, driver: WebDriver) -> WebDriver:
+        """
+        Adota um WebDriver já criado (o start() usa isto; o bench usa com o
+        driver falso de bench/fake_driver.py): janela inicial, contexto de
+        frame e instrumentação dos comandos.
+        """
+        self._driver = driver
+        self.home_page_id = driver.current_window_handle
+        self._current_handle = self.home_page_id
+        self._frame_path = ()
+        self.windows.reset(self.home_page_id)
+        if self.config.command_metrics:
+            self._instrument_commands()
+        return driver
 
     def stop(self) -> None:
         if not self._driver:
             return
 
+        if self.config.poll_stats_path:
+            try:
+                polling.POLL_STATS.flush(self.config.poll_stats_path)
+            except Exception:
+                pass
+
+        if self.config.metrics_dir:
+            try:
+                metrics.METRICS.export(self.config.metrics_dir)
+            except Exception as e:
+                logger.warning(f"Falha ao exportar métricas: {e}")
+
+        # Dá um prazo curto para as evidências pendentes irem para o disco
+        self.evidence.close(timeout=5)
+
+        stop_tree: Dict[int, int] = {}
+        if self.config.kill_processes_on_stop:
+            # Lê a árvore antes do quit: depois dele os iexplore ficam órfãos.
+            # PIDs vistos antes e que já saíram dela podem ser de outro processo agora.
+            stop_tree = processes.tree_parents(self.service_pid)
+
         try:
             self._driver.quit()
         except Exception:
             pass
         finally:
             self._driver = None
+            self._current_handle = None
+            self._frame_path = None
 
         if self.config.kill_processes_on_stop:
-            self._kill_ie_processes()
+            self._kill_ie_processes(stop_tree)
+
+    def is_alive(self) -> bool:
+        """Um round trip barato: False se a sessão não existe ou o IE/driver morreu."""
+        if not self._driver:
+            return False
+        try:
+            # window_handles não depende da janela atual (que pode ter sido fechada)
+            return bool(self._driver.window_handles)
+        except WebDriverException:
+            return False
+
+    def memory_bytes(self) -> int:
+        """Working set atual dos processos desta sessão (IEDriverServer + iexplore)."""
+        return processes.tree_memory_bytes(self.service_pid, self.session_pids)
 
     def restart(self) -> WebDriver:
-        print("Reiniciando navegador")
-        self.stop()
-        driver = self.start()
-        print("Finalizado")
-        return driver
+        with tracing.span("restart"):
+            self.stop()
+            return self.start()
 
     # -----------------------------
     # Navegação / básicos
     # -----------------------------
 
     def open(self, url: str) -> None:
-        print(f"Navegando para {url}")
-        self.driver.get(url)
-        print("Finalizado")
+        self.breaker = retry.breaker_for(
+            urlsplit(url).netloc,
+            failure_threshold=self.config.breaker_failure_threshold,
+            reset_timeout_s=self.config.breaker_reset_s,
+        )
+        with tracing.span("open", url=url):
+            if self.breaker is not None:
+                self.breaker.check()
+            self.invalidate_frame()
+            try:
+                self.driver.get(url)
+            except TimeoutException:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                raise
+            self._frame_path = ()
 
     def refresh(self) -> None:
-        print("Atualizando a pagina")
-        self.driver.refresh()
-        print("Finalizado")
+        with tracing.span("refresh"):
+            self.invalidate_frame()
+            self.driver.refresh()
 
     def current_url(self) -> str:
         try:
-            print("Obtendo URL da pagina atual")
             return self.driver.current_url
         except Exception:
             return ""
-        finally:
-            print("Finalizado")
-
-    def close_window(self):
-        print(self.driver.window_handles)
-        for page in self.driver.window_handles:
-            if page != self.home_page_id:
-                self.driver.switch_to.window(page)
-                print(self.driver.title)
+
+    def close_window(self, keep: Iterable[str] = ()):
+        """Fecha todas as janelas menos a principal e as de `keep` (ex.: REPOM estacionadas)."""
+        with tracing.span("close_window") as sp:
+            self.sync_windows()
+            closed = 0
+            for info in self.windows.candidates(exclude=keep):
+                self.switch_to_handle(info.handle)
                 self.driver.close()
+                self._current_handle = None
+                # O frame rastreado era da janela fechada
+                self.invalidate_frame()
+                self.windows.forget(info.handle)
+                closed += 1
+            sp.set(closed=closed)
+
+    def close_handle(self, handle: str) -> None:
+        """Fecha só a janela `handle`; depois é preciso trocar de janela."""
+        with tracing.span("close_handle", handle=handle):
+            self.switch_to_handle(handle)
+            self.driver.close()
+            self._current_handle = None
+            self._frame_path = None
+            self.windows.forget(handle)
 
     # -----------------------------
     # Locator parser
@@ -232,65 +424,323 @@ class KMMIEDriver:
     # -----------------------------
 
     def wait_visible(self, locator: Locator, timeout: Optional[int] = None):
-        print("Aguardando elemento estar visivel")
-        by, value = self._parse_locator(locator)
-        wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
-        element = wait.until(EC.visibility_of_element_located((self._by(by), value)))
-        print("Fim do método wait")
-        return element
+        with tracing.span("wait_visible", locator):
+            by, value = self._parse_locator(locator)
+            wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+            element = wait.until(EC.visibility_of_element_located((self._by(by), value)))
+            return element
 
     def wait_present(self, locator: Locator, timeout: Optional[int] = None):
-        print("Aguardando elemento estar presente")
-        by, value = self._parse_locator(locator)
-        wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
-        element = wait.until(EC.presence_of_element_located((self._by(by), value)))
-        print("Fim do método wait")
-        return element
+        with tracing.span("wait_present", locator):
+            by, value = self._parse_locator(locator)
+            wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+            element = wait.until(EC.presence_of_element_located((self._by(by), value)))
+            return element
 
     def wait_clickable(self, locator: Locator, timeout: Optional[int] = None):
-        print("Aguardando elemento estar clicavel")
-        by, value = self._parse_locator(locator)
-        wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
-        element = wait.until(EC.element_to_be_clickable((self._by(by), value)))
-        print("Fim do método wait")
-        return element
+        with tracing.span("wait_clickable", locator):
+            by, value = self._parse_locator(locator)
+            wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+            element = wait.until(EC.element_to_be_clickable((self._by(by), value)))
+            return element
 
     def wait_frame(self, locator: Locator, timeout: Optional[int] = None):
-        print("Aguardando frame estar disponível")
-        by, value = self._parse_locator(locator)
-        wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
-        element = wait.until(EC.frame_to_be_available_and_switch_to_it((self._by(by), value)))
-        print("Fim do método wait")
-        return element
+        with tracing.span("wait_frame", locator):
+            by, value = self._parse_locator(locator)
+            wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+            element = wait.until(EC.frame_to_be_available_and_switch_to_it((self._by(by), value)))
+            return element
 
     def wait_alert(self, timeout: Optional[int] = None) -> Any:
-        print("Aguardando alerta aparecer")
-        wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
-        try:
-            element = wait.until(EC.alert_is_present())
-        except TimeoutException:
-            print("Alerta não apareceu")
-            return False
-        print("Fim do método wait")
-        return element
+        with tracing.span("wait_alert") as sp:
+            wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+            try:
+                return wait.until(EC.alert_is_present())
+            except TimeoutException:
+                sp.set(found=False)
+                return False
+
+    def wait_window_by_tile(self, target_title: str, timeout: Optional[int] = None) -> str:
+        """Espera uma janela (não principal) com o título; retorna o handle, já selecionado."""
+        with tracing.span("wait_window_by_tile", title=target_title):
+            wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+            return wait.until(lambda d: self.find_window(target_title))
+
+    # -----------------------------
+    # Esperas por condição (substituem sleeps fixos)
+    # -----------------------------
+
+    def step_budget(self, step: str) -> float:
+        return float(self.config.step_budgets.get(step, self.config.default_wait))
+
+    def poll_schedule(self, step: str, timeout: Optional[float] = None) -> PollSchedule:
+        schedule = self.config.poll_schedules.get(step) or PollSchedule(
+            initial_interval_s=self.config.poll_frequency, factor=1.0, jitter=0.0
+        )
+        if timeout is not None:
+            return schedule.with_deadline(timeout)
+        if schedule.deadline_s is None:
+            return schedule.with_deadline(self.step_budget(step))
+        return schedule
+
+    def poll(
+        self,
+        check: Callable[[], Any],
+        step: str,
+        on_retry: Optional[Callable[[], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Loop de polling com o schedule da etapa (backoff + jitter + prazo).
+        Retorna o resultado do check ou None no timeout; o tempo-até-pronto
+        vai para polling.POLL_STATS.
+        """
+        schedule = self.poll_schedule(step, timeout)
+        start = time.monotonic()
+        result = polling.poll(check, schedule, name=step, on_retry=on_retry)
+        elapsed = time.monotonic() - start
+        self.wait_timings.append(WaitTiming(step, "poll", round(elapsed, 3), schedule.deadline_s, bool(result)))
+        metrics.METRICS.observe_step(metrics.METRICS.current()[0], f"wait:{step}", elapsed)
+        tracing.event("poll", "Polling da etapa {step} levou {elapsed_s:.2f}s", step=step, elapsed_s=elapsed)
+        return result
+
+    def wait_until(
+        self,
+        condition: Callable[[WebDriver], Any],
+        step: str,
+        timeout: Optional[float] = None,
+        raise_on_timeout: bool = True,
+        label: str = "",
+    ) -> Any:
+        """
+        Espera `condition` com o orçamento da etapa `step` (ou `timeout`).
+        Registra em wait_timings quanto tempo a espera realmente levou.
+        Com raise_on_timeout=False retorna False ao estourar o orçamento.
+        """
+        budget = timeout if timeout is not None else self.step_budget(step)
+        label = label or type(condition).__name__
+
+        def _check():
+            try:
+                return condition(self.driver)
+            except (NoSuchElementException, StaleElementReferenceException):
+                return False
+
+        start = time.monotonic()
+        result = polling.poll(_check, self.poll_schedule(step, budget), name=step)
+        elapsed = time.monotonic() - start
+        self.wait_timings.append(WaitTiming(step, label, round(elapsed, 3), budget, bool(result)))
+        metrics.METRICS.observe_step(metrics.METRICS.current()[0], f"wait:{step}", elapsed)
+        tracing.event(
+            "wait_until", "Espera {label} da etapa {step} levou {elapsed_s:.2f}s (orçamento {budget}s)",
+            step=step, label=label, elapsed_s=elapsed, budget=budget,
+        )
+
+        if result:
+            return result
+        if raise_on_timeout:
+            raise TimeoutException(f"Etapa {step}: {label} não satisfeita em {budget}s")
+        logger.warning(f"Orçamento da etapa {step} esgotado ({label}), seguindo")
+        return False
+
+    def alert_outcome(self, name: str = "alert") -> Outcome:
+        def _check():
+            try:
+                # Selenium 3 lê o texto ao trocar: levanta se não há alerta
+                return self.driver.switch_to.alert
+            except NoAlertPresentException:
+                return None
+
+        return Outcome(name, _check)
 
-    def wait_window_by_tile(self, target_title: str, timeout: Optional[int] = None):
-        print(f"Aguardando janela {target_title} aparecer")
-        wait = WebDriverWait(self.driver, timeout or self.config.default_wait)
+    def window_outcome(self, target_title: str, name: Optional[str] = None, exclude: Iterable[str] = ()) -> Outcome:
+        """Janela não principal com o título (pelo registro: só as candidatas são visitadas)."""
+        exclude = tuple(exclude)
+        return Outcome(name or f"window:{target_title}", lambda: self.find_window(target_title, exclude=exclude))
 
-        element = wait.until(lambda d: any((d.switch_to.window(h) or True) and target_title in (d.title or "").lower()
-        for h in d.window_handles
+    def element_outcome(self, locator: Locator, name: Optional[str] = None) -> Outcome:
+        """Elemento presente no contexto (janela/frame) atual."""
+        by, value = self._parse_locator(locator)
+
+        def _check():
+            found = self.driver.find_elements(self._by(by), value)
+            return found[0] if found else None
+
+        return Outcome(name or f"element:{value}", _check)
+
+    def wait_any(
+        self,
+        outcomes: List[Outcome],
+        step: str,
+        timeout: Optional[float] = None,
+    ) -> Tuple[Optional[str], Any]:
+        """
+        Corrida entre resultados: checa todos em cada rodada do polling da
+        etapa (na ordem da lista) e devolve (nome, valor) do primeiro que
+        acontecer, ou (None, None) ao estourar o orçamento. Ponha o alerta
+        primeiro: com ele aberto o IE recusa os outros comandos.
+        """
+        budget = timeout if timeout is not None else self.step_budget(step)
+
+        def _check():
+            for outcome in outcomes:
+                try:
+                    value = outcome.check()
+                except (
+                    NoSuchElementException,
+                    StaleElementReferenceException,
+                    NoSuchWindowException,
+                    UnexpectedAlertPresentException,
+                ):
+                    value = None
+                if value:
+                    return outcome.name, value
+            return None
+
+        start = time.monotonic()
+        result = polling.poll(_check, self.poll_schedule(step, budget), name=step)
+        elapsed = time.monotonic() - start
+        label = "|".join(o.name for o in outcomes)
+        self.wait_timings.append(WaitTiming(step, label, round(elapsed, 3), budget, bool(result)))
+        metrics.METRICS.observe_step(metrics.METRICS.current()[0], f"wait:{step}", elapsed)
+        tracing.event(
+            "wait_any", "Etapa {step}: {outcome} em {elapsed_s:.2f}s (orçamento {budget}s)",
+            step=step, outcome=result[0] if result else "nenhum", elapsed_s=elapsed, budget=budget,
+        )
+        return result or (None, None)
+
+    def track_requests(self) -> None:
+        """Instrumenta XMLHttpRequest em todos os frames para o sinal de requisições pendentes."""
+        try:
+            self.driver.execute_script(waits.TRACK_REQUESTS_JS)
+        except WebDriverException:
+            pass
+
+    def wait_page_ready(self, step: str, timeout: Optional[float] = None, raise_on_timeout: bool = False) -> bool:
+        ready = self.wait_until(
+            waits.page_ready(self.config.loading_overlay_ids),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=raise_on_timeout,
+        )
+        # Frames recarregados perdem a instrumentação; reinstala a cada página pronta
+        self.track_requests()
+        return bool(ready)
+
+    def wait_requests_idle(self, step: str, timeout: Optional[float] = None, raise_on_timeout: bool = False) -> bool:
+        return bool(self.wait_until(
+            waits.requests_idle(self.config.loading_overlay_ids, self.config.requests_quiet_s),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=raise_on_timeout,
         ))
+
+    def mark_frame(self, name: str) -> Optional[str]:
+        """Marca o documento atual do frame `name`; use antes da ação que o recarrega."""
+        mark = waits.new_mark()
+        try:
+            found = self.driver.execute_script(waits.FRAME_MARK_JS, name, mark, True)
+        except WebDriverException:
+            return None
+        return mark if found else None
+
+    def wait_frame_loaded(
+        self,
+        name: str,
+        mark: Optional[str],
+        step: str,
+        timeout: Optional[float] = None,
+        raise_on_timeout: bool = False,
+    ) -> bool:
+        if mark is None:
+            # Frame não existia ao marcar: basta a página estar pronta
+            return self.wait_page_ready(step=step, timeout=timeout, raise_on_timeout=raise_on_timeout)
+        loaded = self.wait_until(
+            waits.all_of(waits.frame_loaded(name, mark), waits.page_ready(self.config.loading_overlay_ids)),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=raise_on_timeout,
+            label=f"frame_loaded:{name}",
+        )
+        self.track_requests()
+        return bool(loaded)
+
+    def wait_value_present(
+        self,
+        locator: Locator,
+        step: str,
+        timeout: Optional[float] = None,
+        raise_on_timeout: bool = False,
+    ) -> Any:
+        by, value = self._parse_locator(locator)
+        return self.wait_until(
+            waits.value_present((self._by(by), value)),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=raise_on_timeout,
+            label=f"value_present:{value}",
+        )
+
+    def wait_value_matches(
+        self,
+        locator: Locator,
+        expected: str,
+        step: str,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Espera o value do campo ser `expected`; retorna o valor ou False no orçamento."""
+        by, value = self._parse_locator(locator)
+        return self.wait_until(
+            waits.value_matches((self._by(by), value), expected),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=False,
+            label=f"value_matches:{value}",
+        )
+
+    def wait_value_change(
+        self,
+        locator: Locator,
+        previous: Optional[str],
+        step: str,
+        timeout: Optional[float] = None,
+        raise_on_timeout: bool = False,
+    ) -> Any:
+        by, value = self._parse_locator(locator)
+        return self.wait_until(
+            waits.value_changed((self._by(by), value), previous),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=raise_on_timeout,
+            label=f"value_changed:{value}",
+        )
+
+    def wait_enabled(
+        self,
+        locator: Locator,
+        step: str,
+        timeout: Optional[float] = None,
+        raise_on_timeout: bool = False,
+    ) -> Any:
+        by, value = self._parse_locator(locator)
+        return self.wait_until(
+            waits.all_of(
+                waits.requests_idle(self.config.loading_overlay_ids, self.config.requests_quiet_s),
+                waits.element_enabled((self._by(by), value)),
+            ),
+            step=step,
+            timeout=timeout,
+            raise_on_timeout=raise_on_timeout,
+            label=f"enabled:{value}",
+        )
+
     # -----------------------------
     # safe_* com retry curto
     # -----------------------------
 
     def safe_find(self, locator: Locator, timeout: Optional[int] = None):
         try:
-            print(f"Procurando um elemento: {locator} com timeout {timeout}")
-            element = self.wait_present(locator, timeout=timeout)
-            print("Finalizado")
-            return element
+            return self.wait_present(locator, timeout=timeout)
         except TimeoutException as e:
             self.dump_state("safe_find_timeout")
             raise e
@@ -303,15 +753,14 @@ class KMMIEDriver:
         backoff_s: float = 0.6,
         use_js_fallback: bool = True,
     ) -> None:
-        print(f"Clicado no elemento: {locator} com timeout {timeout}, retries {retries} e backoff de {backoff_s} segunndos")
-        
         self._with_retry(
             fn=lambda: self._click_once(locator, timeout, use_js_fallback),
             retries=retries,
             backoff_s=backoff_s,
             on_fail_label="safe_click_fail",
+            operation="safe_click",
+            locator=locator,
         )
-        print("Finalizado")
 
     def _click_once(self, locator: Locator, timeout: Optional[int], use_js_fallback: bool) -> None:
         el = self.wait_clickable(locator, timeout=timeout)
@@ -333,7 +782,6 @@ class KMMIEDriver:
         backoff_s: float = 0.6,
         time_between_types: float = None
     ) -> None:
-        print(f"Escrevendo texto no elemento: {locator} com timeout {timeout}, retries {retries} e backoff de {backoff_s} segunndos")
         def _type():
             el = self.wait_visible(locator, timeout=timeout)
             if clear_first:
@@ -348,13 +796,14 @@ class KMMIEDriver:
                     time.sleep(time_between_types)
             else:
                 el.send_keys(text)
-            print("Finalizado")
 
         self._with_retry(
             fn=_type,
             retries=retries,
             backoff_s=backoff_s,
             on_fail_label="safe_type_fail",
+            operation="safe_type",
+            locator=locator,
         )
 
     def safe_get_text(
@@ -364,10 +813,8 @@ class KMMIEDriver:
         retries: int = 2,
         backoff_s: float = 0.4,
     ) -> str:
-        print(f"Obtendo texto do elemento: {locator} com timeout {timeout}, retries {retries} e backoff de {backoff_s} segunndos")
         def _get():
             el = self.wait_visible(locator, timeout=timeout)
-            print("Finalizado")
             return (el.text or "").strip()
 
         return self._with_retry(
@@ -375,6 +822,8 @@ class KMMIEDriver:
             retries=retries,
             backoff_s=backoff_s,
             on_fail_label="safe_get_text_fail",
+            operation="safe_get_text",
+            locator=locator,
         )
 
     def safe_get_attribute(
@@ -385,24 +834,22 @@ class KMMIEDriver:
             retries: int = 2,
             backoff_s: float = 0.4
             ):
-        print(f"Obtendo atributo {attribute} do locator {locator} com timeout {timeout}, retries {retries} e backoff de {backoff_s} segunndos")
         def _get():
             el = self.wait_present(locator=locator, timeout=timeout)
-            print("Finalizado")
             return (el.get_attribute(attribute))
         
         return self._with_retry(
             fn=_get,
             retries=retries,
             backoff_s=backoff_s,
-            on_fail_label="safe_get_attributes_fail"
+            on_fail_label="safe_get_attributes_fail",
+            operation="safe_get_attribute",
+            locator=locator,
         )
 
     def exists(self, locator: Locator, timeout: int = 2) -> bool:
         try:
-            print(f"Verificando se o locator {locator} existe")
             self.wait_present(locator, timeout=timeout)
-            print("Finalizado")
             return True
         except TimeoutException:
             return False
@@ -413,96 +860,321 @@ class KMMIEDriver:
         on_fail_label: str,
         retries: int = 3,
         backoff_s: float = 1,
+        operation: Optional[str] = None,
+        locator: Optional[Locator] = None,
     ):
-        last_exc = None
-        for attempt in range(retries + 1):
-            try:
-                print(f"Tentativa {attempt + 1}")
-                return fn()
-            except (StaleElementReferenceException, WebDriverException, TimeoutException, NoSuchElementException) as e:
-                last_exc = e
-                if attempt < retries:
-                    time.sleep(backoff_s * (attempt + 1))
-                    continue
-                self.dump_state(on_fail_label)
-                raise last_exc
+        if self.breaker is not None:
+            self.breaker.check()
+
+        with tracing.span(operation or on_fail_label, locator) as sp:
+            for attempt in range(retries + 1):
+                sp.attempt = attempt + 1
+                try:
+                    result = fn()
+                except Exception as e:
+                    if isinstance(e, (NoSuchFrameException, NoSuchWindowException)):
+                        # Frame desanexado / janela fechada: o contexto rastreado não vale mais
+                        self.invalidate_frame()
+                    if self.retry_policy.classify(e) == retry.FATAL:
+                        # Nova tentativa/evidência não ajudam (driver morto, sessão inválida...)
+                        sp.set(fatal=type(e).__name__)
+                        raise
+                    if attempt < retries:
+                        metrics.METRICS.retry()
+                        tracing.event(
+                            operation or on_fail_label, "Tentativa {attempt} falhou: {error}",
+                            locator=locator, attempt=attempt + 1, error=type(e).__name__,
+                        )
+                        time.sleep(self.retry_policy.delay(attempt, backoff_s))
+                        continue
+                    if self.breaker is not None and self.retry_policy.unhealthy(e):
+                        self.breaker.record_failure()
+                    self.dump_state(on_fail_label)
+                    raise
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return result
 
-        if last_exc:
-            raise last_exc
         raise RuntimeError("Retry failed without captured exception")
 
     # -----------------------------
     # Frames / Windows
     # -----------------------------
 
+    @property
+    def frame_path(self) -> Optional[Tuple[str, ...]]:
+        return self._frame_path
+
+    def invalidate_frame(self) -> None:
+        self._frame_path = None
+
+    def _frame_matches(self, path: Tuple[str, ...]) -> bool:
+        """Confere se o contexto real ainda é a folha de `path` (id/name do frameElement)."""
+        if not self.config.verify_frame_context or not path:
+            # O default content não "desanexa": basta o rastreamento
+            return True
+        try:
+            current = self.driver.execute_script(CURRENT_FRAME_JS)
+        except WebDriverException:
+            return False
+        if current is None:
+            return False
+        by, value = self._parse_locator(path[-1])
+        if by == "id":
+            return current[0] == value
+        if by == "name":
+            return current[1] == value
+        # xpath/css: só dá para confirmar que estamos em algum frame
+        return True
+
     def switch_to_default(self) -> None:
-        print("Trocando para o conteúdo principal da DOM")
-        self.driver.switch_to.default_content()
-        print("Sucesso")
+        with tracing.span("switch_to_default"):
+            self.driver.switch_to.default_content()
+            self._frame_path = ()
 
-    def switch_to_frame(self, principal: bool = True, timeout: Optional[int] = None) -> None:
-        
-        self.driver.switch_to.default_content()
+    def switch_to_frame_path(self, path: Tuple[str, ...], timeout: Optional[int] = None) -> None:
+        """
+        Vai para o frame `path` (locators a partir do default content).
+        Não faz nada se já estiver nele; se estiver num ancestral, só desce o que falta.
+        """
+        path = tuple(path)
+        current = self._frame_path
+
+        with tracing.span("switch_to_frame_path", path) as sp:
+            if current is not None and current == path and self._frame_matches(path):
+                sp.set(skipped=True)
+                return
+
+            start = 0
+            if current is not None and len(current) < len(path) and path[:len(current)] == current \
+                    and self._frame_matches(current):
+                start = len(current)
+            else:
+                self.driver.switch_to.default_content()
+                self._frame_path = ()
+
+            for depth in range(start, len(path)):
+                self._frame_path = None
+                self.wait_frame(locator=path[depth], timeout=timeout)
+                self._frame_path = path[:depth + 1]
+            sp.set(entered=len(path) - start)
 
-        print("Entrando no frame principal")
-        self.wait_frame(locator='id:principal', timeout=timeout)
+    def switch_to_frame(self, principal: bool = True, timeout: Optional[int] = None) -> None:
+        self.switch_to_frame_path(PRINCIPAL_PATH if principal else ICONTEUDO_PATH, timeout=timeout)
 
-        time.sleep(0.2)
-        if not principal:
-            print("Entrando no frame iconteudo")
-            self.wait_frame(locator='name:iconteudo', timeout=timeout)
+    def enter_frame(self, locator: Locator, timeout: Optional[int] = None) -> None:
+        """Entra num frame filho do frame atual (ex.: 'name:...' do modal de quitação)."""
+        if self._frame_path is None:
+            raise RuntimeError("Contexto de frame desconhecido; use switch_to_frame antes de enter_frame")
+        key = locator if isinstance(locator, str) else f"{locator[0]}:{locator[1]}"
+        self.switch_to_frame_path(self._frame_path + (key,), timeout=timeout)
 
-        print("Sucesso")
+    def switch_to_handle(self, handle: str) -> None:
+        if handle == self._current_handle:
+            return
+        self.invalidate_frame()
+        self.driver.switch_to.window(handle)
+        self._current_handle = handle
+        # Trocar de janela sempre leva ao documento de topo dela
+        self._frame_path = ()
 
     def switch_to_window(self, target_title: str = None, timeout: Optional[int] = None, home_window: bool = False) -> bool:
 
         if home_window:
-            self.driver.switch_to.window(self.home_page_id)
+            if self._current_handle == self.home_page_id and self._frame_path is not None:
+                return True
+            self.switch_to_handle(self.home_page_id)
             return True
-        target = target_title.lower()
-
-        print(f"Pulando para janela => {target_title}")
-
-        try:
-            self.wait_window_by_tile(target_title=target, timeout=timeout)
-        except TimeoutException:
-            print(f"Janela com título contendo '{target_title}' em {timeout}s não encontrada")
-            return False
 
-        for h in self.driver.window_handles:
-            self.driver.switch_to.window(h)
-            if target in (self.driver.title or "").lower():
-                print(f"Janela encontrada e ativada => {self.driver.title}")
+        with tracing.span("switch_to_window", title=target_title) as sp:
+            try:
+                self.wait_window_by_tile(target_title=target_title, timeout=timeout)
                 return True
-
-        return False
+            except TimeoutException:
+                logger.warning(f"Janela com título contendo '{target_title}' em {timeout}s não encontrada")
+                sp.set(found=False)
+                return False
+
+    def sync_windows(self) -> List[windows.WindowInfo]:
+        """Um window_handles: atualiza o registro e retorna as janelas novas."""
+        new = self.windows.sync(self.driver.window_handles)
+        if new:
+            tracing.event("windows", "Janelas novas: {handles}", handles=[w.handle for w in new])
+        return new
+
+    def window_title(self, handle: str) -> str:
+        """Título da janela; só troca para ela se o título registrado não vale mais."""
+        info = self.windows.get(handle)
+        if info is not None and self.windows.title_fresh(info):
+            return info.title
+        self.switch_to_handle(handle)
+        title = self.driver.title or ""
+        self.windows.set_title(handle, title)
+        return title
+
+    def find_windows(self, target_title: str, exclude: Iterable[str] = ()) -> Iterator[str]:
+        """
+        Janelas não principais (fora de `exclude`) cujo título contém
+        `target_title`, da mais nova para a mais antiga. Cada handle é
+        entregue com a janela já selecionada.
+        """
+        target = target_title.lower()
+        self.sync_windows()
+        for info in self.windows.candidates(exclude=exclude):
+            if target in self.window_title(info.handle).lower():
+                self.switch_to_handle(info.handle)
+                yield info.handle
+
+    def find_window(self, target_title: str, exclude: Iterable[str] = ()) -> Optional[str]:
+        return next(self.find_windows(target_title, exclude), None)
     
     def accept_alert(self) -> str:
-        print("Aceitando um Alert")
-        alert = self.wait_alert()
-        text = alert.text
-        alert.accept()
-        print(f"Texto do alerta {text}")
-        return text
+        with tracing.span("accept_alert") as sp:
+            alert = self.wait_alert()
+            text = alert.text
+            alert.accept()
+            # O alerta costuma anteceder navegação/recarga do frame
+            self.invalidate_frame()
+            sp.set(text=text)
+            return text
 
     # -----------------------------
     # Selects
     # -----------------------------
 
     def select_by_value(self, locator: Locator, value:str, timeout: Optional[int] = None) -> None:
-        print(f"Selecionando {value} no locator {locator} com timeout de {timeout}")
-        el = self.wait_present(locator=locator, timeout=timeout)
-        Select(el).select_by_value(value=value)
+        with tracing.span("select_by_value", locator, value=value):
+            el = self.wait_present(locator=locator, timeout=timeout)
+            Select(el).select_by_value(value=value)
 
     def select_by_index(self, locator: Locator, index:int, timeout: Optional[int] = None) -> None:
-        print(f"Selecionando por index {index} no locator {locator} com timeout de {timeout}")
-        el = self.wait_present(locator=locator, timeout=timeout)
-        Select(el).select_by_index(index=index)
+        with tracing.span("select_by_index", locator, index=index):
+            el = self.wait_present(locator=locator, timeout=timeout)
+            Select(el).select_by_index(index=index)
     
     def select_by_visible_text(self, locator: Locator, value:str, timeout: Optional[int] = None) -> None:
-        print(f"Selecionando {value} no locator {locator} com timeout de {timeout}")
-        el = self.wait_present(locator=locator, timeout=timeout)
-        Select(el).select_by_visible_text(text=value)
+        with tracing.span("select_by_visible_text", locator, value=value):
+            el = self.wait_present(locator=locator, timeout=timeout)
+            Select(el).select_by_visible_text(text=value)
+
+    # -----------------------------
+    # Formulários
+    # -----------------------------
+
+    def fill_form(
+        self,
+        fields: Dict[str, Any],
+        keystroke_fields: Tuple[str, ...] = (),
+        timeout: Optional[int] = None,
+        masked: Iterable[str] = forms.MASKED_FIELDS,
+        verify: bool = True,
+    ) -> Dict[str, str]:
+        """
+        Preenche vários inputs/selects do frame atual em um único execute_script,
+        disparando keyup/change/blur. `fields` é {"ID" | "id:ID" | "name:NOME": valor},
+        na ordem em que devem ser preenchidos.
+
+        Campos em `keystroke_fields` são digitados com safe_type (teclas reais).
+        O valor lido de volta é comparado sem \\r e sem espaços nas pontas.
+        Campos que não conferem são refeitos uma vez pelo caminho tradicional
+        (safe_type / select_by_value); se ainda divergirem, levanta ValueError.
+        Campos em `masked` (reformatados pelo KMM) só comparam o conteúdo e
+        uma divergência vai para o log. verify=False não confere nada.
+        """
+        typed = {forms.normalize_field(k) for k in keystroke_fields}
+        masked = {forms.normalize_field(k) for k in masked}
+        written: Dict[str, str] = {}
+
+        def matches(key: str, value: str, current: Optional[str]) -> bool:
+            if key in masked:
+                return forms.masked_equal(value, current)
+            return forms.normalize_value(value) == forms.normalize_value(current)
+
+        for is_typed, group in forms.batches(fields, typed):
+            if is_typed:
+                key, value = group[0]
+                self.safe_type(forms.to_locator(key), value, timeout=timeout)
+                written[key] = value
+                continue
+
+            result = self._with_retry(
+                fn=lambda: self.driver.execute_script(forms.FILL_FORM_JS, [list(kv) for kv in group]),
+                retries=1,
+                backoff_s=0.5,
+                on_fail_label="fill_form_fail",
+                operation="fill_form",
+                locator=[k for k, _ in group] if tracing.enabled() else None,
+            ) or {}
+
+            for key, value in group:
+                info = result.get(key) or {}
+                if not verify or (info.get("found") and matches(key, value, info.get("value"))):
+                    written[key] = value
+                    continue
+                if info.get("found") and key in masked:
+                    logger.warning(f"Campo {key} ficou com {info.get('value')!r} após a máscara do KMM (enviado {value!r})")
+                    written[key] = value
+                    continue
+
+                logger.debug(f"Campo {key} não conferiu após o script ({info.get('value')!r}), refazendo")
+                locator = forms.to_locator(key)
+                if info.get("tag") == "select":
+                    self.select_by_value(locator, value, timeout=timeout)
+                else:
+                    self.safe_type(locator, value, timeout=timeout)
+
+                current = self.safe_get_attribute(locator, "value", timeout=timeout) or ""
+                if not matches(key, value, current):
+                    if key in masked:
+                        logger.warning(f"Campo {key} ficou com {current!r} após a máscara do KMM (enviado {value!r})")
+                        written[key] = value
+                        continue
+                    raise ValueError(f"Campo {key} ficou com {current!r} em vez de {value!r}")
+                written[key] = value
+
+        return written
+
+    # -----------------------------
+    # Tabelas
+    # -----------------------------
+
+    def extract_table(
+        self,
+        locator: Locator,
+        schema: Mapping[str, str],
+        row_selector: str = "tr",
+        timeout: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lê a tabela inteira em um execute_script e devolve uma lista de dicts
+        conforme `schema` (ver kmm/ie_driver/tables.py). Locators id/css são
+        resolvidos dentro do próprio script; os demais (xpath...) fazem um
+        wait_present antes.
+        """
+        compiled = tables.compile_schema(schema)
+        by, value = self._parse_locator(locator)
+
+        def _extract():
+            rows = None
+            if by in ("id", "css"):
+                rows = self.driver.execute_script(tables.EXTRACT_TABLE_JS, None, by, value, compiled, row_selector)
+            if rows is None:
+                el = self.wait_present(locator, timeout=timeout)
+                rows = self.driver.execute_script(tables.EXTRACT_TABLE_JS, el, by, value, compiled, row_selector)
+            if rows is None:
+                raise NoSuchElementException(f"Tabela {locator} não encontrada")
+            return rows
+
+        rows = self._with_retry(
+            fn=_extract,
+            retries=2,
+            backoff_s=0.4,
+            on_fail_label="extract_table_fail",
+            operation="extract_table",
+            locator=locator,
+        )
+        tracing.event("extract_table", "{rows} linhas extraídas de {locator}", locator=locator, rows=len(rows))
+        return rows
 
     #
     # Execute javascript
@@ -510,9 +1182,9 @@ class KMMIEDriver:
 
     def execute_js(self, script:str, arguments = None):
         if arguments:
-            self.driver.execute_script(script, arguments)
+            return self.driver.execute_script(script, arguments)
         else:
-            self.driver.execute_script(script)
+            return self.driver.execute_script(script)
 
     # -----------------------------
     # Evidências / Diagnóstico
@@ -522,15 +1194,13 @@ class KMMIEDriver:
         """
         Gera evidências no evidence_dir:
           - screenshot png
-          - html
-          - metadados (url)
+          - html (gzip, deduplicado por hash em evidence_dir/html)
+          - metadados (url, label, html)
+        Aqui só captura os bytes da sessão; a gravação vai para o
+        EvidenceWriter (thread) quando evidence_async=True.
         Retorna dict com paths.
         """
         uid = uuid.uuid4().hex[:10]
-        base = Path(self.config.evidence_dir) / f"{int(time.time())}_{label}_{uid}"
-        png_path = str(base) + ".png"
-        html_path = str(base) + ".html"
-        meta_path = str(base) + ".txt"
 
         url = ""
         try:
@@ -538,35 +1208,67 @@ class KMMIEDriver:
         except Exception:
             pass
 
+        png = None
         try:
-            self.driver.save_screenshot(png_path)
+            png = self.driver.get_screenshot_as_png()
         except Exception:
             pass
 
+        html = None
         try:
             html = self.driver.page_source
-            Path(html_path).write_text(html, encoding="utf-8", errors="ignore")
         except Exception:
             pass
 
-        try:
-            Path(meta_path).write_text(f"url={url}\n", encoding="utf-8", errors="ignore")
-        except Exception:
-            pass
-
-        return {"png": png_path, "html": html_path, "meta": meta_path, "url": url}
+        capture = EvidenceCapture(
+            label=label,
+            base_name=f"{int(time.time())}_{label}_{uid}",
+            url=url,
+            png=png,
+            html=html,
+            ts=time.time(),
+        )
+        if self.config.evidence_async:
+            return self.evidence.submit(capture)
+        return self.evidence.write(capture)
 
     # -----------------------------
     # Kill de processos (opcional, mas salva vidas)
     # -----------------------------
 
-    def _kill_ie_processes(self) -> None:
-        # Windows only
-        try:
-            subprocess.run(["taskkill", "/F", "/IM", "iexplore.exe"], capture_output=True, text=True)
-            subprocess.run(["taskkill", "/F", "/IM", "IEDriverServer.exe"], capture_output=True, text=True)
-        except Exception:
-            pass
+    def _instrument_commands(self) -> None:
+        """Cronometra cada comando enviado ao IEDriverServer (por tipo de comando)."""
+        executor = self._driver.command_executor
+        execute = executor.execute
+        if getattr(execute, "__kmm_metrics", False):
+            return
+
+        def _timed_execute(command, params):
+            start = time.perf_counter()
+            try:
+                return execute(command, params)
+            finally:
+                metrics.METRICS.observe_command(command, time.perf_counter() - start)
+
+        _timed_execute.__kmm_metrics = True
+        executor.execute = _timed_execute
+
+    def _track_session_processes(self) -> None:
+        # selenium 3.141 guarda o Service do IE em .iedriver (.service nas versões 4)
+        service = getattr(self._driver, "iedriver", None) or getattr(self._driver, "service", None)
+        process = getattr(service, "process", None)
+        if process is not None:
+            self.service_pid = process.pid
+
+        tree = processes.process_tree(self.service_pid)
+        # Acumula: processos já vistos continuam sendo desta sessão mesmo se o pai morreu
+        self.session_pids = list(dict.fromkeys(self.session_pids + tree))
+
+    def _kill_ie_processes(self, tree: Dict[int, int]) -> None:
+        # Windows only. Mata só os processos desta sessão, nunca todos os IE da máquina.
+        processes.kill_tree(tree)
+        self.service_pid = None
+        self.session_pids = []
 
     # -----------------------------
     # Disponibiliza metodos do selenium
@@ -581,6 +1283,11 @@ class KMMIEDriver:
         if name == "_driver":
             raise AttributeError(name)
 
+        # Trocas/navegações feitas direto no Selenium fogem do rastreamento
+        if name in ("switch_to", "get", "back", "forward", "close"):
+            self._frame_path = None
+            self._current_handle = None
+
         drv = object.__getattribute__(self, "_driver")
         if drv is None:
             raise AttributeError(
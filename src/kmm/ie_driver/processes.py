@@ -0,0 +1,128 @@
+"""
+Rastreamento dos processos de UMA sessão do IE (Windows).
+
+O IEDriverServer de cada sessão abre o(s) seu(s) próprio(s) iexplore.exe.
+Guardamos a árvore de processos a partir do PID do IEDriverServer para que o
+stop() de uma sessão mate só os seus processos, sem derrubar as outras
+sessões da máquina (o antigo `taskkill /IM iexplore.exe` matava todas).
+
+A árvore precisa ser lida enquanto o IEDriverServer está vivo: depois que ele
+morre, os iexplore órfãos não aparecem mais como filhos de ninguém.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import subprocess
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _process_rows() -> Dict[int, Tuple[int, int]]:
+    """Retorna {pid: (ppid, working set em bytes)} de todos os processos da máquina."""
+    try:
+        out = subprocess.run(
+            ["wmic", "process", "get", "ParentProcessId,ProcessId,WorkingSetSize", "/format:csv"],
+            capture_output=True,
+            text=True,
+            timeout=15,
+        ).stdout
+        rows: Dict[int, Tuple[int, int]] = {}
+        for row in csv.DictReader(io.StringIO(out.strip())):
+            try:
+                rows[int(row["ProcessId"])] = (int(row["ParentProcessId"]), int(row.get("WorkingSetSize") or 0))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if rows:
+            return rows
+    except Exception:
+        pass
+
+    # wmic foi removido de algumas versões do Windows
+    try:
+        out = subprocess.run(
+            [
+                "powershell", "-NoProfile", "-Command",
+                "Get-CimInstance Win32_Process | ForEach-Object "
+                "{ \"$($_.ProcessId),$($_.ParentProcessId),$($_.WorkingSetSize)\" }",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        ).stdout
+        rows = {}
+        for line in out.splitlines():
+            parts = line.strip().split(",")
+            if len(parts) == 3 and all(p.isdigit() for p in parts):
+                rows[int(parts[0])] = (int(parts[1]), int(parts[2]))
+        return rows
+    except Exception:
+        return {}
+
+
+def _process_table() -> Dict[int, int]:
+    """Retorna {pid: ppid} de todos os processos da máquina."""
+    return {pid: ppid for pid, (ppid, _) in _process_rows().items()}
+
+
+def _tree(table: Dict[int, int], root_pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for pid, ppid in table.items():
+        children.setdefault(ppid, []).append(pid)
+
+    tree: List[int] = []
+    seen: Set[int] = set()
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        if pid in seen:
+            continue
+        seen.add(pid)
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def process_tree(root_pid: Optional[int]) -> List[int]:
+    """PIDs da árvore de processos que começa em `root_pid` (inclusive)."""
+    if not root_pid:
+        return []
+    return _tree(_process_table(), root_pid)
+
+
+def tree_parents(root_pid: Optional[int]) -> Dict[int, int]:
+    """{pid: ppid} da árvore de `root_pid` neste momento."""
+    if not root_pid:
+        return {}
+    table = _process_table()
+    return {pid: table[pid] for pid in _tree(table, root_pid) if pid in table}
+
+
+def tree_memory_bytes(root_pid: Optional[int], extra_pids: Iterable[int] = ()) -> int:
+    """Soma do working set da árvore de `root_pid` mais `extra_pids` ainda vivos (uma consulta só)."""
+    pids = set(extra_pids)
+    if not root_pid and not pids:
+        return 0
+    rows = _process_rows()
+    if root_pid:
+        pids.update(_tree({pid: ppid for pid, (ppid, _) in rows.items()}, root_pid))
+    return sum(rows[pid][1] for pid in pids if pid in rows)
+
+
+def kill_pids(pids: Iterable[int]) -> None:
+    """Mata os PIDs informados (e descendentes ainda ligados a eles)."""
+    for pid in pids:
+        try:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], capture_output=True, text=True)
+        except Exception:
+            pass
+
+
+def kill_tree(parents: Dict[int, int]) -> None:
+    """
+    Mata os processos de uma árvore lida por tree_parents (filhos primeiro).
+    Só os que ainda existem com o mesmo pai: um PID que o Windows reaproveitou
+    para outro processo nesse meio tempo é poupado.
+    """
+    table = _process_table()
+    processes = [pid for pid, ppid in parents.items() if table.get(pid) == ppid]
+    kill_pids(reversed(processes))
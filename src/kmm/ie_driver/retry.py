@@ -0,0 +1,180 @@
+"""
+Política de retry do KMMIEDriver e circuit breaker por endpoint do KMM.
+
+RetryPolicy separa as exceções em:
+    RETRY  transitórias (elemento stale/ausente, timeout, frame recarregando):
+           tenta de novo com backoff e, esgotadas as tentativas, grava evidência
+    FATAL  não melhoram com nova tentativa (driver morto, sessão inválida,
+           janela fechada): sobem na hora, sem backoff nem dump_state
+
+O CircuitBreaker é compartilhado por todas as sessões do processo que falam
+com o mesmo endpoint (host do KMM). Só operações que esgotam as tentativas
+com uma falha do endpoint (RetryPolicy.unhealthy: conexão recusada, timeout
+de carregamento da página, HTTP 5xx) contam; elemento ausente/stale e
+esperas de tela não dizem nada sobre a saúde do KMM. `failure_threshold`
+falhas seguidas abrem o circuito e,
+por `reset_timeout_s`, toda operação falha rápido com KMMCircuitOpenError
+(o WorkerPool adia o item em vez de martelar um KMM degradado). Depois do
+prazo o circuito fica meio aberto: o primeiro resultado fecha ou reabre.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, Tuple, Type
+
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    NoSuchElementException,
+    NoSuchWindowException,
+    SessionNotCreatedException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
+
+import exceptions.personalized_exceptions as pe
+from shared.logger import logger
+
+RETRY = "retry"
+FATAL = "fatal"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class RetryPolicy:
+    """Política padrão; subclasses podem trocar a classificação ou o backoff."""
+
+    retryable: Tuple[Type[BaseException], ...] = (
+        StaleElementReferenceException,
+        NoSuchElementException,
+        TimeoutException,
+        WebDriverException,
+    )
+    fatal: Tuple[Type[BaseException], ...] = (
+        InvalidSessionIdException,
+        SessionNotCreatedException,
+        NoSuchWindowException,
+    )
+    # Mensagens do IEDriverServer quando o IE/sessão morreu (vêm como WebDriverException genérica)
+    fatal_messages: Tuple[str, ...] = (
+        "invalid session id",
+        "session not found",
+        "unable to find session",
+        "unable to get browser",
+        "no such driver",
+    )
+
+    # Falhas do endpoint (KMM fora do ar/degradado), as únicas que contam para o breaker
+    unhealthy_types: Tuple[Type[BaseException], ...] = (ConnectionError,)
+    unhealthy_messages: Tuple[str, ...] = (
+        "connection refused",
+        "err_connection",
+        "timed out waiting for page to load",
+        "page load",
+        "internal server error",
+        "bad gateway",
+        "service unavailable",
+        "gateway timeout",
+        "http 500",
+        "http 502",
+        "http 503",
+        "http 504",
+    )
+
+    def classify(self, exc: BaseException) -> str:
+        if isinstance(exc, self.fatal):
+            return FATAL
+        if not isinstance(exc, self.retryable):
+            # Fora do Selenium (ex.: urllib3 sem conexão com o IEDriverServer)
+            return FATAL
+        message = str(getattr(exc, "msg", None) or exc).lower()
+        if any(text in message for text in self.fatal_messages):
+            return FATAL
+        return RETRY
+
+    def unhealthy(self, exc: BaseException) -> bool:
+        """A falha indica o endpoint com problema (e não a tela/elemento)?"""
+        if isinstance(exc, self.unhealthy_types):
+            return True
+        if isinstance(exc, (NoSuchElementException, StaleElementReferenceException)):
+            return False
+        message = str(getattr(exc, "msg", None) or exc).lower()
+        return any(text in message for text in self.unhealthy_messages)
+
+    def delay(self, attempt: int, backoff_s: float) -> float:
+        """Espera antes da tentativa seguinte (attempt começa em 0): linear."""
+        return backoff_s * (attempt + 1)
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+class CircuitBreaker:
+    def __init__(self, endpoint: str, failure_threshold: int = 5, reset_timeout_s: float = 60.0):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                self._state = HALF_OPEN
+            return self._state
+
+    def check(self) -> None:
+        """Levanta KMMCircuitOpenError enquanto o circuito estiver aberto."""
+        if self.state != OPEN:
+            return
+        with self._lock:
+            retry_after = max(0.0, self.reset_timeout_s - (time.monotonic() - self._opened_at))
+        raise pe.KMMCircuitOpenError(
+            f"KMM instável ({self.endpoint}): circuito aberto, nova tentativa em {retry_after:.0f}s",
+            retry_after_s=retry_after,
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit breaker fechado para {self.endpoint}")
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            reopen = self._state == HALF_OPEN
+            if reopen or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                logger.warning(
+                    f"Circuit breaker aberto para {self.endpoint} após {self._failures} falhas seguidas "
+                    f"({self.reset_timeout_s:.0f}s)"
+                )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker_for(endpoint: Optional[str], failure_threshold: int = 5, reset_timeout_s: float = 60.0) -> Optional[CircuitBreaker]:
+    """Breaker compartilhado do endpoint (criado na primeira chamada); None sem endpoint."""
+    if not endpoint:
+        return None
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = _BREAKERS[endpoint] = CircuitBreaker(endpoint, failure_threshold, reset_timeout_s)
+        return breaker
@@ -0,0 +1,91 @@
+"""
+Extração de tabelas do KMM em um único execute_script.
+
+Ler uma tabela célula a célula (find_elements por linha, .text por célula,
+get_attribute por input) custa round trips proporcionais ao tamanho da
+tabela. Aqui a tabela inteira volta como lista de dicts numa chamada só.
+
+Schema: {chave: spec}, onde spec é
+    "id"            id da linha
+    "class"         className da linha
+    "text"          texto da linha
+    "cells"         textos de todas as células (td) da linha
+    "cells:<css>"   textos das células que casam com o seletor
+    "text:<css>"    texto do primeiro elemento da linha que casa com o seletor
+    "value:<css>"   value do primeiro input/select da linha que casa com o seletor
+    "values"        values de todos os input/select/textarea da linha
+    "attr:<nome>"   atributo da linha
+"""
+from __future__ import annotations
+
+from typing import List, Mapping
+
+_KINDS = ("id", "class", "text", "cells", "value", "values", "attr")
+
+# arguments: [elemento | null, by, valor, schema compilado, seletor de linhas]
+EXTRACT_TABLE_JS = """
+var table = arguments[0], by = arguments[1], locValue = arguments[2];
+var schema = arguments[3], rowSelector = arguments[4];
+if (!table) {
+    if (by === 'id') { table = document.getElementById(locValue); }
+    else if (by === 'css') { table = document.querySelector(locValue); }
+}
+if (!table) { return null; }
+function kmmMatches(el, sel) {
+    if (!sel) { return true; }
+    var fn = el.matches || el.msMatchesSelector || el.webkitMatchesSelector;
+    return fn.call(el, sel);
+}
+function kmmText(el) {
+    return el ? (el.innerText || el.textContent || '').replace(/^\\s+|\\s+$/g, '') : null;
+}
+var rows = table.rows || table.querySelectorAll('tr');
+var out = [];
+for (var i = 0; i < rows.length; i++) {
+    var row = rows[i];
+    if (!kmmMatches(row, rowSelector)) { continue; }
+    var item = {};
+    for (var j = 0; j < schema.length; j++) {
+        var key = schema[j][0], kind = schema[j][1], arg = schema[j][2];
+        var k, list, els;
+        if (kind === 'id') { item[key] = row.id || ''; }
+        else if (kind === 'class') { item[key] = row.className || ''; }
+        else if (kind === 'attr') { item[key] = row.getAttribute(arg); }
+        else if (kind === 'text') {
+            item[key] = arg ? kmmText(row.querySelector(arg)) : kmmText(row);
+        }
+        else if (kind === 'cells') {
+            list = [];
+            for (k = 0; k < row.cells.length; k++) {
+                if (kmmMatches(row.cells[k], arg)) { list.push(kmmText(row.cells[k])); }
+            }
+            item[key] = list;
+        }
+        else if (kind === 'value') {
+            var el = row.querySelector(arg);
+            item[key] = el ? el.value : null;
+        }
+        else if (kind === 'values') {
+            list = [];
+            els = row.querySelectorAll('input, select, textarea');
+            for (k = 0; k < els.length; k++) { list.push(els[k].value); }
+            item[key] = list;
+        }
+    }
+    out.push(item);
+}
+return out;
+"""
+
+
+def compile_schema(schema: Mapping[str, str]) -> List[list]:
+    compiled = []
+    for key, spec in schema.items():
+        kind, _, arg = spec.partition(":")
+        kind = kind.strip().lower()
+        if kind not in _KINDS:
+            raise ValueError(f"Spec de coluna inválida para {key!r}: {spec!r}")
+        if kind in ("value", "attr") and not arg:
+            raise ValueError(f"Spec {spec!r} precisa de argumento (ex.: 'value:input')")
+        compiled.append([key, kind, arg.strip()])
+    return compiled
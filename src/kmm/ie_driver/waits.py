@@ -0,0 +1,266 @@
+"""
+Condições de espera do KMMIEDriver.
+
+Cada condição é um callable no mesmo formato do `expected_conditions` do
+Selenium: recebe o WebDriver e retorna um valor "truthy" quando o sinal de
+prontidão foi atingido. Assim todas funcionam com `WebDriverWait.until`.
+
+Os sinais de página (readyState, overlays de carregamento e requisições
+pendentes) são lidos de todos os frames da janela com UM execute_script por
+polling, para não multiplicar round trips no IEDriverServer.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, Tuple
+
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    WebDriverException,
+)
+
+Condition = Callable[[object], object]
+
+
+@dataclass(frozen=True)
+class Outcome:
+    """Um resultado possível de uma ação, para KMMIEDriver.wait_any (check sem argumentos)."""
+    name: str
+    check: Callable[[], object]
+
+
+@dataclass(frozen=True)
+class WaitTiming:
+    step: str
+    label: str
+    elapsed_s: float
+    budget_s: float
+    satisfied: bool
+
+
+# -----------------------------
+# Scripts injetados (ES5: IE11)
+# -----------------------------
+
+# Instala, em todos os frames da janela, um contador de XHRs pendentes.
+# Idempotente: frames já instrumentados são ignorados.
+TRACK_REQUESTS_JS = """
+function kmmInstall(w) {
+    try {
+        if (w.XMLHttpRequest && !w.__kmmXhr && !w.XMLHttpRequest.prototype.send.__kmm) {
+            var st = w.__kmmXhr = {pending: 0, last: new Date().getTime()};
+            var proto = w.XMLHttpRequest.prototype, send = proto.send;
+            proto.send = function () {
+                var xhr = this, done = false;
+                st.pending++;
+                st.last = new Date().getTime();
+                function fin() {
+                    if (!done && xhr.readyState === 4) {
+                        done = true;
+                        st.pending--;
+                        st.last = new Date().getTime();
+                    }
+                }
+                if (xhr.addEventListener) { xhr.addEventListener('readystatechange', fin, false); }
+                try {
+                    return send.apply(xhr, arguments);
+                } catch (e) {
+                    done = true;
+                    st.pending--;
+                    throw e;
+                }
+            };
+            proto.send.__kmm = true;
+        }
+        for (var i = 0; i < w.frames.length; i++) { kmmInstall(w.frames[i]); }
+    } catch (e) {}
+}
+kmmInstall(window.top);
+return true;
+"""
+
+# Estado agregado da página: readyState de todos os frames, overlays de
+# carregamento visíveis e requisições pendentes (XHR instrumentado + jQuery).
+PAGE_STATE_JS = """
+var overlayIds = arguments[0];
+var now = new Date().getTime();
+var res = {ready: true, overlay: false, pending: 0, idle_ms: 86400000};
+function kmmVisit(w) {
+    var d;
+    try { d = w.document; } catch (e) { return; }
+    if (!d) { return; }
+    if (d.readyState !== 'complete') { res.ready = false; }
+    for (var i = 0; i < overlayIds.length; i++) {
+        var el = d.getElementById(overlayIds[i]);
+        if (el && (el.offsetWidth + el.offsetHeight) > 0) { res.overlay = true; }
+    }
+    try {
+        var st = w.__kmmXhr;
+        if (st) {
+            res.pending += st.pending;
+            res.idle_ms = Math.min(res.idle_ms, now - st.last);
+        }
+        if (w.jQuery && w.jQuery.active) { res.pending += w.jQuery.active; }
+    } catch (e) {}
+    for (var j = 0; j < w.frames.length; j++) { kmmVisit(w.frames[j]); }
+}
+kmmVisit(window.top);
+return res;
+"""
+
+# Marca (ou verifica a marca de) o documento de um frame pelo nome. Depois
+# de uma navegação o documento novo não tem a marca: é o sinal de "frame
+# recarregado".
+FRAME_MARK_JS = """
+var name = arguments[0], mark = arguments[1], setMark = arguments[2];
+function kmmFind(w) {
+    try {
+        for (var i = 0; i < w.frames.length; i++) {
+            var f = w.frames[i];
+            if (f.name === name) { return f; }
+            var r = kmmFind(f);
+            if (r) { return r; }
+        }
+    } catch (e) {}
+    return null;
+}
+var frame = kmmFind(window.top);
+if (!frame) { return null; }
+var doc = frame.document;
+if (setMark) { doc.__kmmMark = mark; return true; }
+return doc.readyState === 'complete' && doc.__kmmMark !== mark;
+"""
+
+
+def _locate(driver, by: str, value: str):
+    try:
+        return driver.find_element(by, value)
+    except (NoSuchElementException, StaleElementReferenceException):
+        return None
+
+
+# -----------------------------
+# Condições
+# -----------------------------
+
+class page_ready:
+    """readyState 'complete' em todos os frames e nenhum overlay de carregamento visível."""
+
+    def __init__(self, overlay_ids: Iterable[str] = ()):
+        self.overlay_ids = list(overlay_ids)
+
+    def __call__(self, driver):
+        try:
+            state = driver.execute_script(PAGE_STATE_JS, self.overlay_ids)
+        except WebDriverException:
+            return False
+        return bool(state and state["ready"] and not state["overlay"])
+
+
+class requests_idle:
+    """Nenhuma requisição pendente há pelo menos `quiet_s` segundos (e página pronta)."""
+
+    def __init__(self, overlay_ids: Iterable[str] = (), quiet_s: float = 0.3):
+        self.overlay_ids = list(overlay_ids)
+        self.quiet_ms = int(quiet_s * 1000)
+
+    def __call__(self, driver):
+        try:
+            state = driver.execute_script(PAGE_STATE_JS, self.overlay_ids)
+        except WebDriverException:
+            return False
+        if not state or not state["ready"] or state["overlay"]:
+            return False
+        return state["pending"] <= 0 and state["idle_ms"] >= self.quiet_ms
+
+
+class frame_loaded:
+    """O frame `name` navegou depois de `mark` ter sido aplicada e terminou de carregar."""
+
+    def __init__(self, name: str, mark: str):
+        self.name = name
+        self.mark = mark
+
+    def __call__(self, driver):
+        try:
+            return bool(driver.execute_script(FRAME_MARK_JS, self.name, self.mark, False))
+        except WebDriverException:
+            return False
+
+
+class value_present:
+    """O atributo `value` do elemento não está vazio. Retorna o valor."""
+
+    def __init__(self, locator: Tuple[str, str]):
+        self.locator = locator
+
+    def __call__(self, driver):
+        el = _locate(driver, *self.locator)
+        if el is None:
+            return False
+        value = el.get_attribute("value")
+        return value or False
+
+
+class value_matches:
+    """O `value` do elemento é `expected` (sem diferenciar maiúsculas/espaços). Retorna o valor."""
+
+    def __init__(self, locator: Tuple[str, str], expected: str):
+        self.locator = locator
+        self.expected = (expected or "").strip().lower()
+
+    def __call__(self, driver):
+        el = _locate(driver, *self.locator)
+        if el is None:
+            return False
+        value = el.get_attribute("value") or ""
+        return value if value.strip().lower() == self.expected else False
+
+
+class value_changed:
+    """O atributo `value` do elemento ficou diferente de `previous`. Retorna o valor novo."""
+
+    def __init__(self, locator: Tuple[str, str], previous: Optional[str]):
+        self.locator = locator
+        self.previous = previous or ""
+
+    def __call__(self, driver):
+        el = _locate(driver, *self.locator)
+        if el is None:
+            return False
+        value = el.get_attribute("value") or ""
+        return value if value != self.previous else False
+
+
+class element_enabled:
+    """Elemento presente, visível e habilitado."""
+
+    def __init__(self, locator: Tuple[str, str]):
+        self.locator = locator
+
+    def __call__(self, driver):
+        el = _locate(driver, *self.locator)
+        if el is None:
+            return False
+        return el if (el.is_displayed() and el.is_enabled()) else False
+
+
+class all_of:
+    """Todas as condições satisfeitas no mesmo polling. Retorna o resultado da última."""
+
+    def __init__(self, *conditions: Condition):
+        self.conditions = conditions
+
+    def __call__(self, driver):
+        result = True
+        for condition in self.conditions:
+            result = condition(driver)
+            if not result:
+                return False
+        return result
+
+
+def new_mark() -> str:
+    return f"kmm{time.monotonic_ns()}"
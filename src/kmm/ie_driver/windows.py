@@ -0,0 +1,103 @@
+"""
+Registro das janelas abertas por uma sessão do KMMIEDriver.
+
+No IE cada troca de janela custa caro e desfaz o contexto de frame. Em vez
+de passar por todas as janelas a cada polling lendo o título, o registro
+guarda handle, título (com o momento da leitura), papel ("home", "repom"...)
+e ordem de criação. Um `window_handles` por polling mostra as janelas novas
+(diff com o registro) e só as candidatas são visitadas:
+
+  - a principal nunca é candidata;
+  - janelas recém-abertas (menos de `settle_s`) têm o título relido sempre,
+    porque ainda estão carregando;
+  - nas demais o título lido vale por `title_ttl_s`; um título conhecido que
+    não bate dispensa a troca.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+HOME = "home"
+
+
+@dataclass
+class WindowInfo:
+    handle: str
+    order: int
+    role: str = ""
+    title: Optional[str] = None
+    title_at: float = 0.0
+    opened_at: float = field(default_factory=time.monotonic)
+
+
+class WindowRegistry:
+    def __init__(self, settle_s: float = 10.0, title_ttl_s: float = 30.0):
+        self.settle_s = settle_s
+        self.title_ttl_s = title_ttl_s
+        self._windows: Dict[str, WindowInfo] = {}
+        self._seq = 0
+
+    def reset(self, home_handle: Optional[str]) -> None:
+        self._windows.clear()
+        self._seq = 0
+        if home_handle:
+            self._add(home_handle, role=HOME)
+
+    def sync(self, handles: Iterable[str]) -> List[WindowInfo]:
+        """Atualiza com o `window_handles` atual; retorna as janelas novas."""
+        handles = list(handles)
+        alive = set(handles)
+        for handle in [h for h in self._windows if h not in alive]:
+            del self._windows[handle]
+        return [self._add(h) for h in handles if h not in self._windows]
+
+    def get(self, handle: str) -> Optional[WindowInfo]:
+        return self._windows.get(handle)
+
+    def handles(self) -> List[str]:
+        return list(self._windows)
+
+    def forget(self, handle: str) -> None:
+        self._windows.pop(handle, None)
+
+    def set_role(self, handle: str, role: str) -> None:
+        info = self._windows.get(handle)
+        if info is not None:
+            info.role = role
+
+    def set_title(self, handle: str, title: str) -> None:
+        info = self._windows.get(handle)
+        if info is not None:
+            info.title = title or ""
+            info.title_at = time.monotonic()
+
+    def title_fresh(self, info: WindowInfo) -> bool:
+        if info.title is None or not info.title:
+            return False
+        now = time.monotonic()
+        if now - info.opened_at < self.settle_s:
+            return False
+        return now - info.title_at < self.title_ttl_s
+
+    def candidates(self, exclude: Iterable[str] = ()) -> List[WindowInfo]:
+        """Janelas não principais fora de `exclude`, da mais nova para a mais antiga."""
+        exclude = set(exclude)
+        return sorted(
+            (w for w in self._windows.values() if w.role != HOME and w.handle not in exclude),
+            key=lambda w: w.order,
+            reverse=True,
+        )
+
+    def describe(self) -> List[dict]:
+        return [
+            {"handle": w.handle, "order": w.order, "role": w.role, "title": w.title}
+            for w in sorted(self._windows.values(), key=lambda w: w.order)
+        ]
+
+    def _add(self, handle: str, role: str = "") -> WindowInfo:
+        info = WindowInfo(handle=handle, order=self._seq, role=role)
+        self._seq += 1
+        self._windows[handle] = info
+        return info
@@ -0,0 +1,106 @@
+"""
+Fachada asyncio sobre KMMActions.
+
+Cada AsyncKMMActions roda as chamadas do seu KMMActions num executor de um
+thread só (o IEDriverServer atende um comando por vez por sessão), então o
+event loop nunca bloqueia em WebDriver. A espera longa do fluxo — o retorno
+da REPOM, até 180s — vira corrotina: o contrato é enviado com park=True e
+as checagens da janela estacionada são intercaladas com asyncio.sleep.
+Esperas curtas (alertas, carregamento de tela) seguem dentro do thread da
+sessão, sem segurar as outras.
+
+Com isso um loop supervisor conduz dezenas de sessões num processo:
+
+    async def tbe(session, item):
+        await session.login(params)
+        number = await session.emitting_contract_repomfretea(**contrato)
+        await session.payment(contract_number=number, cod_pessoa_filial=filial)
+
+    async def main():
+        sessions = [AsyncKMMActions(KMMActions(service=f"JMN-{i}")) for i in range(12)]
+        ...
+        await asyncio.gather(*(tbe(s, item) for s, item in zip(sessions, itens)))
+
+As métricas e o contexto de log (contextvars) acompanham cada chamada.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import exceptions.personalized_exceptions as pe
+from kmm.services.kmm_actions import KMMActions, PendingContract
+
+
+def _delegate(name: str) -> Callable:
+    async def method(self: "AsyncKMMActions", *args: Any, **kwargs: Any) -> Any:
+        return await self.run(getattr(self.kmm, name), *args, **kwargs)
+
+    method.__name__ = name
+    method.__doc__ = f"Versão awaitable de KMMActions.{name} (mesmos parâmetros)."
+    return method
+
+
+class AsyncKMMActions:
+    def __init__(self, kmm: KMMActions, executor: Optional[ThreadPoolExecutor] = None):
+        self.kmm = kmm
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"kmm-{kmm.service}")
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Roda uma chamada bloqueante no executor da sessão."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await loop.run_in_executor(self._executor, call)
+
+    start = _delegate("start")
+    login = _delegate("login")
+    quick_access = _delegate("quick_access")
+    belgo_load_user_profile = _delegate("belgo_load_user_profile")
+    arcelor_load_user_profile = _delegate("arcelor_load_user_profile")
+    emitting_cte = _delegate("emitting_cte")
+    emitting_contract_repomfreted = _delegate("emitting_contract_repomfreted")
+    payment = _delegate("payment")
+    collect_contracts = _delegate("collect_contracts")
+
+    async def submit_contract_repomfretea(self, **kwargs: Any) -> PendingContract:
+        """Envia o contrato e estaciona a janela de retorno (sem esperar o número)."""
+        return await self.run(self.kmm.emitting_contract_repomfretea, park=True, **kwargs)
+
+    async def wait_contract(self, pending: PendingContract) -> str:
+        """Espera (sem bloquear o loop) o número de um contrato estacionado."""
+        while pending.contract_number is None and pending.error is None:
+            # Lido no thread da sessão: outra corrotina pode estar mexendo nas janelas
+            wait_s = await self.run(self.kmm.next_contract_check_in)
+            if wait_s is None:
+                raise pe.KMMContractPendingError(
+                    f"Contrato da placa {pending.license_plate} não está mais estacionado: conferir no KMM"
+                )
+            await asyncio.sleep(wait_s)
+            await self.run(self.kmm.collect_contracts)
+        if pending.error is not None:
+            raise pending.error
+        return pending.contract_number
+
+    async def emitting_contract_repomfretea(self, **kwargs: Any) -> str:
+        """Como KMMActions.emitting_contract_repomfretea, com o retorno da REPOM esperado no loop."""
+        return await self.wait_contract(await self.submit_contract_repomfretea(**kwargs))
+
+    async def stop(self) -> None:
+        await self.run(self.kmm.stop)
+
+    async def close(self) -> None:
+        try:
+            await self.stop()
+        finally:
+            if self._own_executor:
+                self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> "AsyncKMMActions":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
@@ -0,0 +1,84 @@
+"""
+Emissão de contratos REPOMFRETEA em pipeline numa mesma sessão.
+
+No modo normal, depois do btn_confirmar a sessão fica até 180s parada
+esperando o número do contrato na janela de retorno da REPOM. Aqui a janela
+de retorno fica estacionada (KMMActions.emitting_contract_repomfretea com
+park=True) e a janela principal já preenche e envia o próximo item. Entre um
+envio e outro as janelas estacionadas são checadas (uma leitura cada, no
+schedule de polling da etapa repom_retorno) e cada número que chega é
+entregue a `on_number` — tipicamente a quitação do contrato.
+
+O WebDriver do IE atende um comando por vez, então as checagens são
+intercaladas com o trabalho na janela principal, não paralelas.
+
+    pipeline = ContractPipeline(kmm, on_number=pagar, on_error=registrar_falha, max_parked=2)
+    for item in itens:
+        pipeline.submit(item, license_plate=..., route=..., ...)
+    pipeline.drain()
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Optional
+
+from kmm.services.kmm_actions import KMMActions, PendingContract
+
+
+class ContractPipeline:
+    def __init__(
+        self,
+        kmm: KMMActions,
+        on_number: Callable[[Any, str], None],
+        on_error: Callable[[Any, Exception], None],
+        max_parked: int = 2,
+    ):
+        """
+        on_number(tag, contract_number): roda na janela principal, pode usar o KMM.
+        on_error(tag, erro): contrato sem número (prazo, janela perdida) ou
+            falha do próprio on_number.
+        max_parked: janelas da REPOM aguardando ao mesmo tempo.
+        """
+        self.kmm = kmm
+        self.on_number = on_number
+        self.on_error = on_error
+        self.max_parked = max(1, max_parked)
+
+    def submit(self, tag: Any, **contract_kwargs: Any) -> PendingContract:
+        """Envia um contrato e estaciona a janela de retorno (espera vaga se o pipeline estiver cheio)."""
+        self.pump()
+        while len(self.kmm.parked_contracts) >= self.max_parked:
+            self._wait_next_check()
+            self.pump()
+        pending = self.kmm.emitting_contract_repomfretea(park=True, **contract_kwargs)
+        pending.tag = tag
+        return pending
+
+    def pump(self) -> int:
+        """Checa as janelas vencidas e entrega os resultados; retorna quantos saíram."""
+        finished = self.kmm.collect_contracts() if self.kmm.parked_contracts else []
+        for pending in finished:
+            if pending.error is not None:
+                self.on_error(pending.tag, pending.error)
+                continue
+            try:
+                self.on_number(pending.tag, pending.contract_number)
+            except Exception as e:
+                self.on_error(pending.tag, e)
+            finally:
+                self.kmm.driver.switch_to_window(home_window=True)
+        return len(finished)
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Espera todas as janelas estacionadas terminarem (o prazo de cada uma já é o da etapa)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.kmm.parked_contracts:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self._wait_next_check()
+            self.pump()
+
+    def _wait_next_check(self) -> None:
+        wait_s = self.kmm.next_contract_check_in()
+        if wait_s:
+            time.sleep(wait_s)
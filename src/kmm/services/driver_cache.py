@@ -0,0 +1,93 @@
+"""
+Cache placa -> nome do motorista no KMM, com TTL.
+
+Os mesmos caminhões aparecem várias vezes por dia. Com o nome conhecido:
+  - a divergência com o nome esperado aparece antes de abrir a tela e
+    preencher o formulário;
+  - depois de digitar a placa basta uma leitura do campo MOTORISTA quando
+    ele já mostra o nome do cache (sem o polling de até 10s). Isso também
+    evita aceitar o nome da placa anterior que ainda está no campo.
+
+A leitura do KMM é sempre a referência: quando ela diverge do cache a
+entrada é invalidada e regravada com o valor do KMM.
+
+Memória + SQLite local (compartilhado pelos workers, WAL).
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from kmm.services.journal import connect
+
+DEFAULT_PATH = "output/driver_names.sqlite3"
+DEFAULT_TTL_S = 24 * 3600
+
+
+def normalize_plate(plate: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", str(plate or "").upper())
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(str(name or "").lower().split())
+
+
+class DriverNameCache:
+    def __init__(self, path: Optional[str] = DEFAULT_PATH, ttl_s: float = DEFAULT_TTL_S):
+        """path=None mantém o cache só em memória."""
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._memory: Dict[str, Tuple[str, float]] = {}
+        self._conn = None
+        if path:
+            self._conn = connect(path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS driver_names (plate TEXT PRIMARY KEY, name TEXT NOT NULL, ts REAL NOT NULL)"
+            )
+
+    def get(self, plate: str) -> Optional[str]:
+        plate = normalize_plate(plate)
+        if not plate:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(plate)
+            if entry is None and self._conn is not None:
+                # Outro worker pode ter gravado
+                entry = self._conn.execute(
+                    "SELECT name, ts FROM driver_names WHERE plate = ?", (plate,)
+                ).fetchone()
+                if entry is not None:
+                    self._memory[plate] = entry
+            if entry is None:
+                return None
+            name, ts = entry
+            if now - ts > self.ttl_s:
+                self._memory.pop(plate, None)
+                return None
+            return name
+
+    def put(self, plate: str, name: str) -> None:
+        plate, name = normalize_plate(plate), normalize_name(name)
+        if not plate or not name:
+            return
+        now = time.time()
+        with self._lock:
+            self._memory[plate] = (name, now)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO driver_names (plate, name, ts) VALUES (?, ?, ?)", (plate, name, now)
+                )
+
+    def invalidate(self, plate: str) -> None:
+        plate = normalize_plate(plate)
+        with self._lock:
+            self._memory.pop(plate, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM driver_names WHERE plate = ?", (plate,))
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
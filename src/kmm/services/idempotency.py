@@ -0,0 +1,173 @@
+"""
+Índice de idempotência (SQLite) das operações que criam documentos no KMM.
+
+Chaves de negócio:
+    contrato:     (placa, rota, remetente, destinatário, data)
+    complemento:  (cte, série, nº do incidente)
+
+Cada operação passa por:  pending -> submitted -> done
+
+    pending    reservada por um worker, nada enviado ainda; liberada se a
+               operação falhar antes do envio (ou assumida por outro worker
+               depois de stale_pending_s, caso o dono tenha morrido)
+    submitted  enviada ao KMM/REPOM sem resultado registrado: bloqueia até
+               alguém conferir no KMM e limpar a chave (uma recusa explícita
+               do KMM libera a chave na hora: nada foi criado)
+    done       concluída; guarda o resultado (nº do contrato / CT-e)
+
+Itens repetidos param antes de qualquer trabalho no navegador
+(KMMAlreadyProcessedError / KMMOperationInProgressError). O arquivo é
+compartilhado pelos workers (WAL; a reserva é um INSERT atômico).
+
+    python -m kmm.services.idempotency show contract "ABC1D23|15|11222333000181|11444777000161|2026-01-31"
+    python -m kmm.services.idempotency clear contract "..."
+"""
+from __future__ import annotations
+
+import re
+import sys
+import time
+from datetime import date
+from typing import Optional, Tuple
+
+import exceptions.personalized_exceptions as pe
+from kmm.services.journal import connect
+
+CONTRACT = "contract"
+COMPLEMENT = "complement"
+
+PENDING = "pending"
+SUBMITTED = "submitted"
+DONE = "done"
+
+DEFAULT_PATH = "output/idempotency.sqlite3"
+
+
+def _digits(value) -> str:
+    return re.sub(r"\D", "", str(value or ""))
+
+
+def contract_key(license_plate: str, route: str, sender: str, recipient: str, day: Optional[date] = None) -> str:
+    plate = re.sub(r"[^A-Z0-9]", "", str(license_plate or "").upper())
+    day = day or date.today()
+    return "|".join((plate, str(route).strip(), _digits(sender), _digits(recipient), day.isoformat()))
+
+
+def complement_key(cte: str, serie: str, incident_number: Optional[int] = 1) -> str:
+    return "|".join((_digits(cte).lstrip("0"), str(serie).strip(), str(incident_number or 1)))
+
+
+class Claim:
+    """Reserva de uma operação; sem índice configurado é um no-op."""
+
+    def __init__(self, index: Optional["IdempotencyIndex"], kind: str, key: str, owner: str):
+        self.index = index
+        self.kind = kind
+        self.key = key
+        self.owner = owner
+
+    def submitted(self) -> None:
+        if self.index is not None:
+            self.index._set(self.kind, self.key, SUBMITTED)
+
+    def done(self, result: str) -> None:
+        if self.index is not None:
+            self.index._set(self.kind, self.key, DONE, result)
+
+    def release(self) -> None:
+        """Libera a chave se nada foi enviado (falha antes do envio)."""
+        if self.index is not None:
+            self.index._conn.execute(
+                "DELETE FROM operations WHERE kind = ? AND key = ? AND status = ? AND owner = ?",
+                (self.kind, self.key, PENDING, self.owner),
+            )
+
+    def rejected(self) -> None:
+        """Libera a chave após um envio que o KMM recusou (nada foi criado)."""
+        if self.index is not None:
+            self.index._conn.execute(
+                "DELETE FROM operations WHERE kind = ? AND key = ? AND status IN (?, ?) AND owner = ?",
+                (self.kind, self.key, PENDING, SUBMITTED, self.owner),
+            )
+
+
+class IdempotencyIndex:
+    def __init__(self, path: str = DEFAULT_PATH, stale_pending_s: float = 3600):
+        self.path = path
+        self.stale_pending_s = stale_pending_s
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS operations (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                owner TEXT NOT NULL,
+                ts REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            """
+        )
+
+    def get(self, kind: str, key: str) -> Optional[Tuple[str, Optional[str], str, float]]:
+        """(status, resultado, dono, ts) ou None."""
+        return self._conn.execute(
+            "SELECT status, result, owner, ts FROM operations WHERE kind = ? AND key = ?",
+            (kind, key),
+        ).fetchone()
+
+    def check(self, kind: str, key: str) -> None:
+        """Levanta se a operação já foi feita ou está em andamento (só leitura)."""
+        row = self.get(kind, key)
+        if row is not None:
+            self._raise(kind, key, row)
+
+    def claim(self, kind: str, key: str, owner: str) -> Claim:
+        owner = f"{owner}:{id(self)}"
+        now = time.time()
+        inserted = self._conn.execute(
+            "INSERT OR IGNORE INTO operations (kind, key, status, result, owner, ts) VALUES (?, ?, ?, NULL, ?, ?)",
+            (kind, key, PENDING, owner, now),
+        ).rowcount
+        if not inserted:
+            # Reserva abandonada (worker morreu antes de enviar): assume
+            taken = self._conn.execute(
+                "UPDATE operations SET owner = ?, ts = ? WHERE kind = ? AND key = ? AND status = ? AND ts < ?",
+                (owner, now, kind, key, PENDING, now - self.stale_pending_s),
+            ).rowcount
+            if not taken:
+                self._raise(kind, key, self.get(kind, key))
+        return Claim(self, kind, key, owner)
+
+    def clear(self, kind: str, key: str) -> None:
+        self._conn.execute("DELETE FROM operations WHERE kind = ? AND key = ?", (kind, key))
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _set(self, kind: str, key: str, status: str, result: Optional[str] = None) -> None:
+        self._conn.execute(
+            "UPDATE operations SET status = ?, result = COALESCE(?, result), ts = ? WHERE kind = ? AND key = ?",
+            (status, result, time.time(), kind, key),
+        )
+
+    def _raise(self, kind: str, key: str, row) -> None:
+        if row is None:
+            # Liberada entre o INSERT e a leitura: outro worker falhou antes do envio
+            raise pe.KMMOperationInProgressError(f"{kind} {key}: reserva concorrente, tente novamente")
+        status, result, owner, _ = row
+        if status == DONE:
+            raise pe.KMMAlreadyProcessedError(f"{kind} {key} já processado: {result}")
+        raise pe.KMMOperationInProgressError(f"{kind} {key} em andamento ({status}, {owner.split(':')[0]})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("show", "clear"):
+        print("Uso: python -m kmm.services.idempotency show|clear contract|complement <chave>")
+        sys.exit(1)
+    _, action, kind_, key_ = sys.argv
+    index = IdempotencyIndex()
+    if action == "clear":
+        index.clear(kind_, key_)
+    print(index.get(kind_, key_))
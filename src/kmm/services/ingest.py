@@ -0,0 +1,387 @@
+"""
+Leitura em streaming de arquivos de fila (JSONL ou CSV) para os handlers.
+
+O arquivo é lido linha a linha e validado em blocos de `chunk_size` com um
+TypeAdapter(List[modelo]) em cache: um bloco válido custa uma chamada ao
+pydantic; com erro, os erros apontam as linhas ruins pelo índice e o resto
+do bloco é validado de novo. A memória fica no tamanho do bloco (mais um
+hash curto por item já visto, para a deduplicação), seja qual for o arquivo.
+
+Antes da validação cada linha é normalizada:
+    placa         maiúsculas, sem hífen/espaço (ABC-1D23 -> ABC1D23)
+    CNPJ          só dígitos; zeros à esquerda perdidos no Excel são repostos
+    peso          número em kg no formato do KMM (vírgula decimal, sem milhar)
+    demais        texto sem espaços nas pontas (números do JSON viram texto)
+
+Com `preflight` (ex.: kmm.services.preflight.Preflight) os itens válidos
+para o pydantic passam também pelas regras de negócio (placa, dígitos do
+CNPJ, listas de referência do KMM).
+
+Linhas repetidas (mesmo TBE, ou o mesmo contrato — placa/rota/remetente/
+destinatário — já visto no arquivo) e linhas inválidas vão para o arquivo de
+rejeitados (JSONL com linha, motivo e conteúdo original) e nunca chegam ao
+handler: nenhuma sessão do IE é aberta por causa delas.
+
+    ingester = Ingester(JMNItemProcess, rejects_path="output/fila.rejeitados.jsonl")
+    for item in ingester.read("fila.csv"):
+        handler.process(item)
+    print(ingester.stats)
+
+    python -m kmm.services.ingest jmn fila.csv --check
+    python -m kmm.services.ingest vallourec fila.jsonl --batch 10
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Generic, Iterator, List, Optional, Set, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from kmm.helper.str_handler import str_to_float
+from kmm.services import idempotency, preflight as preflight_rules
+from kmm.services.driver_cache import normalize_plate
+from shared.logger import logger
+
+T = TypeVar("T", bound=BaseModel)
+
+PLATE_FIELDS = ("license_plate",)
+CNPJ_FIELDS = ("sender", "recipient")
+WEIGHT_FIELDS = ("weight",)
+
+# Handlers do CLI: nome -> (handler, modelo do item, serviço nas listas de referência)
+HANDLERS = {
+    "jmn": ("jmendes.main:JMN", "jmendes.models:JMNItemProcess", "J Mendes"),
+    "vallourec": ("vallourec.main:VALLOUREC", "vallourec.models:VallourecItemProcess", "Vallourec"),
+}
+
+
+@lru_cache(maxsize=None)
+def _adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+# -----------------------------
+# Normalização
+# -----------------------------
+
+def normalize_cnpj(value: Any) -> str:
+    digits = re.sub(r"\D", "", str(value or ""))
+    if 11 < len(digits) < 14:
+        digits = digits.zfill(14)
+    return digits
+
+
+def normalize_weight(value: Any) -> str:
+    text = str(value or "").strip()
+    if not text:
+        return ""
+    weight = str_to_float(text)
+    if weight <= 0:
+        raise ValueError(f"Peso inválido: {text}")
+    if weight.is_integer():
+        return str(int(weight))
+    return f"{weight:.3f}".rstrip("0").replace(".", ",")
+
+
+def normalize_row(row: Dict[str, Any], fields: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """Normaliza uma linha crua; `fields` limita às colunas do modelo. Levanta ValueError."""
+    clean: Dict[str, Any] = {}
+    for key, value in row.items():
+        key = str(key or "").strip()
+        if not key or (fields is not None and key not in fields):
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if isinstance(value, str):
+            value = value.strip()
+        clean[key] = value
+
+    for key in PLATE_FIELDS:
+        if isinstance(clean.get(key), str):
+            clean[key] = normalize_plate(clean[key])
+    for key in CNPJ_FIELDS:
+        if isinstance(clean.get(key), str):
+            clean[key] = normalize_cnpj(clean[key])
+    for key in WEIGHT_FIELDS:
+        if isinstance(clean.get(key), str):
+            try:
+                clean[key] = normalize_weight(clean[key])
+            except ValueError as e:
+                raise ValueError(f"{key}: {e}") from None
+    return clean
+
+
+# -----------------------------
+# Leitura
+# -----------------------------
+
+def _jsonl_rows(handle: io.TextIOBase) -> Iterator[Tuple[int, Any]]:
+    for line_no, line in enumerate(handle, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, ValueError(f"JSON inválido: {e.msg}")
+
+
+def _csv_rows(handle: io.TextIOBase) -> Iterator[Tuple[int, Any]]:
+    sample = handle.read(4096)
+    handle.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(handle, dialect=dialect)
+    for row in reader:
+        if not any((value or "").strip() for value in row.values() if isinstance(value, str)):
+            continue
+        # Cabeçalho na linha 1
+        yield reader.line_num, row
+
+
+def read_rows(path: str) -> Iterator[Tuple[int, Any]]:
+    """(nº da linha, dict) lidos sob demanda; linha ilegível vem como ValueError."""
+    with open(path, encoding="utf-8-sig", newline="") as handle:
+        if path.lower().endswith(".csv"):
+            yield from _csv_rows(handle)
+        else:
+            yield from _jsonl_rows(handle)
+
+
+# -----------------------------
+# Ingestão
+# -----------------------------
+
+@dataclass
+class IngestStats:
+    read: int = 0
+    valid: int = 0
+    invalid: int = 0
+    duplicated: int = 0
+
+    @property
+    def rejected(self) -> int:
+        return self.invalid + self.duplicated
+
+
+class Ingester(Generic[T]):
+    def __init__(
+        self,
+        model: Type[T],
+        rejects_path: Optional[str] = None,
+        chunk_size: int = 500,
+        dedupe: bool = True,
+        preflight: Optional[Callable[[T], List[str]]] = None,
+    ):
+        """
+        rejects_path: JSONL de rejeitados (criado só se houver rejeição);
+            None só registra no log.
+        dedupe: descarta TBE repetido e contrato repetido no mesmo arquivo.
+        preflight(item): motivos de reprovação do item (vazio = válido).
+        """
+        self.model = model
+        self.rejects_path = rejects_path
+        self.chunk_size = max(1, chunk_size)
+        self.dedupe = dedupe
+        self.preflight = preflight
+        self.stats = IngestStats()
+        self.log = logger.bind(ingest=model.__name__)
+        self._fields = set(model.model_fields)
+        self._seen: Set[bytes] = set()
+        self._rejects: Optional[io.TextIOBase] = None
+
+    def read(self, path: str) -> Iterator[T]:
+        """Itens válidos do arquivo, na ordem, conforme são lidos."""
+        try:
+            chunk: List[Tuple[int, Any, Dict[str, Any]]] = []
+            for line_no, row in read_rows(path):
+                self.stats.read += 1
+                if isinstance(row, Exception):
+                    self._reject(line_no, str(row), None)
+                    continue
+                if not isinstance(row, dict):
+                    self._reject(line_no, "linha não é um objeto", row)
+                    continue
+                try:
+                    chunk.append((line_no, row, normalize_row(row, self._fields)))
+                except ValueError as e:
+                    self._reject(line_no, str(e), row)
+                    continue
+                if len(chunk) >= self.chunk_size:
+                    yield from self._validate(chunk)
+                    chunk = []
+            if chunk:
+                yield from self._validate(chunk)
+        finally:
+            self.close()
+            self.log.info(
+                f"{path}: {self.stats.read} linhas, {self.stats.valid} válidas, "
+                f"{self.stats.invalid} inválidas, {self.stats.duplicated} repetidas"
+            )
+
+    def close(self) -> None:
+        if self._rejects is not None:
+            self._rejects.close()
+            self._rejects = None
+
+    def _validate(self, chunk: List[Tuple[int, Any, Dict[str, Any]]]) -> Iterator[T]:
+        adapter = _adapter(self.model)
+        try:
+            items = adapter.validate_python([clean for _, _, clean in chunk])
+        except ValidationError as e:
+            errors: Dict[int, List[str]] = defaultdict(list)
+            for error in e.errors(include_url=False):
+                index, *loc = error["loc"]
+                errors[index].append(f"{'.'.join(map(str, loc)) or 'linha'}: {error['msg']}")
+            for index in sorted(errors):
+                line_no, row, _ = chunk[index]
+                self._reject(line_no, "; ".join(errors[index]), row)
+            chunk = [entry for index, entry in enumerate(chunk) if index not in errors]
+            items = adapter.validate_python([clean for _, _, clean in chunk])
+
+        for (line_no, row, _), item in zip(chunk, items):
+            problems = self.preflight(item) if self.preflight is not None else []
+            if problems:
+                self._reject(line_no, "; ".join(problems), row)
+                continue
+            reason = self._duplicate(item)
+            if reason:
+                self.stats.duplicated += 1
+                self._reject(line_no, reason, row, count=False)
+                continue
+            self.stats.valid += 1
+            yield item
+
+    def _duplicate(self, item: T) -> Optional[str]:
+        if not self.dedupe:
+            return None
+        keys = []
+        tbe = getattr(item, "tbe", None)
+        if tbe:
+            keys.append(("TBE repetido", f"tbe|{tbe}"))
+        if all(hasattr(item, name) for name in ("license_plate", "route", "sender", "recipient")):
+            key = idempotency.contract_key(item.license_plate, item.route, item.sender, item.recipient)
+            keys.append(("contrato repetido (placa/rota/remetente/destinatário)", f"contract|{key}"))
+
+        digests = [(reason, hashlib.blake2b(key.encode(), digest_size=8).digest()) for reason, key in keys]
+        for reason, digest in digests:
+            if digest in self._seen:
+                return reason
+        self._seen.update(digest for _, digest in digests)
+        return None
+
+    def _reject(self, line_no: int, reason: str, row: Any, count: bool = True) -> None:
+        if count:
+            self.stats.invalid += 1
+        self.log.warning(f"Linha {line_no} rejeitada: {reason}")
+        if self.rejects_path is None:
+            return
+        if self._rejects is None:
+            directory = os.path.dirname(self.rejects_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._rejects = open(self.rejects_path, "a", encoding="utf-8")
+        self._rejects.write(json.dumps({"line": line_no, "reason": reason, "row": row}, ensure_ascii=False, default=str) + "\n")
+        self._rejects.flush()
+
+
+# -----------------------------
+# Alimentação dos handlers
+# -----------------------------
+
+def load(target: str) -> Any:
+    """Objeto a partir de 'modulo:nome' (ex.: HANDLERS)."""
+    module, name = target.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _chunks(items: Iterator[T], size: int) -> Iterator[List[T]]:
+    chunk: List[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def feed(handler_factory: Callable[[], Any], items: Iterator[T], batch: int = 0) -> Dict[str, Optional[str]]:
+    """
+    Entrega os itens ao handler (process, ou process_batch em lotes de
+    `batch`). O handler só é criado com o primeiro item válido.
+    Retorna {tbe: erro ou None}.
+    """
+    handler = None
+    results: Dict[str, Optional[str]] = {}
+    try:
+        groups = _chunks(items, batch) if batch > 1 else ([item] for item in items)
+        for group in groups:
+            if handler is None:
+                handler = handler_factory()
+            if batch > 1:
+                for tbe, error in handler.process_batch(group).items():
+                    results[tbe] = None if error is None else str(error)
+                continue
+            item = group[0]
+            try:
+                handler.process(item)
+                results[item.tbe] = None
+            except Exception as e:
+                logger.error(f"TBE {item.tbe}: {e}")
+                results[item.tbe] = str(e)
+    finally:
+        if handler is not None and hasattr(handler, "close"):
+            handler.close()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Processa um arquivo de fila (JSONL ou CSV)")
+    parser.add_argument("handler", choices=sorted(HANDLERS))
+    parser.add_argument("path")
+    parser.add_argument("--rejects", help="JSONL de rejeitados (padrão: <arquivo>.rejeitados.jsonl)")
+    parser.add_argument("--chunk", type=int, default=500, help="linhas por validação")
+    parser.add_argument("--batch", type=int, default=0, help="usa process_batch com lotes deste tamanho")
+    parser.add_argument("--check", action="store_true", help="só valida, sem abrir o KMM")
+    parser.add_argument("--reference", default=os.getenv("KMM_REFERENCE_PATH", preflight_rules.DEFAULT_PATH),
+                        help="listas de referência do KMM (JSON)")
+    args = parser.parse_args()
+
+    handler_path, model_path, service = HANDLERS[args.handler]
+    rejects = args.rejects or f"{os.path.splitext(args.path)[0]}.rejeitados.jsonl"
+    ingester = Ingester(
+        load(model_path),
+        rejects_path=rejects,
+        chunk_size=args.chunk,
+        preflight=preflight_rules.Preflight(args.reference, service=service),
+    )
+    items = ingester.read(args.path)
+
+    if args.check:
+        for _ in items:
+            pass
+        print(json.dumps({**asdict(ingester.stats), "rejects": rejects if ingester.stats.rejected else None}))
+        return 1 if ingester.stats.rejected else 0
+
+    results = feed(load(handler_path), items, batch=args.batch)
+    failed = sum(1 for error in results.values() if error is not None)
+    print(json.dumps({**asdict(ingester.stats), "processed": len(results), "failed": failed}))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Diário (SQLite) das etapas concluídas de cada item da fila.
+
+JMN.process / VALLOUREC.process gravam uma linha a cada fronteira de etapa:
+
+    logged_in -> contract_submitted -> contract_number -> payment_done
+
+Se o robô morrer no meio, a próxima execução do mesmo item (mesmo serviço
+e mesmo id, ex.: TBE) retoma da última etapa concluída: com o número do
+contrato já obtido vai direto para a quitação; com a quitação feita não faz
+nada. Um contrato enviado à REPOM sem número registrado NÃO é reenviado
+(risco de contrato duplicado): o item falha com KMMContractPendingError até
+alguém conferir no KMM e limpar o diário.
+
+Várias instâncias (workers) podem usar o mesmo arquivo: WAL + busy timeout.
+Dentro de um processo, cada thread usa a sua conexão (SharedConnection).
+
+    python -m kmm.services.journal show "J Mendes" 123456
+    python -m kmm.services.journal clear "J Mendes" 123456
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+LOGGED_IN = "logged_in"
+CONTRACT_SUBMITTED = "contract_submitted"
+CONTRACT_NUMBER = "contract_number"
+PAYMENT_DONE = "payment_done"
+
+STEPS = (LOGGED_IN, CONTRACT_SUBMITTED, CONTRACT_NUMBER, PAYMENT_DONE)
+
+DEFAULT_PATH = "output/journal.sqlite3"
+
+
+def _open(path: str) -> sqlite3.Connection:
+    # check_same_thread=False só para o close() vindo de outro thread; o uso é sempre do thread dono
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SharedConnection:
+    """
+    Conexão SQLite que pode ser usada de vários threads (ex.: o executor do
+    AsyncKMMActions chamando o índice criado no thread principal): cada
+    thread abre a sua no primeiro uso. close() fecha todas.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns: List[sqlite3.Connection] = []
+        # Abre já a do thread atual: caminho inválido falha aqui, não no primeiro uso
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _open(self.path)
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def execute(self, sql: str, params: Any = ()) -> sqlite3.Cursor:
+        return self._conn().execute(sql, params)
+
+    def executemany(self, sql: str, params: Any) -> sqlite3.Cursor:
+        return self._conn().executemany(sql, params)
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._conns = self._conns, []
+        self._local = threading.local()
+        for conn in conns:
+            conn.close()
+
+
+def connect(path: str) -> SharedConnection:
+    """Conexão SQLite para uso concorrente entre processos e threads (WAL, autocommit)."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    return SharedConnection(path)
+
+
+class StepJournal:
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._conn = connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS steps (
+                service TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                step TEXT NOT NULL,
+                ts REAL NOT NULL,
+                data TEXT NOT NULL DEFAULT '{}',
+                PRIMARY KEY (service, item_id, step)
+            )
+            """
+        )
+
+    def record(self, service: str, item_id: str, step: str, **data: Any) -> None:
+        if step not in STEPS:
+            raise ValueError(f"Etapa desconhecida: {step}")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO steps (service, item_id, step, ts, data) VALUES (?, ?, ?, ?, ?)",
+            (service, str(item_id), step, time.time(), json.dumps(data, ensure_ascii=False)),
+        )
+
+    def completed(self, service: str, item_id: str) -> Dict[str, Dict[str, Any]]:
+        """{etapa: dados} das etapas já concluídas do item."""
+        rows = self._conn.execute(
+            "SELECT step, data FROM steps WHERE service = ? AND item_id = ?",
+            (service, str(item_id)),
+        ).fetchall()
+        return {step: json.loads(data) for step, data in rows}
+
+    def last_step(self, service: str, item_id: str) -> Optional[str]:
+        done = self.completed(service, item_id)
+        return next((step for step in reversed(STEPS) if step in done), None)
+
+    def clear(self, service: str, item_id: str) -> None:
+        self._conn.execute("DELETE FROM steps WHERE service = ? AND item_id = ?", (service, str(item_id)))
+
+    def item(self, service: str, item_id: str) -> "ItemJournal":
+        return ItemJournal(self, service, str(item_id))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class ItemJournal:
+    """Visão do diário de um item (serviço + id)."""
+
+    def __init__(self, journal: StepJournal, service: str, item_id: str):
+        self.journal = journal
+        self.service = service
+        self.item_id = item_id
+        self._done = journal.completed(service, item_id)
+
+    def done(self, step: str) -> bool:
+        return step in self._done
+
+    def get(self, step: str, key: str, default: Any = None) -> Any:
+        return self._done.get(step, {}).get(key, default)
+
+    def record(self, step: str, **data: Any) -> None:
+        self.journal.record(self.service, self.item_id, step, **data)
+        self._done[step] = data
+
+    @property
+    def last_step(self) -> Optional[str]:
+        return next((step for step in reversed(STEPS) if step in self._done), None)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("show", "clear"):
+        print("Uso: python -m kmm.services.journal show|clear <serviço> <item_id>")
+        sys.exit(1)
+    _, action, service_name, item = sys.argv
+    journal = StepJournal()
+    if action == "clear":
+        journal.clear(service_name, item)
+    print(json.dumps(journal.completed(service_name, item), indent=2, ensure_ascii=False))
@@ -1,27 +1,96 @@
 from __future__ import annotations
 from kmm.ie_driver.ie_driver import KMMIEDriver
 from dataclasses import dataclass
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Dict, Iterator, List, Tuple
 from kmm.helper.find_management import find_management
 from kmm.helper.str_handler import str_to_float
 from kmm.helper.kmm_password_generator import password_generate
-import time
 from urllib.parse import unquote
+from selenium.webdriver.support import expected_conditions as EC
+from kmm.ie_driver import waits
+from kmm.helper import metrics
+from kmm.services import idempotency, results
+from kmm.services.driver_cache import DriverNameCache, normalize_name
 import exceptions.personalized_exceptions as pe
 import re
+import time
 from shared.logger import logger
 
+# Estado da sessão lido em um único script: frame principal na janela e
+# formulário de login em algum frame (KMM redireciona para o login quando a
+# sessão expira, às vezes só dentro do iconteudo).
+SESSION_STATE_JS = """
+var res = {principal: !!document.getElementById('principal'), login: false};
+function kmmVisit(w) {
+    try {
+        var d = w.document;
+        if (d.getElementById('SENHA') && d.getElementById('USUARIO')) { res.login = true; }
+        for (var i = 0; i < w.frames.length; i++) { kmmVisit(w.frames[i]); }
+    } catch (e) {}
+}
+kmmVisit(window);
+return res;
+"""
+
 @dataclass(frozen=True)
 class LoginParams:
     url: str
     username: str
     password: str
 
+
+@dataclass
+class PendingContract:
+    """Contrato enviado à REPOM cuja janela de retorno ficou estacionada (pipeline)."""
+    handle: str
+    license_plate: str
+    claim: idempotency.Claim
+    deadline: float
+    intervals: Iterator[float]
+    next_check_at: float = 0.0
+    contract_number: Optional[str] = None
+    error: Optional[Exception] = None
+    # Livre para quem submete (ex.: item da fila)
+    tag: Any = None
+    # Item do contexto no envio (results.item_context), para o registro do resultado
+    item_id: str = ""
+
+SessionKey = Tuple[str, str, str]  # (url, username, management)
+
 class KMMActions:
-    def __init__(self, service: str, driver: KMMIEDriver | None = None, config = None):
+    # Modal de quitação dentro do frame principal. Sem name/id estável conhecido
+    # no KMM de produção; troque por 'name:...' quando confirmado.
+    payment_frame = "xpath:/html/body/table/tbody/tr[1]/td[2]/table/tbody/tr[4]/td/iframe"
+
+    def __init__(
+            self,
+            service: str,
+            driver: KMMIEDriver | None = None,
+            config = None,
+            session_max_idle_s: Optional[float] = None,
+            idempotency_index: Optional[idempotency.IdempotencyIndex] = None,
+            driver_name_cache: Optional[DriverNameCache] = None,
+            result_sink: Optional[results.ResultSink] = None,
+    ):
         self.driver = driver or KMMIEDriver(config)
         self._started = False
+        self.service = service
         self.log = logger.bind(service=service)
+
+        # Sessão autenticada atual; None força login no próximo login()
+        self._session: Optional[SessionKey] = None
+        self._session_last_used = 0.0
+        # Ociosidade após a qual nem vale checar a sessão (timeout do KMM)
+        self.session_max_idle_s = session_max_idle_s
+        # Reserva contratos/complementos por chave de negócio (None = sem checagem)
+        self.idempotency = idempotency_index
+        # Placa -> motorista no KMM (None = sempre lê do KMM com polling)
+        self.driver_names = driver_name_cache
+        # Contratos, CT-es e quitações para a conciliação (None = só log)
+        self.results = result_sink
+        # Janelas de retorno da REPOM estacionadas (handle -> contrato), modo pipeline
+        self._parked: Dict[str, PendingContract] = {}
+        self._dropped: List[PendingContract] = []
     
     # --- lifecycle ---
     def start(self) -> None:
@@ -33,6 +102,7 @@ class KMMActions:
         if self._started:
             self.driver.stop()
             self._started = False
+        self._session = None
 
     def __enter__(self) -> "KMMActions":
         self.start()
@@ -41,13 +111,65 @@ class KMMActions:
     def __exit__(self, exc_type, exc, tb) -> None:
         self.stop()
     
+    # --- Sessão ---
+
+    @staticmethod
+    def _session_key(params: LoginParams, management: str) -> SessionKey:
+        branch = 'levo' if 'levo' in management.lower().lstrip() else 'freto'
+        return params.url, params.username, branch
+
+    def invalidate_session(self) -> None:
+        self._session = None
+
+    def _session_alive(self) -> bool:
+        """Checagem barata (um script) de que a janela principal segue logada."""
+        try:
+            self.driver.switch_to_window(home_window=True)
+            self.driver.switch_to_default()
+            state = self.driver.execute_js(SESSION_STATE_JS)
+        except Exception as e:
+            self.log.info(f"Sessão não pôde ser verificada: {e}")
+            return False
+        return bool(state and state.get('principal') and not state.get('login'))
+
+    def _can_reuse_session(self, key: SessionKey) -> bool:
+        if not self._started or self._session is None:
+            return False
+        if self._session != key:
+            self.log.info("Troca de usuário/filial, refazendo login")
+            return False
+        idle = time.monotonic() - self._session_last_used
+        if self.session_max_idle_s is not None and idle > self.session_max_idle_s:
+            self.log.info(f"Sessão ociosa há {idle:.0f}s, refazendo login")
+            return False
+        if not self._session_alive():
+            self.log.info("Sessão expirada ou redirecionada para o login, refazendo login")
+            return False
+        return True
+
+    def _claim(self, kind: str, key: str) -> idempotency.Claim:
+        if self.idempotency is None:
+            return idempotency.Claim(None, kind, key, self.service)
+        return self.idempotency.claim(kind, key, owner=self.service)
+
     # --- Ações ---
 
-    def login(self, params: LoginParams, management: str = 'freto'):
+    @metrics.timed()
+    def login(self, params: LoginParams, management: str = 'freto', force: bool = False):
+        key = self._session_key(params, management)
+        if not force and self._can_reuse_session(key):
+            self.log.info("Sessão ainda válida, login reaproveitado")
+            self._session_last_used = time.monotonic()
+            return
+
         try:
             self.start()
 
             self.log.info("Iniciando login")
+            if self._session is not None:
+                # Havia outra sessão: limpa cookies para o KMM mostrar o formulário de login
+                self.driver.delete_all_cookies()
+            self._session = None
             self.driver.open(params.url)
             self.driver.safe_type(locator="id:USUARIO", text=params.username)
             self.driver.safe_type(locator="id:SENHA", text=params.password)
@@ -58,29 +180,41 @@ class KMMActions:
                 self.driver.safe_click(locator="xpath://label[normalize-space()='Freto Log']/input")
 
             self.driver.safe_click(locator="xpath://button[@title='Entrar']")
-            time.sleep(5)
+            self.driver.wait_until(
+                waits.all_of(
+                    waits.page_ready(self.driver.config.loading_overlay_ids),
+                    EC.presence_of_element_located((self.driver._by('id'), 'principal')),
+                ),
+                step="login",
+                raise_on_timeout=False,
+            )
+            if self._session_alive():
+                self._session = key
+                self._session_last_used = time.monotonic()
             self.log.info("Fim do Login")
         except Exception as e:
+            self._session = None
             raise pe.KMMLoginError(
                 f"Erro ao realizar o login no KMM | Usuario: {params.username} - Filial: {management}"
             ) from e
         
+    @metrics.timed()
     def quick_access(self, term: str):
 
         try:
-            self.driver.switch_to_default()
             self.log.info(f"Acessando menu {term} via acesso rápido")
-            self.driver.wait_present("id:principal")
             self.driver.switch_to_frame(principal=True)
             self.driver.safe_type(locator="id:ACESSO_RAPIDO", text=term)
+            mark = self.driver.mark_frame("iconteudo")
             self.driver.safe_click("xpath://button[contains(@class, 'botao-16x16')]")
-            time.sleep(5)
+            self.driver.wait_frame_loaded("iconteudo", mark, step="quick_access")
             self.log.info("Fim do acesso rápido")
         except Exception as e:
             raise pe.KMMQuickAccessError(
                 f"Falha ao acessar o menu {term} via acesso rápido."
             ) from e
 
+    @metrics.timed()
     def belgo_load_user_profile(self, user: str, management: str, lotation: str):
 
         try:
@@ -97,6 +231,7 @@ class KMMActions:
                 f"Falha ao realizar lotação para o usuário {user} para a filial {management}"
             ) from e
 
+    @metrics.timed()
     def arcelor_load_user_profile(self, user: str, management: str, center: str):
 
         try:
@@ -121,19 +256,47 @@ class KMMActions:
             self.driver.switch_to_frame(principal=False)
             self.driver.select_by_value("id:USUARIO", user)
             self.driver.safe_click("xpath://button[contains(@class, 'botao-16x16')]")
-            user_lotation = self.driver.safe_get_attribute(locator=f"xpath://tr[td[normalize-space()='{value}']]", attribute='class')
+            rows = self.driver.extract_table(
+                locator=f"xpath://tr[td[normalize-space()='{value}']]/ancestor::table[1]",
+                schema={'cells': 'cells', 'class': 'class'},
+            )
+            user_lotation = next((row['class'] for row in rows if value in row['cells']), None)
+            if user_lotation is None:
+                raise Exception(f"Filial {value} não encontrada na lista de lotações")
             if not 'destaque' in user_lotation:
+                mark = self.driver.mark_frame("iconteudo")
                 self.driver.safe_click(
                     f"xpath://tr[td[normalize-space()='{value}']]//button[.//img[@alt='Lotar']]"
                 )
                 alert_text = self.driver.accept_alert()
-                time.sleep(3)
+                self.driver.wait_frame_loaded("iconteudo", mark, step="lotacao")
 
                 if not 'lotado com sucesso' in alert_text:
                     raise Exception(f"Falha ao lotar o usuário: {user} com filial {value}")
         except Exception as e:
             raise Exception(f"Falha ão mapeada ao lotar o usuário: {user}") from e
 
+    def _confirm_outcome(self, step: str, exclude=(), extra=()) -> Tuple[Optional[str], Any]:
+        """
+        Resultado do btn_confirmar numa espera só: alerta ("alert", alerta),
+        janela "Alerta" do KMM ("erro", mensagem decodificada; a janela é
+        fechada) ou um dos `extra`. (None, None) se nada apareceu.
+        """
+        outcome, value = self.driver.wait_any(
+            [
+                self.driver.alert_outcome(),
+                self.driver.window_outcome("Alerta", name="erro", exclude=exclude),
+                *extra,
+            ],
+            step=step,
+        )
+        if outcome == "erro":
+            message = unquote(self.driver.safe_get_attribute('name:MENSAGEM', 'value') or "")
+            self.driver.close_handle(value)
+            self.driver.switch_to_window(home_window=True)
+            return outcome, message
+        return outcome, value
+
     def _status_cte(self, cte: str, serie: str) -> Any:
         try:
             self.driver.switch_to_frame(principal=False)
@@ -151,41 +314,70 @@ class KMMActions:
                 f"Falha ao obter o status do cte para gerar o comploemento. Cte {cte} Serie {serie}"
             ) from e
 
-    def _get_driver_name(self) -> str | None:
-        for i in range(10):
-            self.driver.switch_to_frame(principal=False)
-            self.driver.safe_get_text(locator='id:MOTORISTA')
-            kmm_driver_name = self.driver.safe_get_attribute(locator='id:MOTORISTA', attribute='value')
+    def _get_driver_name(self, license_plate: Optional[str] = None) -> str | None:
+        self.driver.switch_to_frame(principal=False)
+
+        cached = self.driver_names.get(license_plate) if self.driver_names and license_plate else None
+        if cached:
+            # Uma leitura basta se o campo já mostra o motorista conhecido
+            kmm_driver_name = self.driver.wait_value_matches('id:MOTORISTA', cached, step="motorista_cache")
             if kmm_driver_name:
                 return kmm_driver_name.lower().lstrip()
-            else:
-                time.sleep(1)
-        return None
+
+        kmm_driver_name = self.driver.wait_value_present(locator='id:MOTORISTA', step="motorista")
+        if not kmm_driver_name:
+            return None
+
+        if self.driver_names and license_plate:
+            if cached:
+                self.log.info(f"Motorista da placa {license_plate} mudou no KMM, atualizando cache")
+            self.driver_names.put(license_plate, kmm_driver_name)
+        return kmm_driver_name.lower().lstrip()
+
+    def _check_cached_driver_name(self, license_plate: str, driver_name: str) -> None:
+        """Divergência já conhecida pelo cache: falha antes de abrir a tela e preencher o formulário."""
+        if not self.driver_names:
+            return
+        cached = self.driver_names.get(license_plate)
+        if cached and cached != normalize_name(driver_name):
+            # Invalida: a próxima tentativa confere no KMM
+            self.driver_names.invalidate(license_plate)
+            raise pe.KMMGetDriverNameError(
+                f"Divergência no nome do motorista (cache). Placa {license_plate}: esperado {driver_name}, KMM {cached}"
+            )
 
     def _get_taxes(self) -> float:
 
         try:
             self.driver.switch_to_frame(principal=False)
             self.driver.safe_click('id:td_impostos_title', timeout=60)
-            time.sleep(3)
-            tax_table = self.driver.wait_present('id:tb_lista_IMPOSTOS')
-            rows = tax_table.find_elements(self.driver._by('css'), "tr[id^='tr_lista_IMPOSTOS_']")
+            self.driver.wait_until(
+                waits.all_of(
+                    waits.requests_idle(self.driver.config.loading_overlay_ids, self.driver.config.requests_quiet_s),
+                    EC.visibility_of_element_located((self.driver._by('id'), 'tb_lista_IMPOSTOS')),
+                ),
+                step="impostos",
+                raise_on_timeout=False,
+            )
+            rows = self.driver.extract_table(
+                'id:tb_lista_IMPOSTOS',
+                schema={
+                    'cells': 'cells:td.linha_1',
+                    'aliquota': "value:input[id^='ALIQUOTA_IMPOSTOS_']",
+                    'descricao': "value:input[id^='DESCRICAO_IMPOSTOS_']",
+                },
+                row_selector="tr[id^='tr_lista_IMPOSTOS_']",
+            )
 
             for row in rows:
-                cols = row.find_elements(self.driver._by('css'), "td.linha_1")
-                if not cols:
+                if not any('icms' in col.lower() for col in row['cells']):
                     continue
-                for idx, col in enumerate(cols):
-                    if 'icms' in col.text.lower():
-                        idx = row.get_attribute("id").split("_")[-1]
-                        icms_aliquota = row.find_element(self.driver._by('id'), f"ALIQUOTA_IMPOSTOS_{idx}").get_attribute(
-                            "value")
-                        icms_descricao = row.find_element(self.driver._by('id'), f"DESCRICAO_IMPOSTOS_{idx}").get_attribute(
-                            "value")
-
-                        if 'presumido' not in icms_descricao:
-                            self.log.info(f"Imposto encontrado: {icms_descricao} com alíquota {icms_aliquota}")
-                            return str_to_float(icms_aliquota)
+                icms_aliquota = row['aliquota']
+                icms_descricao = row['descricao'] or ''
+
+                if 'presumido' not in icms_descricao:
+                    self.log.info(f"Imposto encontrado: {icms_descricao} com alíquota {icms_aliquota}")
+                    return str_to_float(icms_aliquota)
         except Exception as e:
             raise pe.KMMGetTaxesError("Não foi possível obter os impostos.") from e
 
@@ -203,6 +395,8 @@ class KMMActions:
         except Exception as e:
             raise Exception("Falha não mapeada ao clicar no menu negociação") from e
 
+    @metrics.timed()
+    @results.recorded(results.CTE, inputs=('cte', 'serie', 'incident_number'))
     def emitting_cte(
             self,
             cte: str,
@@ -215,6 +409,7 @@ class KMMActions:
             incident_number: Optional[int] = 1
     ) -> str:
 
+        claim = self._claim(idempotency.COMPLEMENT, idempotency.complement_key(cte, serie, incident_number))
         try:
             self.quick_access('ectecomp')
             status = self._status_cte(cte, serie)
@@ -259,7 +454,7 @@ class KMMActions:
                         f_calculos();
                     """
                 )
-                time.sleep(7)
+                self.driver.wait_requests_idle(step="calculos")
                 saved_value = self.driver.safe_get_attribute('id:VARIAVEL_VALORUNITARIOFRETE_CALC', 'value')
 
                 if saved_value != str_value_with_no_tax:
@@ -287,84 +482,205 @@ class KMMActions:
 
             self.driver.switch_to_frame(principal=True)
 
+            claim.submitted()
             self.driver.safe_click('id:btn_confirmar')
-            alert = self.driver.wait_alert(10)
-            if not alert:
-                window = self.driver.switch_to_window("Alerta", timeout=10)
-                if window:
-                    message = self.driver.safe_get_attribute('name:MENSAGEM', 'value')
-                    decoded_message = unquote(message)
-                    raise Exception(f"Não foi possível emitir o CT-e de complemento devido a: {decoded_message}")
+            outcome, value = self._confirm_outcome(
+                "cte_confirmar",
+                exclude=self._parked,
+                extra=[self.driver.window_outcome("Engenharia de Sistemas", name="cte", exclude=self._parked)],
+            )
+            if outcome is None:
                 raise pe.KMMEmittingCTeError("Pop-up de confirmação não apareceu")
-
-            window = self.driver.switch_to_window(target_title="Engenharia de Sistemas")
-
-            if not window:
-                raise Exception(f"Janela com o cte de complemento não encontrado")
+            if outcome == "erro":
+                # Recusa definitiva do KMM: o CT-e não existe, a chave não pode ficar presa em SUBMITTED
+                claim.rejected()
+                raise Exception(f"Não foi possível emitir o CT-e de complemento devido a: {value}")
+
+            if outcome == "alert":
+                window = self.driver.switch_to_window(target_title="Engenharia de Sistemas")
+                if not window:
+                    raise Exception(f"Janela com o cte de complemento não encontrado")
             self.driver.switch_to_frame(principal=False)
 
             cte_complement = self.driver.safe_get_text("xpath:/html/body/form/table/tbody/tr[1]/td[1]/fieldset/table/tbody/tr[2]/td[2]")
-            self.driver.close_window()
+            claim.done(cte_complement)
+            self.driver.close_window(keep=self._parked)
             self.driver.switch_to_window(home_window=True)
             return cte_complement
         except pe.KMMProcess:
+            claim.release()
             raise
         except Exception as e:
+            claim.release()
             raise pe.KMMEmittingCTeError(
                 f"Falha ao emitir CTe de complemento para o Cte {cte} Serie {serie} Valor {cte_value} Filial {management}"
                 f"Motorista {driver_name}."
             ) from e
 
+    @metrics.timed('repom_retorno')
     def _get_contract_number(self) -> str:
         try:
-            for _ in range(18):
-
+            def _read_contract_number():
                 self.log.info("Obtendo o número do contrato através do retorno da REPOM")
-
-                contract_number = self.driver.safe_get_text(
+                return self.driver.safe_get_text(
                     "xpath:/html/body/form/table/tbody/tr/td/fieldset/table/tbody/tr[3]/td[2]"
                 )
 
-                if contract_number:
-                    self.log.info("Contrato obtido com sucesso")
-                    self.driver.close_window()
-                    self.driver.switch_to_window(home_window=True)
-                    return contract_number
-
+            def _refresh():
                 self.log.info("Número do encontrado ainda não disponível...")
-
-                time.sleep(10)
                 self.driver.safe_click(
                     "xpath:/html/body/form/table/tbody/tr/td/fieldset/table/tbody/tr[8]/td[2]/button"
                 )
+                self.driver.wait_page_ready(step="repom_atualizar")
 
-            self.log.error("Tempo de 180 segundos excedido")
-            raise Exception("Falha ao obter o retorno da REPOM. Tempo de 180 segundos excedido ")
-        except Exception as e:
-            raise Exception("Falha não esperada") from e
-
-    def _find_contract_number_window_handle(self) -> bool:
-        
-        for handle in self.driver.window_handles:
+            contract_number = self.driver.poll(_read_contract_number, step="repom_retorno", on_retry=_refresh)
 
-            self.log.info("Procurando pela janela que aparece o numero do contrato")
+            if contract_number:
+                self.log.info("Contrato obtido com sucesso")
+                self.driver.close_window(keep=self._parked)
+                self.driver.switch_to_window(home_window=True)
+                return contract_number
 
-            self.driver.switch_to.window(handle)
-            title = self.driver.title
+            deadline = self.driver.step_budget("repom_retorno")
+            self.log.error(f"Tempo de {deadline:.0f} segundos excedido")
+            raise Exception(f"Falha ao obter o retorno da REPOM. Tempo de {deadline:.0f} segundos excedido ")
+        except Exception as e:
+            raise Exception("Falha não esperada") from e
 
-            if not (("Engenharia de Sistemas" in title) | ("Sistema KMM" in title)):
-                continue
-                
-            if "Engenharia de Sistemas" in title:
+    def _find_contract_number_window_handle(self, exclude=()) -> Optional[str]:
+        self.log.info("Procurando pela janela que aparece o numero do contrato")
 
-                title = self.driver.safe_get_text("id:td_titulo_pagina")
+        for handle in self.driver.find_windows("Engenharia de Sistemas", exclude=exclude):
+            title = self.driver.safe_get_text("id:td_titulo_pagina")
 
-                if "integrar contrato" in title.lower():
-                    self.log.info("Janela encontrada!")
-                    return True
+            if "integrar contrato" in title.lower():
+                self.log.info("Janela encontrada!")
+                self.driver.windows.set_role(handle, "repom")
+                return handle
         
-        return False
+        return None
 
+    # --- Pipeline de contratos ---
+
+    @property
+    def parked_contracts(self) -> List[PendingContract]:
+        """Contratos ainda sem resultado (estacionados ou descartados e não coletados)."""
+        return list(self._parked.values()) + self._dropped
+
+    def _park_contract(self, handle: str, license_plate: str, claim: idempotency.Claim) -> PendingContract:
+        schedule = self.driver.poll_schedule("repom_retorno")
+        now = time.monotonic()
+        pending = PendingContract(
+            handle=handle,
+            license_plate=license_plate,
+            claim=claim,
+            deadline=now + (schedule.deadline_s or self.driver.step_budget("repom_retorno")),
+            intervals=schedule.intervals(),
+            next_check_at=now + schedule.first_delay_s,
+            item_id=results.current_item(),
+        )
+        self._parked[handle] = pending
+        self.log.info(f"Janela da REPOM estacionada para a placa {license_plate} ({len(self._parked)} aguardando)")
+        return pending
+
+    def _drop_parked(self, reason: str) -> None:
+        """Descarta as janelas estacionadas; o erro sai no próximo collect_contracts()."""
+        for pending in self._parked.values():
+            pending.error = pe.KMMContractPendingError(
+                f"{reason}. placa {pending.license_plate}: conferir o contrato no KMM"
+            )
+            self.log.error(str(pending.error))
+            self._dropped.append(pending)
+        self._parked.clear()
+
+    def _check_parked_contract(self, pending: PendingContract) -> Optional[str]:
+        self.driver.switch_to_handle(pending.handle)
+        self.driver.switch_to_frame(principal=False)
+        contract_number = self.driver.safe_get_text(
+            "xpath:/html/body/form/table/tbody/tr/td/fieldset/table/tbody/tr[3]/td[2]", timeout=2, retries=0
+        )
+        if contract_number:
+            return contract_number
+        if time.monotonic() >= pending.deadline:
+            raise pe.KMMContractPendingError(
+                f"Retorno da REPOM não chegou no prazo. placa {pending.license_plate}: conferir o contrato no KMM"
+            )
+        self.driver.safe_click("xpath:/html/body/form/table/tbody/tr/td/fieldset/table/tbody/tr[8]/td[2]/button")
+        self.driver.wait_page_ready(step="repom_atualizar")
+        return None
+
+    @metrics.timed('repom_retorno')
+    def collect_contracts(self) -> List[PendingContract]:
+        """
+        Uma passada (sem esperar) pelas janelas da REPOM estacionadas cuja
+        próxima checagem já venceu. Devolve as resolvidas: com
+        contract_number, ou com error (prazo estourado / janela perdida).
+        Termina sempre na janela principal.
+        """
+        finished, self._dropped = self._dropped, []
+        now = time.monotonic()
+        for pending in list(self._parked.values()):
+            if now < pending.next_check_at:
+                continue
+            try:
+                contract_number = self._check_parked_contract(pending)
+            except pe.KMMProcess as e:
+                pending.error = e
+                self.log.error(f"Contrato da placa {pending.license_plate} sem retorno: {e}")
+            except Exception as e:
+                pending.error = pe.KMMContractPendingError(
+                    f"Falha ao ler o retorno da REPOM. placa {pending.license_plate}: conferir o contrato no KMM"
+                )
+                pending.error.__cause__ = e
+                self.log.error(f"Contrato da placa {pending.license_plate} sem retorno: {e}")
+            else:
+                if not contract_number:
+                    pending.next_check_at = time.monotonic() + next(pending.intervals)
+                    continue
+                pending.contract_number = contract_number
+                pending.claim.done(contract_number)
+                self.log.info(f"Contrato {contract_number} obtido (placa {pending.license_plate})")
+                try:
+                    self.driver.close_handle(pending.handle)
+                except Exception:
+                    pass
+            del self._parked[pending.handle]
+            finished.append(pending)
+
+        for pending in finished:
+            self._record_parked(pending)
+
+        self.driver.switch_to_window(home_window=True)
+        return finished
+
+    def _record_parked(self, pending: PendingContract) -> None:
+        if self.results is None:
+            return
+        self.results.record(
+            results.CONTRACT,
+            results.FAILED if pending.error is not None else results.OK,
+            self.service,
+            item_id=pending.item_id,
+            inputs={'license_plate': pending.license_plate},
+            output=pending.contract_number,
+            error=pending.error,
+        )
+
+    def next_contract_check_in(self) -> Optional[float]:
+        """Segundos até a próxima janela estacionada precisar de checagem (None = nenhuma)."""
+        if self._dropped:
+            return 0.0
+        if not self._parked:
+            return None
+        return max(0.0, min(p.next_check_at for p in self._parked.values()) - time.monotonic())
+
+    @metrics.timed()
+    @results.recorded(
+        results.CONTRACT,
+        inputs=('license_plate', 'route', 'sender', 'recipient'),
+        # Estacionado: o resultado é gravado no collect_contracts
+        output=lambda value: None if isinstance(value, PendingContract) else value,
+    )
     def emitting_contract_repomfretea(
             self,
             license_plate: str,
@@ -379,10 +695,24 @@ class KMMActions:
             control_number: int,
             weight: Optional[str] = None,
             contract_value: Optional[str] = None,
-            max_retries: int = 2
+            max_retries: int = 2,
+            on_submitted: Optional[Callable[[], None]] = None,
+            park: bool = False,
     ):
-
+        """
+        on_submitted: chamado quando a REPOM aceita o envio (alerta de sucesso),
+            ex.: para registrar o envio no diário de etapas. Com ou sem callback,
+            depois do clique em confirmar não há nova tentativa (a chave fica
+            SUBMITTED): reenviar duplicaria o contrato. Só uma recusa explícita
+            do KMM libera a chave.
+        park: não espera o número; estaciona a janela de retorno da REPOM e
+            devolve um PendingContract, resolvido depois por collect_contracts()
+            enquanto a janela principal segue com o próximo item.
+        """
+        claim = self._claim(idempotency.CONTRACT, idempotency.contract_key(license_plate, route, sender, recipient))
+        submitted = False
         try:
+            self._check_cached_driver_name(license_plate, driver_name)
             for attempt in range(1, max_retries + 1):
                 try:
                     self.quick_access('REPOMFRETEA')
@@ -390,7 +720,7 @@ class KMMActions:
                     self.driver.switch_to_frame(principal=False)
                     self.driver.safe_type('id:PLACA_CONTROLE', license_plate)
 
-                    kmm_driver_name = self._get_driver_name()
+                    kmm_driver_name = self._get_driver_name(license_plate)
 
                     if not kmm_driver_name:
                         raise pe.KMMGetDriverNameError("Falha ao obter o nome do motorista")
@@ -398,55 +728,86 @@ class KMMActions:
                     if kmm_driver_name != driver_name.lower().lstrip():
                         raise Exception("Divergência no nome do motorista")
 
-                    self.driver.safe_type('id:NUM_NATUREZA', nature)
-                    self.driver.safe_type('id:OPERACAO_ID', operation)
-                    self.driver.safe_type('id:ROTA_ID', route)
-
-                    self.driver.select_by_value('id:UTILIZA_VALE_PEDAGIO', '0')
-                    self.driver.safe_type('id:CARTAO_NUMERO', card)
-                    self.driver.safe_type('id:REM_CNPJ', sender)
-                    self.driver.safe_type('id:DEST_CNPJ', recipient)
-
+                    self.driver.fill_form({
+                        'NUM_NATUREZA': nature,
+                        'OPERACAO_ID': operation,
+                        'ROTA_ID': route,
+                        'UTILIZA_VALE_PEDAGIO': '0',
+                        'CARTAO_NUMERO': card,
+                        'REM_CNPJ': sender,
+                        'DEST_CNPJ': recipient,
+                    })
+                    # ROTA_ID/CNPJs disparam buscas do KMM que reescrevem os campos de carga
+                    self.driver.wait_requests_idle(step="rota")
+
+                    cargo = {}
                     if contract_value is not None:
-                        time.sleep(15)
-                        self.driver.safe_type('id:VALOR_UNITARIO', contract_value)
-                        self.driver.safe_type('id:PESO', '1')
-                        self.driver.safe_type('id:VOLUME', '1')
+                        self.driver.wait_enabled('id:VALOR_UNITARIO', step="valor_unitario")
+                        cargo.update({'VALOR_UNITARIO': contract_value, 'PESO': '1', 'VOLUME': '1'})
 
                     if weight is not None:
-                        self.driver.safe_type('id:PESO', weight)
-                        self.driver.safe_type('id:VOLUME', weight)
-
-                    self.driver.select_by_value('id:CON_UNIDADE_COMBO', 'Kg')
-
-                    self.driver.safe_type('id:USUARIO_LIBERACAO', liberation_user)
+                        cargo.update({'PESO': weight, 'VOLUME': weight})
 
                     kmm_pass = password_generate(license_plate=license_plate, control_number=control_number)
-                    self.driver.safe_type('id:SENHA_LIBERACAO', kmm_pass)
-                    self.driver.safe_type('id:OBSERVACAO', '.')
+                    self.driver.fill_form({
+                        **cargo,
+                        'CON_UNIDADE_COMBO': 'Kg',
+                        'USUARIO_LIBERACAO': liberation_user,
+                        'SENHA_LIBERACAO': kmm_pass,
+                        'OBSERVACAO': '.',
+                    })
+                    # Só janelas abertas por este envio (as estacionadas já estão aqui)
+                    if park:
+                        self.driver.sync_windows()
+                        known = set(self.driver.windows.handles())
+                    else:
+                        known = set(self._parked)
+
+                    # A partir do clique não há nova tentativa: reenviar duplicaria o contrato.
+                    # A chave só é liberada se o KMM recusar o envio explicitamente.
+                    claim.submitted()
+                    submitted = True
                     self.driver.safe_click('id:btn_confirmar')
 
-                    alert = self.driver.wait_alert(timeout=30)
+                    outcome, alert = self._confirm_outcome("contrato_confirmar", exclude=known)
+                    if outcome is None:
+                        raise pe.KMMEmittingContractError("Pop-up de confirmação não apareceu")
+                    if outcome == "erro":
+                        claim.rejected()
+                        raise pe.KMMEmittingContractError(f"Falha ao gerar o contrato. Mensagem do KMM: {alert}")
+
                     alert_text = alert.text.lower()
                     if "sucesso" in alert_text:
                         self.log.info("Contrato enviado a REPOM, aguardando retorno do número do contrato")
+                        if on_submitted is not None:
+                            on_submitted()
 
                     else:
                         raise pe.KMMEmittingContractError(f"Falha ao gerar o contrato. Mensagem da pop-up: {alert_text}")
 
-                    contract_window = self._find_contract_number_window_handle()
+                    contract_window = self._find_contract_number_window_handle(exclude=known)
                     if not contract_window:
-                        self.driver.refresh()
-                        continue
+                        if park and self._parked:
+                            # O popup pode ter reaproveitado uma janela estacionada: nenhuma é confiável
+                            self._drop_parked("Janela da REPOM possivelmente reaproveitada")
+                        raise pe.KMMContractPendingError(
+                            f"Janela da REPOM não encontrada após o envio. placa {license_plate}"
+                        )
+
+                    if park:
+                        pending = self._park_contract(contract_window, license_plate, claim)
+                        self.driver.switch_to_window(home_window=True)
+                        return pending
 
                     self.driver.switch_to_frame(principal=False)
 
                     contract_number = self._get_contract_number()
+                    claim.done(contract_number)
                     self.driver.switch_to_window(home_window=True)
                     return contract_number
 
                 except Exception as e:
-                    if attempt == max_retries:
+                    if attempt == max_retries or submitted:
                         raise
                     self.log.error(f"Falha ao gerar o contrato, tentando novamente. Erro => {str(e)}")
                     self.driver.switch_to_window(home_window=True)
@@ -454,13 +815,17 @@ class KMMActions:
                     self.quick_access(term="REPOMFRETED")
 
         except pe.KMMProcess:
+            claim.release()
             raise
         except Exception as e:
+            claim.release()
             raise pe.KMMEmittingContractError(
                 f"Falha ao gerar o contrato. placa {license_plate}, motorista {driver_name}, natureza {nature}, operação {operation}, rota {route} "
                 f"cartao {card}, remetente {sender}, destinatario {recipient}, peso {weight}, valor do contrato {contract_value} "
             ) from e
 
+    @metrics.timed()
+    @results.recorded(results.CONTRACT_COMPLEMENT, inputs=('complement_cte', 'serie', 'transport'))
     def emitting_contract_repomfreted(
             self,
             contract_value: str,
@@ -486,34 +851,31 @@ class KMMActions:
                     self.log.info("Preenchendo formulário do contrato")
 
 
-                    self.driver.select_by_value('id:TIPO_DIARIA', '1')
-                    self.driver.safe_type("id:DIARIA_NUM_CTRC", complement_cte)
-                    self.driver.select_by_value('id:CTRC_DIARIA_SERIE', serie)
-                    self.driver.safe_type("id:ROTA_ID", '15')
+                    self.driver.fill_form({
+                        'TIPO_DIARIA': '1',
+                        'DIARIA_NUM_CTRC': complement_cte,
+                        'CTRC_DIARIA_SERIE': serie,
+                        'ROTA_ID': '15',
+                    })
                     self.driver.execute_js('f_busca_rota()')
-                    self.driver.safe_type('id:VALOR_UNITARIO', contract_value)
+                    self.driver.fill_form({'VALOR_UNITARIO': contract_value})
                     self.log.info(f"Valor do contrato => {contract_value}")
 
-                    time.sleep(5)
-                    self.driver.select_by_value("id:USUARIO_LIBERACAO", liberation_user)
+                    self.driver.wait_requests_idle(step="rota")
+                    self.driver.fill_form({'USUARIO_LIBERACAO': liberation_user})
 
-                    license_plate = None
-                    for _ in range(2):
-                        license_plate = self.driver.safe_get_attribute('id:PLACA_CONTROLE', 'value', timeout=15)
-                        if not license_plate:
-                            if _ == 1:
-                                raise Exception("Não foi possível obter a placa do veículo")
-                            time.sleep(2)
-                            continue
-                        else:
-                            break
+                    license_plate = self.driver.wait_value_present('id:PLACA_CONTROLE', step="placa")
+                    if not license_plate:
+                        raise Exception("Não foi possível obter a placa do veículo")
 
                     self.log.info(f"Placa => {license_plate}")
 
                     kmm_pass = password_generate(license_plate=license_plate[-2::], control_number=control_number, p6=False)
-                    self.driver.safe_type('id:SENHA_LIBERACAO', kmm_pass)
-                    self.driver.safe_type('id:OBSERVACAO', f"TR: {transport} \nMOTIVO: {submotive.upper()}")
-                    time.sleep(3)
+                    self.driver.fill_form({
+                        'SENHA_LIBERACAO': kmm_pass,
+                        'OBSERVACAO': f"TR: {transport} \nMOTIVO: {submotive.upper()}",
+                    })
+                    self.driver.wait_requests_idle(step="liberacao")
                     self.driver.execute_js('f_change_valor_unitario(true);')
 
                     self.driver.switch_to_frame(principal=True)
@@ -521,19 +883,21 @@ class KMMActions:
 
                     self.log.info("Formulário preenchido e botão de confirmar clicado com sucesso.")
 
-                    alert = self.driver.wait_alert(180)
+                    outcome, alert = self._confirm_outcome("repomfreted_confirmar", exclude=self._parked)
 
-                    if not alert:
+                    if outcome is None:
                         raise Exception("Pop-up não apareceu")
+                    if outcome == "erro":
+                        raise pe.KMMEmittingContractError(f"Falha ao gerar o contrato. Mensagem do KMM: {alert}")
 
                     alert_text = alert.text.lower()
                     if "sucesso" in alert_text:
                         self.log.info("Contrato enviado a REPOM, aguardando retorno do número do contrato")
 
                     else:
-                        raise f"Falha ao gerar o contrato. Mensagem da pop-up: {alert_text}"
+                        raise pe.KMMEmittingContractError(f"Falha ao gerar o contrato. Mensagem da pop-up: {alert_text}")
 
-                    contract_window = self._find_contract_number_window_handle()
+                    contract_window = self._find_contract_number_window_handle(exclude=self._parked)
                     if not contract_window:
                         self.driver.refresh()
                         continue
@@ -566,13 +930,15 @@ class KMMActions:
                 f"serie {serie} submotivo {submotive}, transporte {transport}, "
             ) from e
 
+    @metrics.timed()
+    @results.recorded(results.PAYMENT, inputs=('contract_number', 'cod_pessoa_filial'))
     def payment(self, contract_number: str, cod_pessoa_filial: str) -> bool:
 
         try:
             self.quick_access('LTREPOMFRETE')
 
             self.driver.switch_to_frame(principal=False)
-            self.driver.safe_type('id:PROCESSO_TRANSPORTE_CODIGO', contract_number)
+            self.driver.fill_form({'PROCESSO_TRANSPORTE_CODIGO': contract_number})
 
             self.driver.switch_to_frame(principal=True)
             self.driver.safe_click('id:btn_confirmar')
@@ -581,28 +947,25 @@ class KMMActions:
             self.driver.safe_click('xpath:/html/body/form/table/tbody/tr/td/div/table/tbody/tr/td[8]/button')
             self.log.info("Clicado no ícone de quitação")
 
-            self.driver.select_by_value('id:COD_PESSOA_FILIAL', cod_pessoa_filial)
-            self.log.info("Filial inserida")
-
-            self.driver.select_by_value("id:COD_CENTRO_CUSTO", "370")
-            self.log.info("Centro de custo inserido")
-
-            self.driver.safe_type('id:PESO_ENTREGA', '1.00')
-            self.log.info("Peso inserido")
+            self.driver.fill_form({
+                'COD_PESSOA_FILIAL': cod_pessoa_filial,
+                'COD_CENTRO_CUSTO': '370',
+                'PESO_ENTREGA': '1.00',
+            })
+            self.log.info("Filial, centro de custo e peso inseridos")
             self.log.info("Todos parâmetros inseridos, realizando quitação")
 
             self.driver.switch_to_frame(principal=True)
-            iframe = self.driver.find_element(
-                by="xpath",
-                value="/html/body/table/tbody/tr[1]/td[2]/table/tbody/tr[4]/td/iframe"
-            )
-            self.driver.switch_to.frame(iframe)
+            self.driver.enter_frame(self.payment_frame)
 
             self.driver.safe_click('xpath:/html/body/form/div/table/tbody/tr[3]/td/button[2]')
 
-            alert = self.driver.wait_alert(10)
-            if not alert:
+            with metrics.METRICS.step(self.service, "payment_alert"):
+                outcome, alert = self._confirm_outcome("quitacao_confirmar", exclude=self._parked)
+            if outcome is None:
                 raise pe.KMMPaymentError(f"Falha na quitação. Número do contrato: {contract_number}")
+            if outcome == "erro":
+                raise pe.KMMPaymentError(f"Falha na quitação. Número do contrato: {contract_number}. Mensagem do KMM: {alert}")
 
             alert_text = alert.text.lower()
             if 'quitado' in alert_text:
@@ -0,0 +1,238 @@
+"""
+Validação local dos itens da fila antes de pegar uma sessão do IE.
+
+Um item com placa, CNPJ, natureza/operação/rota ou peso inválidos só falhava
+dentro de emitting_contract_repomfretea, depois de login, quick_access, da
+espera do nome do motorista e às vezes de um retry. Aqui ele é reprovado na
+hora (KMMPreflightError com todos os motivos), sem abrir o navegador:
+
+    placa       placa de controle do KMM: numérica (a senha de liberação é
+                calculada a partir dela)
+    CNPJ        remetente/destinatário com dígitos verificadores corretos
+                (CPF com 11 dígitos também é aceito, com os dígitos dele)
+    peso        número maior que zero
+    natureza, operação, rota
+                presentes nas listas de referência exportadas do KMM
+
+As listas ficam num JSON por serviço (o "default" vale para todos), relido
+só quando o arquivo muda. Lista ausente = checagem desligada:
+
+    {"J Mendes": {"route": ["15", "22"], "operation": ["10"], "nature": ["1"]}}
+
+    python -m kmm.services.preflight import "J Mendes" route rotas.csv [coluna]
+    python -m kmm.services.preflight show "J Mendes"
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import exceptions.personalized_exceptions as pe
+from kmm.helper.str_handler import str_to_float
+from shared.logger import logger
+
+DEFAULT_PATH = "output/reference.json"
+DEFAULT_SECTION = "default"
+
+REFERENCE_FIELDS = ("nature", "operation", "route")
+REFERENCE_LABELS = {"nature": "natureza", "operation": "operação", "route": "rota"}
+
+_PLATE_RE = re.compile(r"^\d{1,10}$")
+_CNPJ_WEIGHTS = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+
+def _digits(value: Any) -> str:
+    return re.sub(r"\D", "", str(value or ""))
+
+
+def ref_id(value: Any) -> str:
+    """ID de referência comparável ("015" e "15" são o mesmo código)."""
+    text = str(value if value is not None else "").strip()
+    if text.isdigit():
+        return text.lstrip("0") or "0"
+    return text.upper()
+
+
+# -----------------------------
+# Regras
+# -----------------------------
+
+def cnpj_valid(value: Any) -> bool:
+    digits = _digits(value)
+    if len(digits) != 14 or len(set(digits)) == 1:
+        return False
+    for size in (12, 13):
+        total = sum(int(d) * w for d, w in zip(digits[:size], _CNPJ_WEIGHTS[13 - size:]))
+        check = 11 - total % 11
+        if int(digits[size]) != (0 if check >= 10 else check):
+            return False
+    return True
+
+
+def cpf_valid(value: Any) -> bool:
+    digits = _digits(value)
+    if len(digits) != 11 or len(set(digits)) == 1:
+        return False
+    for size in (9, 10):
+        total = sum(int(d) * w for d, w in zip(digits[:size], range(size + 1, 1, -1)))
+        check = total * 10 % 11
+        if int(digits[size]) != (0 if check == 10 else check):
+            return False
+    return True
+
+
+def plate_valid(value: Any) -> bool:
+    return bool(_PLATE_RE.match(str(value or "").strip()))
+
+
+def weight_valid(value: Any) -> bool:
+    try:
+        return str_to_float(str(value or "")) > 0
+    except ValueError:
+        return False
+
+
+# -----------------------------
+# Listas de referência
+# -----------------------------
+
+@lru_cache(maxsize=8)
+def _load(path: str, mtime: float) -> Dict[str, Dict[str, FrozenSet[str]]]:
+    with open(path, encoding="utf-8") as handle:
+        raw = json.load(handle)
+    return {
+        section: {field: frozenset(ref_id(v) for v in values) for field, values in lists.items()}
+        for section, lists in raw.items()
+    }
+
+
+def load_reference(path: str) -> Dict[str, Dict[str, FrozenSet[str]]]:
+    """Listas do arquivo (cache até o arquivo mudar); {} se ele não existe."""
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return {}
+    return _load(path, mtime)
+
+
+class Preflight:
+    def __init__(self, reference_path: Optional[str] = DEFAULT_PATH, service: str = DEFAULT_SECTION):
+        """reference_path=None desliga as checagens de natureza/operação/rota."""
+        self.reference_path = reference_path
+        self.service = service
+        self._warned = False
+        self._lock = threading.Lock()
+
+    def reference(self) -> Dict[str, FrozenSet[str]]:
+        if not self.reference_path:
+            return {}
+        sections = load_reference(self.reference_path)
+        lists = {**sections.get(DEFAULT_SECTION, {}), **sections.get(self.service, {})}
+        missing = [REFERENCE_LABELS[f] for f in REFERENCE_FIELDS if f not in lists]
+        if missing and not self._warned:
+            with self._lock:
+                if not self._warned:
+                    self._warned = True
+                    logger.warning(
+                        f"Preflight {self.service}: sem lista de {', '.join(missing)} em {self.reference_path}, checagem desligada"
+                    )
+        return lists
+
+    def problems(self, item: Any) -> List[str]:
+        """Motivos de reprovação do item (vazio = pode seguir)."""
+        reasons: List[str] = []
+        plate = getattr(item, "license_plate", None)
+        if plate is not None and not plate_valid(plate):
+            reasons.append(f"placa {plate!r} inválida: a placa de controle do KMM é numérica")
+
+        for name, label in (("sender", "remetente"), ("recipient", "destinatário")):
+            value = getattr(item, name, None)
+            if value is None:
+                continue
+            digits = _digits(value)
+            if len(digits) == 11:
+                if not cpf_valid(digits):
+                    reasons.append(f"CPF do {label} {value!r} com dígito verificador inválido")
+            elif not cnpj_valid(digits):
+                reasons.append(f"CNPJ do {label} {value!r} inválido")
+
+        weight = getattr(item, "weight", None)
+        if weight not in (None, "") and not weight_valid(weight):
+            reasons.append(f"peso {weight!r} inválido")
+
+        lists = self.reference()
+        for name in REFERENCE_FIELDS:
+            value = getattr(item, name, None)
+            if value is None or name not in lists:
+                continue
+            if ref_id(value) not in lists[name]:
+                reasons.append(f"{REFERENCE_LABELS[name]} {value!r} não existe no KMM ({self.service})")
+        return reasons
+
+    def __call__(self, item: Any) -> List[str]:
+        return self.problems(item)
+
+    def check(self, item: Any) -> None:
+        reasons = self.problems(item)
+        if reasons:
+            tbe = getattr(item, "tbe", "")
+            raise pe.KMMPreflightError(f"Item {tbe} reprovado na validação: {'; '.join(reasons)}", reasons=reasons)
+
+
+# -----------------------------
+# Importação das exportações do KMM
+# -----------------------------
+
+def read_export(path: str, column: Optional[str] = None) -> List[str]:
+    """IDs de uma exportação (CSV) do KMM: a coluna indicada ou a primeira."""
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as handle:
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(handle, dialect=dialect)
+        key = column or (reader.fieldnames or [None])[0]
+        if key not in (reader.fieldnames or []):
+            raise ValueError(f"Coluna {key!r} não encontrada em {path}: {reader.fieldnames}")
+        return sorted({ref_id(row[key]) for row in reader if (row.get(key) or "").strip()})
+
+
+def import_export(path: str, service: str, field: str, export_path: str, column: Optional[str] = None) -> int:
+    if field not in REFERENCE_FIELDS:
+        raise ValueError(f"Lista desconhecida: {field} (use {', '.join(REFERENCE_FIELDS)})")
+    ids = read_export(export_path, column)
+    raw: Dict[str, Dict[str, List[str]]] = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as handle:
+            raw = json.load(handle)
+    raw.setdefault(service, {})[field] = ids
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as handle:
+        json.dump(raw, handle, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return len(ids)
+
+
+if __name__ == "__main__":
+    reference_path = os.getenv("KMM_REFERENCE_PATH", DEFAULT_PATH)
+    if len(sys.argv) in (5, 6) and sys.argv[1] == "import":
+        count = import_export(reference_path, sys.argv[2], sys.argv[3], sys.argv[4], *sys.argv[5:])
+        print(f"{count} IDs de {sys.argv[3]} gravados para {sys.argv[2]} em {reference_path}")
+    elif len(sys.argv) == 3 and sys.argv[1] == "show":
+        lists = Preflight(reference_path, service=sys.argv[2]).reference()
+        print(json.dumps({field: sorted(ids) for field, ids in lists.items()}, indent=2, ensure_ascii=False))
+    else:
+        print("Uso: python -m kmm.services.preflight import <serviço> route|operation|nature <exportação.csv> [coluna]")
+        print("     python -m kmm.services.preflight show <serviço>")
+        sys.exit(1)
@@ -0,0 +1,231 @@
+"""
+Handler base da fila de um cliente: preflight, retomada pelo diário,
+contrato REPOMFRETEA e quitação, item a item (process) ou em pipeline
+(process_batch).
+
+Cada cliente é uma subclasse com o nome do serviço, o prefixo das variáveis
+de ambiente e o modelo do item:
+
+    class JMN(QueueHandler):
+        service = 'J Mendes'
+        env_prefix = 'JMN'
+        model = JMNItemProcess
+
+lê KMM_JMN_USERNAME/KMM_JMN_PASSWORD (login), JMN_LIBERATION_USER e
+JMN_COD_PESSOA_FILIAL. _pay pode ser sobrescrito.
+"""
+from kmm.services.kmm_actions import KMMActions, LoginParams
+from kmm.helper import metrics
+from kmm.services import contract_pipeline, driver_cache, idempotency, journal, preflight, results, session_pool
+from pydantic import BaseModel
+from dotenv import load_dotenv
+import os
+from typing import Any, Dict, Iterable, Optional, Type
+import exceptions.personalized_exceptions as pe
+from shared.logger import logger
+load_dotenv()
+
+
+class QueueHandler:
+    service: str
+    env_prefix: str
+    model: Type[BaseModel]
+    control_number: int = 21
+
+    def __init__(self) -> None:
+        self.idempotency = idempotency.IdempotencyIndex(os.getenv('KMM_IDEMPOTENCY_PATH', idempotency.DEFAULT_PATH))
+        self.driver_names = driver_cache.DriverNameCache(os.getenv('KMM_DRIVER_CACHE_PATH', driver_cache.DEFAULT_PATH))
+        self.journal = journal.StepJournal(os.getenv('KMM_JOURNAL_PATH', journal.DEFAULT_PATH))
+        self.results = results.ResultSink(os.getenv('KMM_RESULTS_PATH', results.DEFAULT_PATH))
+        self.preflight = preflight.Preflight(os.getenv('KMM_REFERENCE_PATH', preflight.DEFAULT_PATH), service=self.service)
+        # KMM_WARM_SESSIONS=0 mantém uma sessão só, iniciada no primeiro item
+        self.sessions = session_pool.SessionPool(
+            factory=self._new_kmm,
+            size=int(os.getenv('KMM_WARM_SESSIONS', '0')),
+            warmup=self._login,
+            max_transactions=int(os.getenv('KMM_SESSION_MAX_TRANSACTIONS', '50')),
+            max_memory_mb=float(os.getenv('KMM_SESSION_MAX_MEMORY_MB', '0')) or None,
+        )
+        self.kmm: KMMActions | None = None
+        self.log = logger.bind(service=self.service)
+
+    def _new_kmm(self) -> KMMActions:
+        return KMMActions(
+            service=self.service,
+            idempotency_index=self.idempotency,
+            driver_name_cache=self.driver_names,
+            result_sink=self.results,
+        )
+
+    def _login(self, kmm: KMMActions) -> None:
+        kmm.login(
+            LoginParams(
+                url = os.getenv('KMM_URL'),
+                username = self._env('KMM_{}_USERNAME'),
+                password= self._env('KMM_{}_PASSWORD')
+            )
+        )
+
+    def _env(self, name: str) -> Optional[str]:
+        return os.getenv(name.format(self.env_prefix))
+
+    def close(self) -> None:
+        self.sessions.close()
+        self.journal.close()
+        self.idempotency.close()
+        self.driver_names.close()
+        self.results.close()
+
+    @metrics.timed('process')
+    def process(self, queue_item: BaseModel):
+        with self.results.item(self.service, queue_item.tbe) as output:
+            # Item inválido falha aqui, sem pegar sessão nem fazer login
+            self.preflight.check(queue_item)
+            # Item já quitado ou repetido também para aqui, antes de abrir o IE
+            item = self._resume(queue_item)
+            if item is None:
+                return
+            with self.sessions.session() as self.kmm:
+                output['contract_number'] = self._process(queue_item, item)
+
+    @metrics.timed('process_batch')
+    def process_batch(self, queue_items: Iterable[BaseModel], max_parked: int = 2) -> Dict[str, Optional[Exception]]:
+        """
+        Processa vários itens na mesma sessão em pipeline: a janela de retorno
+        da REPOM de cada contrato fica estacionada enquanto o próximo item é
+        preenchido, e cada número que chega segue para a quitação.
+        Retorna {tbe: None (ok) | exceção}.
+        """
+        outcomes: Dict[str, Optional[Exception]] = {}
+
+        def on_number(tag, contract_number: str) -> None:
+            queue_item, item = tag
+            item.record(journal.CONTRACT_NUMBER, contract_number=contract_number)
+            with results.item_context(queue_item.tbe):
+                self._pay(item, contract_number)
+            outcomes[queue_item.tbe] = None
+            self.results.record(results.ITEM, results.OK, self.service, queue_item.tbe,
+                                output={'contract_number': contract_number})
+
+        def on_error(tag, error: Exception) -> None:
+            queue_item, _ = tag
+            self.log.error(f"TBE {queue_item.tbe} falhou: {error}")
+            outcomes[queue_item.tbe] = error
+            self.results.record(results.ITEM, results.FAILED, self.service, queue_item.tbe, error=error)
+
+        # Reprovados, quitados e repetidos saem antes de pegar a sessão
+        pending = []
+        for queue_item in queue_items:
+            if not self._preflight_ok(queue_item, outcomes):
+                continue
+            try:
+                item = self._resume(queue_item)
+            except Exception as e:
+                on_error((queue_item, None), e)
+                continue
+            if item is None:
+                outcomes[queue_item.tbe] = None
+                self.results.record(results.ITEM, results.OK, self.service, queue_item.tbe)
+                continue
+            pending.append((queue_item, item))
+        if not pending:
+            return outcomes
+
+        with self.sessions.session() as self.kmm:
+            pipeline = contract_pipeline.ContractPipeline(self.kmm, on_number, on_error, max_parked=max_parked)
+            for queue_item, item in pending:
+                try:
+                    with results.item_context(queue_item.tbe):
+                        self._submit(pipeline, queue_item, item, outcomes)
+                except Exception as e:
+                    on_error((queue_item, item), e)
+            pipeline.drain()
+        return outcomes
+
+    def _submit(
+        self,
+        pipeline: contract_pipeline.ContractPipeline,
+        queue_item: BaseModel,
+        item: journal.ItemJournal,
+        outcomes: Dict[str, Optional[Exception]],
+    ) -> None:
+        self._login(self.kmm)
+        item.record(journal.LOGGED_IN)
+
+        contract_number = item.get(journal.CONTRACT_NUMBER, 'contract_number')
+        if contract_number:
+            self._pay(item, contract_number)
+            outcomes[queue_item.tbe] = None
+            self.results.record(results.ITEM, results.OK, self.service, queue_item.tbe,
+                                output={'contract_number': contract_number})
+        else:
+            pipeline.submit((queue_item, item), **self._contract_params(queue_item, item))
+
+    def _preflight_ok(self, queue_item: BaseModel, outcomes: Dict[str, Optional[Exception]]) -> bool:
+        try:
+            self.preflight.check(queue_item)
+            return True
+        except pe.KMMPreflightError as e:
+            outcomes[queue_item.tbe] = e
+            self.results.record(results.ITEM, results.FAILED, self.service, queue_item.tbe, error=e)
+            return False
+
+    def _process(self, queue_item: BaseModel, item: journal.ItemJournal) -> str:
+        """Número do contrato do item (já retomado por _resume)."""
+        self._login(self.kmm)
+        item.record(journal.LOGGED_IN)
+
+        contract_number = item.get(journal.CONTRACT_NUMBER, 'contract_number')
+        if contract_number:
+            self.kmm.log.info(f"Retomando TBE {queue_item.tbe} a partir do contrato {contract_number}")
+        else:
+            contract_number = self.kmm.emitting_contract_repomfretea(**self._contract_params(queue_item, item))
+
+            if not contract_number:
+                raise Exception("Número do contrato não foi gerado")
+            item.record(journal.CONTRACT_NUMBER, contract_number=contract_number)
+
+        self._pay(item, contract_number)
+        return contract_number
+
+    def _resume(self, queue_item: BaseModel) -> Optional[journal.ItemJournal]:
+        """Diário do item; None se ele já foi quitado. Levanta se não pode seguir (sem tocar no IE)."""
+        item = self.journal.item(self.service, queue_item.tbe)
+        if item.done(journal.PAYMENT_DONE):
+            self.log.info(f"TBE {queue_item.tbe} já quitado, nada a fazer")
+            return None
+
+        if not item.get(journal.CONTRACT_NUMBER, 'contract_number'):
+            if item.done(journal.CONTRACT_SUBMITTED):
+                raise pe.KMMContractPendingError(
+                    f"TBE {queue_item.tbe}: contrato enviado à REPOM sem número registrado, conferir no KMM"
+                )
+            # Item repetido (mesma placa/rota/remetente/destinatário no dia) para antes da sessão
+            self.idempotency.check(
+                idempotency.CONTRACT,
+                idempotency.contract_key(queue_item.license_plate, queue_item.route, queue_item.sender, queue_item.recipient),
+            )
+        return item
+
+    def _contract_params(self, queue_item: BaseModel, item: journal.ItemJournal) -> dict:
+        return dict(
+            license_plate=queue_item.license_plate,
+            driver_name=queue_item.driver_name,
+            nature=queue_item.nature,
+            operation=queue_item.operation,
+            route=queue_item.route,
+            card=queue_item.card,
+            sender=queue_item.sender,
+            recipient=queue_item.recipient,
+            liberation_user=self._env("{}_LIBERATION_USER"),
+            control_number=self.control_number,
+            weight=queue_item.weight,
+            on_submitted=lambda: item.record(journal.CONTRACT_SUBMITTED),
+        )
+
+    def _pay(self, item: journal.ItemJournal, contract_number: str) -> Any:
+        """Quita o contrato; o diário só marca a quitação se o KMM a confirmou."""
+        payment = self.kmm.payment(contract_number=contract_number, cod_pessoa_filial=self._env("{}_COD_PESSOA_FILIAL"))
+        if payment:
+            item.record(journal.PAYMENT_DONE, contract_number=contract_number)
+        return payment
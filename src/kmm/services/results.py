@@ -0,0 +1,431 @@
+"""
+Registro dos resultados do robô (contratos, CT-es de complemento, quitações
+e itens da fila) para a conciliação, sem depender dos logs.
+
+Cada resultado vira uma linha append-only num SQLite (WAL, compartilhado
+pelos workers) com: serviço, id do item (ex.: TBE), tipo, ok/failed,
+entradas relevantes, saída (nº do contrato / CT-e), erro, duração e, nos
+itens, o tempo de cada etapa (metrics.collect_timings).
+
+record() só enfileira em memória; uma thread grava em lote (uma transação)
+quando o buffer chega a `batch_size` ou a cada `flush_interval_s`. Se o
+SQLite estiver ocupado ou fora, o lote volta para o buffer e é regravado
+depois: o loop do robô nunca espera pela escrita.
+
+    sink = ResultSink()
+    kmm = KMMActions(service="J Mendes", result_sink=sink)   # contratos, CT-es, quitações
+    with sink.item("J Mendes", tbe) as output:               # o item, com tempos por etapa
+        output["contract_number"] = ...
+    sink.close()
+
+    python -m kmm.services.results export output/resultados.csv --since 2026-10-01 --service "J Mendes"
+    python -m kmm.services.results export output/resultados.jsonl --kind contract
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import contextvars
+import csv
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from kmm.helper import metrics
+from kmm.services.journal import connect
+from shared.logger import logger
+
+DEFAULT_PATH = "output/results.sqlite3"
+
+CONTRACT = "contract"
+CONTRACT_COMPLEMENT = "contract_complement"
+CTE = "cte"
+PAYMENT = "payment"
+ITEM = "item"
+
+OK = "ok"
+FAILED = "failed"
+
+COLUMNS = (
+    "id", "ts", "service", "item_id", "kind", "status", "inputs", "output",
+    "error", "error_type", "elapsed_s", "timings", "pid",
+)
+
+# Item da fila sendo processado na thread/tarefa corrente
+_item_id: contextvars.ContextVar[str] = contextvars.ContextVar("kmm_results_item", default="")
+
+
+def current_item() -> str:
+    return _item_id.get()
+
+
+@contextmanager
+def item_context(item_id: Any) -> Iterator[None]:
+    """Associa ao item os resultados gravados dentro do bloco (sem gravar o item)."""
+    token = _item_id.set(str(item_id or ""))
+    try:
+        yield
+    finally:
+        _item_id.reset(token)
+
+
+@dataclass
+class ResultRecord:
+    service: str
+    item_id: str
+    kind: str
+    status: str
+    inputs: Dict[str, Any] = field(default_factory=dict)
+    output: Any = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    elapsed_s: Optional[float] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    ts: float = field(default_factory=time.time)
+
+    def row(self, pid: int) -> tuple:
+        return (
+            self.ts, self.service, self.item_id, self.kind, self.status,
+            json.dumps(self.inputs, ensure_ascii=False, default=str),
+            json.dumps(self.output, ensure_ascii=False, default=str),
+            self.error, self.error_type,
+            None if self.elapsed_s is None else round(self.elapsed_s, 3),
+            json.dumps({k: round(v, 3) for k, v in self.timings.items()}, ensure_ascii=False),
+            pid,
+        )
+
+
+class ResultSink:
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        batch_size: int = 200,
+        flush_interval_s: float = 5.0,
+        max_buffer: int = 50_000,
+    ):
+        """
+        max_buffer: com o SQLite indisponível por muito tempo, os registros
+            mais antigos além deste limite são descartados (com erro no log).
+        """
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.max_buffer = max_buffer
+        self.log = logger.bind(sink="results")
+
+        self._cond = threading.Condition()
+        self._buffer: List[ResultRecord] = []
+        self._recorded = 0
+        self._written = 0
+        self._dropped = 0
+        self._flush_requested = False
+        self._closed = False
+        self._pid = os.getpid()
+
+        self._writer = threading.Thread(target=self._write_loop, name="kmm-results", daemon=True)
+        self._writer.start()
+        # O writer é daemon: sem close() (crash do handler) o buffer ainda é gravado na saída
+        atexit.register(self.flush, 5.0)
+
+    # -----------------------------
+    # Registro
+    # -----------------------------
+
+    def record(
+        self,
+        kind: str,
+        status: str,
+        service: str = "",
+        item_id: Optional[Any] = None,
+        inputs: Optional[Dict[str, Any]] = None,
+        output: Any = None,
+        error: Optional[BaseException | str] = None,
+        elapsed_s: Optional[float] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """Enfileira um resultado; item_id=None usa o item do contexto."""
+        record = ResultRecord(
+            service=service,
+            item_id=current_item() if item_id is None else str(item_id),
+            kind=kind,
+            status=status,
+            inputs=dict(inputs or {}),
+            output=output,
+            error=None if error is None else str(error),
+            error_type=type(error).__name__ if isinstance(error, BaseException) else None,
+            elapsed_s=elapsed_s,
+            timings=dict(timings or {}),
+        )
+        with self._cond:
+            if self._closed:
+                self.log.warning(f"ResultSink fechado, resultado descartado: {record.kind} {record.item_id}")
+                return
+            self._buffer.append(record)
+            self._recorded += 1
+            if len(self._buffer) > self.max_buffer:
+                excess = len(self._buffer) - self.max_buffer
+                del self._buffer[:excess]
+                self._dropped += excess
+                self._written += excess
+                self.log.error(f"Buffer de resultados cheio: {excess} registro(s) descartado(s)")
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    @contextmanager
+    def item(self, service: str, item_id: Any, **inputs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Grava o resultado do item ao sair do bloco (ok ou failed, com o erro),
+        com a duração e o tempo de cada etapa. O dict entregue é a saída.
+        """
+        output: Dict[str, Any] = {}
+        start = time.perf_counter()
+        with item_context(item_id), metrics.collect_timings() as timings:
+            try:
+                yield output
+            except BaseException as e:
+                self.record(ITEM, FAILED, service, item_id, inputs, output, e, time.perf_counter() - start, timings)
+                raise
+            self.record(ITEM, OK, service, item_id, inputs, output, None, time.perf_counter() - start, timings)
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Pede a gravação do que já foi registrado e espera até `timeout`."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            target = self._recorded
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._written < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._writer.is_alive():
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 30.0) -> None:
+        atexit.unregister(self.flush)
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout)
+        with self._cond:
+            if self._buffer:
+                self.log.error(f"{len(self._buffer)} resultado(s) não gravado(s) em {self.path}")
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # -----------------------------
+    # Gravação
+    # -----------------------------
+
+    def _write_loop(self) -> None:
+        conn = None
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval_s
+                while not (self._closed or self._flush_requested or len(self._buffer) >= self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._buffer = self._buffer, []
+                self._flush_requested = False
+                closing = self._closed
+
+            if batch:
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        f"INSERT INTO results ({', '.join(COLUMNS[1:])}) VALUES ({', '.join('?' * (len(COLUMNS) - 1))})",
+                        [record.row(self._pid) for record in batch],
+                    )
+                    conn.execute("COMMIT")
+                except Exception as e:
+                    self.log.warning(f"Falha ao gravar {len(batch)} resultado(s), nova tentativa depois: {e}")
+                    if conn is not None:
+                        try:
+                            conn.execute("ROLLBACK")
+                        except Exception:
+                            pass
+                    with self._cond:
+                        self._buffer[:0] = batch
+                        if closing:
+                            break
+                        self._cond.wait(self.flush_interval_s)
+                    continue
+                with self._cond:
+                    self._written += len(batch)
+                    self._cond.notify_all()
+
+            if closing:
+                break
+        if conn is not None:
+            conn.close()
+
+    def _connect(self):
+        return _create_schema(connect(self.path))
+
+
+def _create_schema(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts REAL NOT NULL,
+            service TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            inputs TEXT NOT NULL DEFAULT '{}',
+            output TEXT,
+            error TEXT,
+            error_type TEXT,
+            elapsed_s REAL,
+            timings TEXT NOT NULL DEFAULT '{}',
+            pid INTEGER
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS results_ts ON results (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS results_item ON results (service, item_id)")
+    return conn
+
+
+# -----------------------------
+# Decorator para o KMMActions
+# -----------------------------
+
+def recorded(kind: str, inputs: Sequence[str] = (), output: Callable[[Any], Any] = lambda value: value) -> Callable:
+    """
+    Grava o resultado do método em `self.results` (sem sink, não faz nada).
+    `inputs` são os parâmetros guardados junto; `output(retorno)` = None não
+    grava (o resultado sai depois, ex.: contrato estacionado).
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            sink: Optional[ResultSink] = getattr(self, "results", None)
+            if sink is None:
+                return fn(self, *args, **kwargs)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            values = {name: bound.arguments.get(name) for name in inputs}
+            service = getattr(self, "service", "")
+            start = time.perf_counter()
+            try:
+                value = fn(self, *args, **kwargs)
+            except Exception as e:
+                sink.record(kind, FAILED, service, inputs=values, error=e, elapsed_s=time.perf_counter() - start)
+                raise
+            result = output(value)
+            if result is not None:
+                sink.record(kind, OK, service, inputs=values, output=result, elapsed_s=time.perf_counter() - start)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+# -----------------------------
+# Exportação
+# -----------------------------
+
+def _since_ts(since: Optional[str]) -> Optional[float]:
+    if not since:
+        return None
+    return datetime.fromisoformat(since).timestamp()
+
+
+def iter_results(
+    path: str = DEFAULT_PATH,
+    since: Optional[str] = None,
+    service: Optional[str] = None,
+    kind: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Linhas gravadas (em ordem de gravação), lidas sob demanda."""
+    where, params = [], []
+    if since:
+        where.append("ts >= ?")
+        params.append(_since_ts(since))
+    if service:
+        where.append("service = ?")
+        params.append(service)
+    if kind:
+        where.append("kind = ?")
+        params.append(kind)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM results"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    conn = _create_schema(connect(path))
+    try:
+        for row in conn.execute(sql + " ORDER BY id", params):
+            data = dict(zip(COLUMNS, row))
+            data["ts"] = datetime.fromtimestamp(data["ts"]).isoformat(timespec="seconds")
+            for key in ("inputs", "output", "timings"):
+                data[key] = json.loads(data[key]) if data[key] else None
+            yield data
+    finally:
+        conn.close()
+
+
+def export(out_path: str, path: str = DEFAULT_PATH, **filters: Any) -> int:
+    """Exporta para .csv (';', como o Excel pt-BR abre) ou .jsonl; retorna as linhas."""
+    count = 0
+    with open(out_path, "w", encoding="utf-8-sig" if out_path.lower().endswith(".csv") else "utf-8", newline="") as handle:
+        if out_path.lower().endswith(".csv"):
+            writer = csv.DictWriter(handle, fieldnames=COLUMNS, delimiter=";")
+            writer.writeheader()
+            for data in iter_results(path, **filters):
+                for key in ("inputs", "output", "timings"):
+                    if isinstance(data[key], (dict, list)):
+                        data[key] = json.dumps(data[key], ensure_ascii=False)
+                writer.writerow(data)
+                count += 1
+        else:
+            for data in iter_results(path, **filters):
+                handle.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+                count += 1
+    return count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Resultados gravados pelo robô")
+    sub = parser.add_subparsers(dest="action", required=True)
+    exp = sub.add_parser("export", help="exporta para CSV ou JSONL")
+    exp.add_argument("out_path")
+    exp.add_argument("--db", default=DEFAULT_PATH)
+    exp.add_argument("--since", help="data/hora ISO (ex.: 2026-10-01)")
+    exp.add_argument("--service")
+    exp.add_argument("--kind", choices=(CONTRACT, CONTRACT_COMPLEMENT, CTE, PAYMENT, ITEM))
+    args = parser.parse_args()
+
+    count = export(args.out_path, args.db, since=args.since, service=args.service, kind=args.kind)
+    print(f"{count} resultado(s) exportado(s) para {args.out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,512 @@
+"""
+Agendador único para as filas de todos os clientes (J Mendes, Vallourec,
+Belgo...), com prazo, prioridade e divisão justa por conta de serviço.
+
+Antes cada cliente tinha o seu ponto de entrada e a fila de um rodava até o
+fim enquanto o item urgente de outro esperava. Aqui os itens de todas as
+filas entram num mesmo agendador e `workers` threads (uma sessão do IE
+cada) pegam o próximo item assim:
+
+  1. Urgente primeiro: item cuja folga (prazo - agora - duração esperada do
+     cliente) está abaixo de `urgency_margin_s` sai por menor prazo (EDF),
+     de qualquer conta.
+  2. Senão, divisão justa: a conta (usuário do KMM) com menor tempo de uso
+     normalizado pelo `share` é a próxima. O uso é cobrado no início do item
+     (duração esperada) e acertado no fim, e uma conta que volta a ter itens
+     entra no nível das ativas, sem "crédito" acumulado. A conta da sessão
+     que o worker já tem aberta ganha `switch_cost_s` de vantagem (trocar
+     de conta custa fechar o IE, abrir outro e logar).
+  3. Dentro da conta: prioridade (menor = antes), depois item que casa com
+     a sessão do worker (mesma conta e gestão 'levo'/'freto', sem novo
+     login), depois prazo.
+
+Cada worker mantém o handler (JMN, VALLOUREC...) do último cliente que
+atendeu, com a sessão logada; trocar de cliente fecha o handler anterior,
+então nunca há mais sessões do IE abertas que workers. `max_sessions` por
+conta limita logins simultâneos do mesmo usuário.
+
+Item com o circuit breaker do KMM aberto volta para a fila depois do prazo
+do breaker (até `max_defers` vezes), como no WorkerPool. A fila fica em
+memória e cada escolha percorre os itens pendentes: `max_pending` por
+cliente (submit bloqueia) mantém isso pequeno com arquivos grandes.
+
+    scheduler = Scheduler(workers=3, shares={"JMN.USER": 2})
+    scheduler.add_tenant(Tenant("J Mendes", JMN, account="JMN.USER", sla_s=2 * 3600))
+    scheduler.add_tenant(Tenant("Vallourec", VALLOUREC, account="VLR.USER", priority=5))
+    for result in scheduler.run(jobs):
+        print(result)
+
+    python -m kmm.services.scheduler jmn:fila_jmn.csv vallourec:fila_vallourec.jsonl --workers 3 --sla vallourec=3600
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from kmm.helper.polling import percentile
+from kmm.services.worker_pool import circuit_open, close_handler
+from shared.logger import logger
+
+DEFAULT_MANAGEMENT = "freto"
+
+SessionKey = Tuple[str, str]  # (conta, gestão)
+
+
+@dataclass
+class Tenant:
+    """Cliente: handler com process(payload) e a conta do KMM que ele usa."""
+    name: str
+    handler_factory: Callable[[], Any]
+    account: str
+    management: str = DEFAULT_MANAGEMENT
+    priority: int = 10
+    sla_s: float = 4 * 3600
+    # Duração inicial estimada de um item (depois, média móvel das reais)
+    expected_s: float = 90.0
+
+
+@dataclass
+class Job:
+    tenant: str
+    item_id: str
+    payload: Any
+    # Epoch (time.time()); None = agora + sla_s do cliente
+    deadline: Optional[float] = None
+    priority: Optional[int] = None
+    management: Optional[str] = None
+    not_before: float = 0.0
+    enqueued_at: float = field(default_factory=time.time)
+    defers: int = 0
+    seq: int = 0
+
+
+@dataclass
+class JobResult:
+    tenant: str
+    item_id: str
+    status: str  # ok | failed
+    worker: int
+    value: Any = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    waited_s: float = 0.0
+    elapsed_s: float = 0.0
+    late: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+@dataclass
+class _Worker:
+    id: int
+    key: Optional[SessionKey] = None
+    tenant: Optional[str] = None
+    handler: Any = None
+
+
+class Scheduler:
+    def __init__(
+        self,
+        workers: int = 2,
+        shares: Optional[Dict[str, float]] = None,
+        max_sessions: Optional[Dict[str, int]] = None,
+        urgency_margin_s: float = 300.0,
+        switch_cost_s: float = 60.0,
+        max_pending: int = 1000,
+        max_defers: int = 3,
+        min_defer_s: float = 5.0,
+    ):
+        """
+        shares: peso de cada conta na divisão justa (padrão 1).
+        max_sessions: sessões simultâneas por conta (padrão: sem limite além de `workers`).
+        urgency_margin_s: folga abaixo da qual o item passa na frente de tudo.
+        switch_cost_s: custo estimado de trocar a sessão do worker de conta.
+        max_pending: itens aguardando por cliente; submit() bloqueia acima disso.
+        """
+        self.workers = max(1, workers)
+        self.shares = dict(shares or {})
+        self.max_sessions = dict(max_sessions or {})
+        self.urgency_margin_s = urgency_margin_s
+        self.switch_cost_s = switch_cost_s
+        self.max_pending = max(1, max_pending)
+        self.max_defers = max_defers
+        self.min_defer_s = min_defer_s
+        self.log = logger.bind(service="Scheduler")
+
+        self._tenants: Dict[str, Tenant] = {}
+        self._expected: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._jobs: List[Job] = []
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._running: Dict[str, int] = defaultdict(int)  # por conta
+        self._vtime: Dict[str, float] = defaultdict(float)
+        self._seq = 0
+        self._unfinished = 0
+        self._closed = False
+        self._results: "queue.Queue[JobResult]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    # -----------------------------
+    # Configuração / entrada
+    # -----------------------------
+
+    def add_tenant(self, tenant: Tenant) -> None:
+        with self._cond:
+            self._tenants[tenant.name] = tenant
+            self._expected.setdefault(tenant.name, tenant.expected_s)
+
+    def submit(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """Enfileira o item; espera vaga se o cliente já tem `max_pending` aguardando."""
+        with self._cond:
+            tenant = self._tenants.get(job.tenant)
+            if tenant is None:
+                raise ValueError(f"Cliente não registrado no agendador: {job.tenant}")
+            if not self._cond.wait_for(lambda: self._closed or self._pending[job.tenant] < self.max_pending, timeout):
+                return False
+            if self._closed:
+                raise RuntimeError("Scheduler fechado")
+
+            if job.deadline is None:
+                job.deadline = job.enqueued_at + tenant.sla_s
+            if job.priority is None:
+                job.priority = tenant.priority
+            if job.management is None:
+                job.management = tenant.management
+            self._seq += 1
+            job.seq = self._seq
+            if not self._account_active(tenant.account):
+                self._rejoin(tenant.account)
+            self._jobs.append(job)
+            self._pending[job.tenant] += 1
+            self._unfinished += 1
+            self._cond.notify_all()
+        return True
+
+    def start(self) -> None:
+        with self._cond:
+            if self._threads:
+                return
+            for worker_id in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop, args=(_Worker(worker_id),), name=f"kmm-scheduler-{worker_id}", daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+
+    def results(self, until_idle: bool = True) -> Iterator[JobResult]:
+        """Resultados conforme terminam; com until_idle para quando nada mais está na fila."""
+        while True:
+            try:
+                yield self._results.get(timeout=1)
+                continue
+            except queue.Empty:
+                pass
+            with self._cond:
+                if (until_idle and self._unfinished == 0) or (self._closed and not any(t.is_alive() for t in self._threads)):
+                    break
+        while not self._results.empty():
+            yield self._results.get_nowait()
+
+    def run(self, jobs: Iterable[Job]) -> Iterator[JobResult]:
+        """Agenda os itens (numa thread, respeitando max_pending) e devolve os resultados."""
+        self.start()
+        self.feed(jobs)
+        yield from self.results()
+
+    def feed(self, jobs: Iterable[Job], name: str = "feed") -> threading.Thread:
+        """Lê `jobs` numa thread própria; uma por fila, para a maior não segurar as outras."""
+        with self._cond:
+            # O feeder conta como pendente até terminar: results() não para antes
+            self._unfinished += 1
+        feeder = threading.Thread(target=self._feed, args=(jobs,), name=f"kmm-scheduler-{name}", daemon=True)
+        feeder.start()
+        return feeder
+
+    def _feed(self, jobs: Iterable[Job]) -> None:
+        try:
+            for job in jobs:
+                self.submit(job)
+        except Exception as e:
+            self.log.error(f"Falha ao ler a fila: {e}")
+        finally:
+            with self._cond:
+                self._unfinished -= 1
+                self._cond.notify_all()
+
+    def close(self, timeout: float = 60.0) -> List[Job]:
+        """Para os workers depois do item atual; devolve os itens que não saíram."""
+        with self._cond:
+            self._closed = True
+            leftover, self._jobs = self._jobs, []
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        if leftover:
+            self.log.warning(f"{len(leftover)} item(ns) não processado(s) no fechamento")
+        return leftover
+
+    def __enter__(self) -> "Scheduler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # -----------------------------
+    # Escolha do próximo item
+    # -----------------------------
+
+    def _account_active(self, account: str) -> bool:
+        return self._running[account] > 0 or any(self._tenants[j.tenant].account == account for j in self._jobs)
+
+    def _rejoin(self, account: str) -> None:
+        active = [self._vtime[a] for a in self._vtime if a != account and self._account_active(a)]
+        if active:
+            self._vtime[account] = max(self._vtime[account], min(active))
+
+    def _share(self, account: str) -> float:
+        return max(self.shares.get(account, 1.0), 1e-6)
+
+    def _pick(self, worker: _Worker, now: float) -> Optional[Job]:
+        ready = []
+        for job in self._jobs:
+            if job.not_before > now:
+                continue
+            account = self._tenants[job.tenant].account
+            limit = self.max_sessions.get(account)
+            if limit is not None and self._running[account] >= limit:
+                continue
+            ready.append(job)
+        if not ready:
+            return None
+
+        urgent = [j for j in ready if j.deadline - now - self._expected[j.tenant] <= self.urgency_margin_s]
+        if urgent:
+            return min(urgent, key=lambda j: (j.deadline, j.priority, j.seq))
+
+        accounts = {self._tenants[j.tenant].account for j in ready}
+        current = worker.key[0] if worker.key else None
+
+        def usage(a: str) -> float:
+            return self._vtime[a] - (self.switch_cost_s / self._share(a) if a == current else 0.0)
+
+        account = min(accounts, key=lambda a: (usage(a), a))
+        return min(
+            (j for j in ready if self._tenants[j.tenant].account == account),
+            key=lambda j: (j.priority, self._key(j) != worker.key, j.deadline, j.seq),
+        )
+
+    def _key(self, job: Job) -> SessionKey:
+        return self._tenants[job.tenant].account, job.management or DEFAULT_MANAGEMENT
+
+    def _next_job(self, worker: _Worker) -> Optional[Job]:
+        with self._cond:
+            while not self._closed:
+                now = time.time()
+                job = self._pick(worker, now)
+                if job is not None:
+                    self._jobs.remove(job)
+                    self._pending[job.tenant] -= 1
+                    account = self._tenants[job.tenant].account
+                    self._running[account] += 1
+                    # Cobra a duração esperada já no início (acertada no fim)
+                    self._vtime[account] += self._expected[job.tenant] / self._share(account)
+                    self._cond.notify_all()
+                    return job
+                waits = [j.not_before - now for j in self._jobs if j.not_before > now]
+                self._cond.wait(min(waits + [5.0]))
+            return None
+
+    def _finish(self, job: Job, elapsed_s: float, requeue: bool) -> None:
+        tenant = self._tenants[job.tenant]
+        with self._cond:
+            account = tenant.account
+            self._running[account] -= 1
+            expected = self._expected[job.tenant]
+            self._vtime[account] += (elapsed_s - expected) / self._share(account)
+            self._expected[job.tenant] = 0.8 * expected + 0.2 * elapsed_s
+            if requeue:
+                self._jobs.append(job)
+                self._pending[job.tenant] += 1
+            else:
+                self._unfinished -= 1
+            self._cond.notify_all()
+
+    # -----------------------------
+    # Worker
+    # -----------------------------
+
+    def _handler(self, worker: _Worker, tenant: Tenant) -> Any:
+        if worker.tenant != tenant.name:
+            if worker.handler is not None:
+                self.log.info(f"Worker {worker.id}: trocando {worker.tenant} por {tenant.name}")
+                try:
+                    close_handler(worker.handler)
+                except Exception as e:
+                    self.log.warning(f"Falha ao fechar o handler de {worker.tenant}: {e}")
+            worker.handler, worker.tenant, worker.key = None, None, None
+            worker.handler = tenant.handler_factory()
+            worker.tenant = tenant.name
+        return worker.handler
+
+    def _worker_loop(self, worker: _Worker) -> None:
+        try:
+            while True:
+                job = self._next_job(worker)
+                if job is None:
+                    return
+                self._run_job(worker, job)
+        finally:
+            if worker.handler is not None:
+                try:
+                    close_handler(worker.handler)
+                except Exception:
+                    pass
+
+    def _run_job(self, worker: _Worker, job: Job) -> None:
+        tenant = self._tenants[job.tenant]
+        started = time.time()
+        waited = started - job.enqueued_at
+        if started > job.deadline:
+            self.log.warning(f"{job.tenant} {job.item_id} começou {started - job.deadline:.0f}s depois do prazo")
+
+        start = time.monotonic()
+        try:
+            handler = self._handler(worker, tenant)
+            worker.key = self._key(job)
+            value = handler.process(job.payload)
+            result = JobResult(job.tenant, job.item_id, "ok", worker.id, value=value)
+        except Exception as e:
+            unavailable = circuit_open(e)
+            if unavailable is not None and job.defers < self.max_defers:
+                job.defers += 1
+                job.not_before = time.time() + max(unavailable.retry_after_s, self.min_defer_s)
+                self.log.warning(f"{job.tenant} {job.item_id} adiado ({job.defers}/{self.max_defers}): {unavailable}")
+                self._finish(job, time.monotonic() - start, requeue=True)
+                return
+            self.log.error(f"{job.tenant} {job.item_id} falhou: {e}")
+            result = JobResult(
+                job.tenant, job.item_id, "failed", worker.id,
+                error=f"{e}\n{traceback.format_exc()}", error_type=type(e).__name__,
+            )
+
+        elapsed = time.monotonic() - start
+        result.waited_s = waited
+        result.elapsed_s = elapsed
+        result.late = time.time() > job.deadline
+        self._finish(job, elapsed, requeue=False)
+        self._results.put(result)
+
+
+# -----------------------------
+# CLI: filas em arquivo (JSONL/CSV) via kmm.services.ingest
+# -----------------------------
+
+# Variável de ambiente com o usuário do KMM de cada handler do ingest
+ACCOUNT_ENV = {
+    "jmn": "KMM_JMN_USERNAME",
+    "vallourec": "KMM_VALLOUREC_USERNAME",
+}
+
+
+def _per_queue(values: List[str], cast: Callable[[str], Any]) -> Dict[str, Any]:
+    out = {}
+    for value in values or []:
+        name, _, number = value.partition("=")
+        out[name] = cast(number)
+    return out
+
+
+def _summary(results: List[JobResult]) -> Dict[str, Dict[str, Any]]:
+    by_tenant: Dict[str, List[JobResult]] = defaultdict(list)
+    for result in results:
+        by_tenant[result.tenant].append(result)
+    return {
+        tenant: {
+            "ok": sum(r.ok for r in items),
+            "failed": sum(not r.ok for r in items),
+            "late": sum(r.late for r in items),
+            "wait_p50_s": round(percentile([r.waited_s for r in items], 50), 1),
+            "wait_p95_s": round(percentile([r.waited_s for r in items], 95), 1),
+        }
+        for tenant, items in sorted(by_tenant.items())
+    }
+
+
+def main() -> int:
+    from kmm.services import ingest, preflight
+
+    parser = argparse.ArgumentParser(description="Processa as filas de vários clientes com um agendador só")
+    parser.add_argument("queues", nargs="+", help="handler:arquivo (ex.: jmn:fila.csv)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--sla", action="append", help="handler=segundos até o prazo (padrão 14400)")
+    parser.add_argument("--priority", action="append", help="handler=prioridade (menor = antes, padrão 10)")
+    parser.add_argument("--share", action="append", help="handler=peso da conta na divisão justa")
+    parser.add_argument("--max-sessions", action="append", help="handler=sessões simultâneas da conta")
+    args = parser.parse_args()
+
+    slas, priorities = _per_queue(args.sla, float), _per_queue(args.priority, int)
+    shares, limits = _per_queue(args.share, float), _per_queue(args.max_sessions, int)
+
+    queues = []
+    for spec in args.queues:
+        name, _, path = spec.partition(":")
+        if name not in ingest.HANDLERS or not path:
+            parser.error(f"Fila inválida: {spec} (handlers: {', '.join(sorted(ingest.HANDLERS))})")
+        queues.append((name, path))
+
+    tenants: Dict[str, Tenant] = {}
+    for name, _ in queues:
+        handler_path, _, service = ingest.HANDLERS[name]
+        tenants[name] = Tenant(
+            name=service,
+            handler_factory=ingest.load(handler_path),
+            account=os.getenv(ACCOUNT_ENV.get(name, ""), "") or service,
+            priority=priorities.get(name, 10),
+            sla_s=slas.get(name, 4 * 3600),
+        )
+
+    scheduler = Scheduler(
+        workers=args.workers,
+        shares={tenants[n].account: v for n, v in shares.items() if n in tenants},
+        max_sessions={tenants[n].account: v for n, v in limits.items() if n in tenants},
+    )
+    for tenant in tenants.values():
+        scheduler.add_tenant(tenant)
+
+    def jobs_from(name: str, path: str) -> Iterator[Job]:
+        _, model_path, service = ingest.HANDLERS[name]
+        ingester = ingest.Ingester(
+            ingest.load(model_path),
+            rejects_path=f"{os.path.splitext(path)[0]}.rejeitados.jsonl",
+            preflight=preflight.Preflight(os.getenv("KMM_REFERENCE_PATH", preflight.DEFAULT_PATH), service=service),
+        )
+        for item in ingester.read(path):
+            yield Job(tenant=service, item_id=item.tbe, payload=item)
+
+    collected: List[JobResult] = []
+    scheduler.start()
+    try:
+        for name, path in queues:
+            scheduler.feed(jobs_from(name, path), name=f"feed-{name}")
+        for result in scheduler.results():
+            collected.append(result)
+    finally:
+        scheduler.close()
+    print(json.dumps(_summary(collected), indent=2, ensure_ascii=False))
+    return 1 if any(not r.ok for r in collected) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Pool de sessões do IE "quentes" (já iniciadas e, opcionalmente, logadas).
+
+O start() do KMMIEDriver (IEDriverServer + IE -private + timeouts) custa
+segundos antes do login poder começar. O pool mantém `size` sessões de
+reserva prontas: acquire() entrega uma na hora e uma thread repõe a reserva
+em segundo plano.
+
+Sessões de longa duração do IE ficam lentas, então uma sessão devolvida é
+reciclada (stop em segundo plano) quando:
+  - passou de `max_transactions` transações;
+  - a memória da árvore de processos passou de `max_memory_mb`
+    (checada a cada `memory_check_every` transações);
+  - a transação falhou e o driver não responde mais.
+
+Uma sessão devolvida saudável volta para o topo da pilha e é a próxima a
+sair (LIFO): segue logada e o login() do próximo item é reaproveitado. Com
+um consumidor por vez ficam size + 1 sessões abertas, sem rotatividade.
+
+Cada processo tem o seu pool (sessões do IE não atravessam processos); no
+WorkerPool cada worker cria o seu pelo handler.
+
+    pool = SessionPool(lambda: KMMActions(service="J Mendes"), size=1, warmup=login)
+    with pool.session() as kmm:
+        kmm.emitting_contract_repomfretea(...)
+    pool.close()
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from kmm.services.kmm_actions import KMMActions
+from shared.logger import logger
+
+
+class SessionPool:
+    def __init__(
+        self,
+        factory: Callable[[], KMMActions],
+        size: int = 1,
+        warmup: Optional[Callable[[KMMActions], None]] = None,
+        max_transactions: Optional[int] = 50,
+        max_memory_mb: Optional[float] = None,
+        memory_check_every: int = 5,
+        refill_retry_s: float = 30.0,
+    ):
+        """
+        size=0 não mantém reserva nem thread: a sessão é criada no primeiro
+        acquire() e reaproveitada, como antes do pool.
+        """
+        self.factory = factory
+        self.size = max(0, size)
+        self.warmup = warmup
+        self.max_transactions = max_transactions
+        self.max_memory_mb = max_memory_mb
+        self.memory_check_every = max(1, memory_check_every)
+        self.refill_retry_s = refill_retry_s
+        self.log = logger.bind(pool="sessions")
+
+        self._cond = threading.Condition()
+        self._idle: List[KMMActions] = []
+        self._transactions: Dict[int, int] = {}
+        self._in_use = 0
+        self._creating = 0
+        self._closed = False
+        self._stoppers: List[threading.Thread] = []
+
+        self._refiller: Optional[threading.Thread] = None
+        if self.size:
+            self._refiller = threading.Thread(target=self._refill_loop, name="kmm-session-refill", daemon=True)
+            self._refiller.start()
+
+    # -----------------------------
+    # Entrega / devolução
+    # -----------------------------
+
+    def acquire(self) -> KMMActions:
+        """Sessão da reserva; sem reserva pronta, inicia uma agora (sem warmup)."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("SessionPool fechado")
+            if self._idle:
+                kmm = self._idle.pop()
+                self._in_use += 1
+                self._cond.notify_all()
+                return kmm
+            self._in_use += 1
+
+        try:
+            kmm = self._new_session(warm=False)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+            raise
+        self.log.info("Reserva vazia, sessão iniciada sob demanda")
+        return kmm
+
+    def release(self, kmm: KMMActions, failed: bool = False) -> None:
+        with self._cond:
+            self._in_use -= 1
+            count = self._transactions.get(id(kmm), 0) + 1
+            self._transactions[id(kmm)] = count
+
+        reason = self._recycle_reason(kmm, count, failed)
+        with self._cond:
+            # Reserva + a sessão em uso que volta; além disso sobram sessões sob demanda
+            if reason is None and (self._closed or len(self._idle) > self.size):
+                reason = "reserva cheia" if not self._closed else "pool fechado"
+            if reason is None:
+                self._idle.append(kmm)
+                self._cond.notify_all()
+                return
+            self._transactions.pop(id(kmm), None)
+            self._cond.notify_all()
+
+        self.log.info(f"Reciclando sessão após {count} transações: {reason}")
+        self._stop_later(kmm)
+
+    @contextmanager
+    def session(self) -> Iterator[KMMActions]:
+        kmm = self.acquire()
+        failed = True
+        try:
+            yield kmm
+            failed = False
+        finally:
+            self.release(kmm, failed=failed)
+
+    def close(self, timeout: float = 30.0) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        if self._refiller is not None:
+            self._refiller.join(timeout)
+        for kmm in idle:
+            self._stop(kmm)
+        for stopper in list(self._stoppers):
+            stopper.join(timeout)
+
+    def __enter__(self) -> "SessionPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def idle(self) -> int:
+        with self._cond:
+            return len(self._idle)
+
+    # -----------------------------
+    # Internos
+    # -----------------------------
+
+    def _recycle_reason(self, kmm: KMMActions, count: int, failed: bool) -> Optional[str]:
+        if failed and not kmm.driver.is_alive():
+            return "driver não responde"
+        if self.max_transactions and count >= self.max_transactions:
+            return f"limite de {self.max_transactions} transações"
+        if self.max_memory_mb and count % self.memory_check_every == 0:
+            used_mb = kmm.driver.memory_bytes() / (1024 * 1024)
+            if used_mb > self.max_memory_mb:
+                return f"memória {used_mb:.0f}MB > {self.max_memory_mb:.0f}MB"
+        return None
+
+    def _new_session(self, warm: bool) -> KMMActions:
+        kmm = self.factory()
+        try:
+            kmm.start()
+            if warm and self.warmup is not None:
+                self.warmup(kmm)
+        except Exception:
+            self._stop(kmm)
+            raise
+        with self._cond:
+            self._transactions[id(kmm)] = 0
+        return kmm
+
+    def _refill_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and len(self._idle) + self._creating >= self.size:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._creating += 1
+
+            started = time.monotonic()
+            try:
+                kmm = self._new_session(warm=True)
+            except Exception as e:
+                self.log.warning(f"Falha ao preparar sessão de reserva: {e}")
+                with self._cond:
+                    self._creating -= 1
+                    self._cond.wait(self.refill_retry_s)
+                continue
+
+            with self._cond:
+                self._creating -= 1
+                if self._closed:
+                    kmm_to_stop = kmm
+                else:
+                    kmm_to_stop = None
+                    # Entra na base da pilha: as devolvidas (já usadas) saem antes
+                    self._idle.insert(0, kmm)
+                    self._cond.notify_all()
+            if kmm_to_stop is not None:
+                self._stop(kmm_to_stop)
+                return
+            self.log.info(f"Sessão de reserva pronta em {time.monotonic() - started:.1f}s")
+
+    def _stop_later(self, kmm: KMMActions) -> None:
+        stopper = threading.Thread(target=self._stop, args=(kmm,), name="kmm-session-stop", daemon=True)
+        with self._cond:
+            self._stoppers = [t for t in self._stoppers if t.is_alive()]
+            self._stoppers.append(stopper)
+        stopper.start()
+
+    def _stop(self, kmm: KMMActions) -> None:
+        try:
+            kmm.stop()
+        except Exception as e:
+            self.log.warning(f"Falha ao encerrar sessão: {e}")
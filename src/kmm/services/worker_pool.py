@@ -0,0 +1,340 @@
+"""
+Pool de workers para processar a fila com várias sessões do IE em paralelo.
+
+Cada worker é um processo separado com o seu próprio handler (ex.: JMN,
+VALLOUREC), portanto com o seu próprio KMMActions/KMMIEDriver e o seu
+próprio estado de login. Os itens ficam numa fila compartilhada no processo
+pai e são entregues ao worker que pedir o próximo; os resultados voltam por
+uma fila de resultados.
+
+Se um worker morrer (crash do Python, do IEDriverServer, kill manual), o
+item que ele estava processando é reportado como "crashed" e um worker novo
+sobe no lugar, sem afetar os demais. Cada KMMIEDriver mata só os processos
+da própria sessão no stop().
+
+Item que falha com o circuit breaker do KMM aberto (KMMCircuitOpenError em
+qualquer ponto da cadeia de exceções) não é reportado: volta para a fila
+depois do prazo do breaker, até `max_defers` vezes.
+
+Uso (no Windows o spawn exige o guard de __main__):
+
+    from jmendes.main import JMN
+
+    if __name__ == "__main__":
+        with WorkerPool(handler_factory=JMN, workers=3) as pool:
+            for result in pool.run((item.tbe, item) for item in items):
+                print(result)
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import exceptions.personalized_exceptions as pe
+from shared.logger import logger
+
+
+@dataclass(frozen=True)
+class WorkItem:
+    id: str
+    payload: Any
+
+
+@dataclass(frozen=True)
+class WorkResult:
+    item_id: str
+    worker_id: int
+    status: str  # "ok" | "failed" | "crashed" ("deferred" só entre worker e pool)
+    value: Any = None
+    error: str = ""
+    error_type: str = ""
+    elapsed_s: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+# -----------------------------
+# Processo worker
+# -----------------------------
+
+def close_handler(handler: Any) -> None:
+    close = getattr(handler, "close", None)
+    if callable(close):
+        close()
+        return
+    kmm = getattr(handler, "kmm", None)
+    if kmm is not None:
+        kmm.stop()
+
+
+def circuit_open(exc: BaseException) -> Optional[pe.KMMCircuitOpenError]:
+    """KMMCircuitOpenError na cadeia (os fluxos do KMMActions embrulham as exceções)."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, pe.KMMCircuitOpenError):
+            return exc
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def _worker_main(
+    worker_id: int,
+    handler_factory: Callable[[], Any],
+    inbox: "mp.Queue",
+    results: "mp.Queue",
+    max_items: Optional[int],
+) -> None:
+    log = logger.bind(worker=worker_id, pid=os.getpid())
+    handler = handler_factory()
+    processed = 0
+    try:
+        while True:
+            results.put(("ready", worker_id, None))
+            item: Optional[WorkItem] = inbox.get()
+            if item is None:
+                break
+
+            start = time.monotonic()
+            try:
+                value = handler.process(item.payload)
+                result = WorkResult(item.id, worker_id, "ok", value=value, elapsed_s=time.monotonic() - start)
+            except Exception as e:
+                unavailable = circuit_open(e)
+                if unavailable is not None:
+                    log.warning(f"Item {item.id} adiado: {unavailable}")
+                    result = WorkResult(
+                        item.id,
+                        worker_id,
+                        "deferred",
+                        value=unavailable.retry_after_s,
+                        error=str(unavailable),
+                        error_type=type(unavailable).__name__,
+                        elapsed_s=time.monotonic() - start,
+                    )
+                    results.put(("done", worker_id, result))
+                    continue
+                log.error(f"Item {item.id} falhou: {e}")
+                result = WorkResult(
+                    item.id,
+                    worker_id,
+                    "failed",
+                    error=f"{e}\n{traceback.format_exc()}",
+                    error_type=type(e).__name__,
+                    elapsed_s=time.monotonic() - start,
+                )
+            results.put(("done", worker_id, result))
+
+            processed += 1
+            if max_items and processed >= max_items:
+                # Reciclagem: o pai sobe um worker novo no lugar deste
+                log.info(f"Worker reciclado após {processed} itens")
+                break
+    finally:
+        try:
+            close_handler(handler)
+        except Exception:
+            pass
+
+
+# -----------------------------
+# Pool (processo pai)
+# -----------------------------
+
+class WorkerPool:
+    def __init__(
+        self,
+        handler_factory: Callable[[], Any],
+        workers: int = 2,
+        max_items_per_worker: Optional[int] = None,
+        requeue_crashed: bool = False,
+        max_restarts: Optional[int] = None,
+        start_method: str = "spawn",
+        max_defers: int = 3,
+        min_defer_s: float = 5.0,
+    ):
+        """
+        handler_factory: callable de nível de módulo (picklable) que cria o
+            handler do worker; o handler precisa de um método process(payload).
+        requeue_crashed: devolve à fila o item de um worker que morreu. Fica
+            desligado por padrão porque reprocessar pode duplicar contratos.
+        max_restarts: limite de workers substitutos; estourado, os itens que
+            restam na fila são reportados como "crashed" (evita loop de spawn
+            quando o handler nem consegue subir).
+        max_defers: quantas vezes um item pode ser adiado por KMM instável
+            (circuit breaker aberto) antes de ser reportado como "failed".
+        """
+        self.handler_factory = handler_factory
+        self.workers = workers
+        self.max_items_per_worker = max_items_per_worker
+        self.requeue_crashed = requeue_crashed
+        self.max_restarts = max_restarts if max_restarts is not None else workers * 5
+        self._restarts = 0
+        self._ctx = mp.get_context(start_method)
+        self._results = self._ctx.Queue()
+        self._procs: Dict[int, Tuple[mp.Process, "mp.Queue"]] = {}
+        self._in_flight: Dict[int, WorkItem] = {}
+        self._next_worker_id = 0
+        self.max_defers = max_defers
+        self.min_defer_s = min_defer_s
+        self._deferred: List[Tuple[float, WorkItem]] = []
+        self._defers: Dict[str, int] = {}
+        # Workers sem item à espera dos adiados
+        self._waiting: Deque[int] = deque()
+        self.log = logger.bind(service="WorkerPool")
+
+    # --- workers ---
+
+    def _spawn(self) -> int:
+        worker_id = self._next_worker_id
+        self._next_worker_id += 1
+        inbox = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.handler_factory, inbox, self._results, self.max_items_per_worker),
+            name=f"kmm-worker-{worker_id}",
+            daemon=False,
+        )
+        proc.start()
+        self._procs[worker_id] = (proc, inbox)
+        self.log.info(f"Worker {worker_id} iniciado (pid {proc.pid})")
+        return worker_id
+
+    def _reap(self, backlog: Deque[WorkItem]) -> Iterator[WorkResult]:
+        for worker_id, (proc, inbox) in list(self._procs.items()):
+            if proc.is_alive():
+                continue
+            proc.join(timeout=0)
+            del self._procs[worker_id]
+            item = self._in_flight.pop(worker_id, None)
+
+            if item is not None:
+                self.log.error(f"Worker {worker_id} morreu (exitcode {proc.exitcode}) processando {item.id}")
+                if self.requeue_crashed:
+                    backlog.appendleft(item)
+                else:
+                    yield WorkResult(
+                        item.id,
+                        worker_id,
+                        "crashed",
+                        error=f"Worker finalizado com exitcode {proc.exitcode}",
+                        error_type="WorkerCrashed",
+                    )
+
+            if not (backlog or self._deferred) or len(self._procs) >= self.workers:
+                continue
+            if proc.exitcode != 0:
+                # Só crashes contam para o limite; reciclagem normal não
+                if self._restarts >= self.max_restarts:
+                    if not self._procs:
+                        self.log.error("Limite de reinícios de workers atingido, abortando itens restantes")
+                        backlog.extend(item for _, item in self._deferred)
+                        self._deferred.clear()
+                        while backlog:
+                            item = backlog.popleft()
+                            yield WorkResult(item.id, worker_id, "crashed", error="Sem workers disponíveis",
+                                             error_type="WorkerCrashed")
+                    continue
+                self._restarts += 1
+            self._spawn()
+
+    def _defer(self, result: WorkResult, item: Optional[WorkItem]) -> bool:
+        """Agenda o item adiado; False quando ele já esgotou max_defers."""
+        count = self._defers.get(result.item_id, 0) + 1
+        if item is None or count > self.max_defers:
+            return False
+        self._defers[result.item_id] = count
+        delay = max(float(result.value or 0), self.min_defer_s)
+        self._deferred.append((time.monotonic() + delay, item))
+        self.log.warning(f"Item {result.item_id} adiado {delay:.0f}s ({count}/{self.max_defers}): {result.error}")
+        return True
+
+    def _promote_deferred(self, backlog: Deque[WorkItem]) -> None:
+        now = time.monotonic()
+        due = [entry for entry in self._deferred if entry[0] <= now]
+        if not due:
+            return
+        self._deferred = [entry for entry in self._deferred if entry[0] > now]
+        backlog.extend(item for _, item in due)
+        while backlog and self._waiting:
+            worker_id = self._waiting.popleft()
+            entry = self._procs.get(worker_id)
+            if entry is None:
+                continue
+            item = backlog.popleft()
+            self._in_flight[worker_id] = item
+            entry[1].put(item)
+
+    def run(self, items: Iterable[Tuple[str, Any]]) -> Iterator[WorkResult]:
+        """Processa (item_id, payload) e devolve os resultados conforme terminam."""
+        backlog: Deque[WorkItem] = deque(WorkItem(item_id, payload) for item_id, payload in items)
+        pending = len(backlog)
+
+        while len(self._procs) < min(self.workers, pending):
+            self._spawn()
+
+        while pending:
+            self._promote_deferred(backlog)
+            try:
+                kind, worker_id, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                for result in self._reap(backlog):
+                    pending -= 1
+                    yield result
+                continue
+
+            if kind == "ready":
+                entry = self._procs.get(worker_id)
+                if entry is None:
+                    continue
+                if backlog:
+                    item = backlog.popleft()
+                    self._in_flight[worker_id] = item
+                    entry[1].put(item)
+                elif self._deferred:
+                    self._waiting.append(worker_id)
+                else:
+                    entry[1].put(None)
+            elif kind == "done":
+                item = self._in_flight.pop(worker_id, None)
+                if payload.status == "deferred":
+                    if self._defer(payload, item):
+                        continue
+                    payload = WorkResult(
+                        payload.item_id, worker_id, "failed", error=payload.error,
+                        error_type=payload.error_type, elapsed_s=payload.elapsed_s,
+                    )
+                pending -= 1
+                yield payload
+
+            # Reposição de workers reciclados por max_items_per_worker
+            for result in self._reap(backlog):
+                pending -= 1
+                yield result
+
+    def close(self, timeout: float = 30) -> None:
+        for proc, inbox in self._procs.values():
+            try:
+                inbox.put(None)
+            except Exception:
+                pass
+        deadline = time.monotonic() + timeout
+        for proc, _ in self._procs.values():
+            proc.join(timeout=max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.terminate()
+        self._procs.clear()
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
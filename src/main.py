@@ -9,7 +9,7 @@ def main():
         driver_path=os.getenv("WEBDRIVER_PATH")
     )
 
-    kmm = KMMActions(config=config)
+    kmm = KMMActions(service='Belgo', config=config)
     params = LoginParams(
         url=os.getenv('KMM_URL'),
         username=os.getenv("KMM_USERNAME"),
@@ -0,0 +1,43 @@
+import asyncio
+
+from bench.fake_driver import FakeKMM, fake_webdriver
+from bench.kmm_stub import StubConfig
+from kmm.ie_driver.ie_driver import IEDriverConfig
+from kmm.services import driver_cache, idempotency, results
+from kmm.services.async_actions import AsyncKMMActions
+from kmm.services.kmm_actions import KMMActions, LoginParams
+
+STUB = StubConfig()
+
+
+def test_contract_with_sqlite_collaborators_created_on_another_thread(tmp_path):
+    # Índice, cache e resultados abertos aqui; as chamadas rodam no thread do executor
+    index = idempotency.IdempotencyIndex(str(tmp_path / "idem.db"))
+    names = driver_cache.DriverNameCache(str(tmp_path / "drivers.db"))
+    sink = results.ResultSink(str(tmp_path / "results.db"))
+    kmm = KMMActions(
+        service="Async",
+        config=IEDriverConfig(metrics_dir=None, poll_stats_path=None, kill_processes_on_stop=False),
+        idempotency_index=index,
+        driver_name_cache=names,
+        result_sink=sink,
+    )
+    kmm.driver.attach(fake_webdriver(FakeKMM(driver_name=STUB.driver_name)))
+    item = dict(
+        license_plate="1234", driver_name=STUB.driver_name, nature="1", operation="10", route="15", card="1",
+        sender="11222333000181", recipient="11444777000161", liberation_user="USER", control_number=21,
+        weight="1000",
+    )
+
+    async def main():
+        async with AsyncKMMActions(kmm) as session:
+            await session.login(LoginParams(url="http://fake-kmm/admin.cfm", username="TESTE", password="teste"))
+            return await session.emitting_contract_repomfretea(**item)
+
+    assert asyncio.run(main()) == FakeKMM.contract_number
+    key = idempotency.contract_key(item["license_plate"], item["route"], item["sender"], item["recipient"])
+    assert index.get(idempotency.CONTRACT, key)[:2] == (idempotency.DONE, FakeKMM.contract_number)
+    assert names.get("1234") == STUB.driver_name.lower()
+    sink.close()
+    names.close()
+    index.close()
@@ -0,0 +1,66 @@
+import pytest
+
+import exceptions.personalized_exceptions as pe
+from bench.fake_driver import FakeKMM, fake_webdriver
+from bench.kmm_stub import StubConfig
+from kmm.ie_driver.ie_driver import IEDriverConfig
+from kmm.services import idempotency
+from kmm.services.kmm_actions import KMMActions, LoginParams
+
+STUB = StubConfig()
+ITEM = dict(
+    license_plate="1234", driver_name=STUB.driver_name, nature="1", operation="10", route="15", card="1",
+    sender="11222333000181", recipient="11444777000161", liberation_user="USER", control_number=21, weight="1000",
+)
+
+
+@pytest.fixture
+def kmm(tmp_path):
+    index = idempotency.IdempotencyIndex(str(tmp_path / "idem.db"))
+    kmm = KMMActions(
+        service="Teste",
+        config=IEDriverConfig(metrics_dir=None, poll_stats_path=None, kill_processes_on_stop=False),
+        idempotency_index=index,
+    )
+    kmm.driver.attach(fake_webdriver(FakeKMM(driver_name=STUB.driver_name)))
+    kmm.login(LoginParams(url="http://fake-kmm/admin.cfm", username="TESTE", password="teste"))
+    clicks = []
+    safe_click = kmm.driver.safe_click
+
+    def count_confirm(locator, *args, **kwargs):
+        if locator == 'id:btn_confirmar':
+            clicks.append(locator)
+        return safe_click(locator, *args, **kwargs)
+
+    kmm.driver.safe_click = count_confirm
+    kmm.confirm_clicks = clicks
+    yield kmm
+    kmm.driver.stop()
+    index.close()
+
+
+def _status(kmm):
+    key = idempotency.contract_key(ITEM["license_plate"], ITEM["route"], ITEM["sender"], ITEM["recipient"])
+    row = kmm.idempotency.get(idempotency.CONTRACT, key)
+    return row[0] if row else None
+
+
+def test_no_resend_when_confirmation_is_unknown(kmm, monkeypatch):
+    monkeypatch.setattr(kmm, "_confirm_outcome", lambda *a, **k: (None, None))
+    with pytest.raises(pe.KMMEmittingContractError):
+        kmm.emitting_contract_repomfretea(**ITEM)
+    assert len(kmm.confirm_clicks) == 1
+    assert _status(kmm) == idempotency.SUBMITTED
+
+
+def test_explicit_refusal_frees_the_key(kmm, monkeypatch):
+    monkeypatch.setattr(kmm, "_confirm_outcome", lambda *a, **k: ("erro", "Rota inválida"))
+    with pytest.raises(pe.KMMEmittingContractError):
+        kmm.emitting_contract_repomfretea(**ITEM)
+    assert len(kmm.confirm_clicks) == 1
+    assert _status(kmm) is None
+
+
+def test_success_marks_the_key_done(kmm):
+    assert kmm.emitting_contract_repomfretea(**ITEM) == FakeKMM.contract_number
+    assert _status(kmm) == idempotency.DONE
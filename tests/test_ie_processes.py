@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+from bench.fake_driver import FakeKMM, fake_webdriver
+from kmm.ie_driver import processes
+from kmm.ie_driver.ie_driver import IEDriverConfig, KMMIEDriver
+
+
+def _ie_driver(monkeypatch, table, killed):
+    monkeypatch.setattr(processes, "_process_table", lambda: dict(table))
+    monkeypatch.setattr(processes, "kill_pids", lambda pids: killed.extend(pids))
+    driver = KMMIEDriver(IEDriverConfig(metrics_dir=None, poll_stats_path=None, evidence_async=False))
+    webdriver = fake_webdriver(FakeKMM())
+    # webdriver.Ie do selenium 3.141 guarda o Service em .iedriver
+    webdriver.iedriver = SimpleNamespace(process=SimpleNamespace(pid=100))
+    driver.attach(webdriver)
+    return driver
+
+
+def test_tracks_ie_service_of_selenium_3(monkeypatch):
+    driver = _ie_driver(monkeypatch, {100: 1, 101: 100, 102: 101, 900: 1}, [])
+    driver._track_session_processes()
+    assert driver.service_pid == 100
+    assert driver.session_pids == [100, 101, 102]
+
+
+def test_stop_kills_only_the_session_tree(monkeypatch):
+    table = {100: 1, 101: 100, 102: 101, 900: 1}
+    killed = []
+    driver = _ie_driver(monkeypatch, table, killed)
+    driver._track_session_processes()
+    driver.stop()
+    assert killed == [102, 101, 100]
+
+
+def test_stop_spares_reused_pids(monkeypatch):
+    table = {100: 1, 101: 100, 102: 101}
+    killed = []
+    driver = _ie_driver(monkeypatch, table, killed)
+    driver._track_session_processes()
+    original_quit = driver._driver.quit
+
+    def quit_and_reuse():
+        original_quit()
+        # 102 saiu e o Windows deu o PID a outro processo
+        table[102] = 555
+
+    driver._driver.quit = quit_and_reuse
+    driver.stop()
+    assert killed == [101, 100]
@@ -0,0 +1,48 @@
+import pytest
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+
+from bench.fake_driver import FakeKMM, fake_webdriver
+from kmm.ie_driver import retry
+from kmm.ie_driver.ie_driver import IEDriverConfig, KMMIEDriver
+
+
+@pytest.mark.parametrize("exc, unhealthy", [
+    (NoSuchElementException("Unable to find element with id == GRID"), False),
+    (StaleElementReferenceException("Element is no longer valid"), False),
+    (TimeoutException("Timed out waiting for element"), False),
+    (TimeoutException("Timed out waiting for page to load."), True),
+    (ConnectionRefusedError(10061, "connection refused"), True),
+    (Exception("HTTP 503 Service Unavailable"), True),
+])
+def test_unhealthy_endpoint(exc, unhealthy):
+    assert retry.DEFAULT_POLICY.unhealthy(exc) is unhealthy
+
+
+@pytest.fixture
+def driver(tmp_path):
+    driver = KMMIEDriver(IEDriverConfig(metrics_dir=None, poll_stats_path=None, kill_processes_on_stop=False,
+                                        evidence_dir=str(tmp_path), evidence_async=False))
+    driver.attach(fake_webdriver(FakeKMM()))
+    driver.breaker = retry.CircuitBreaker("kmm-teste", failure_threshold=2, reset_timeout_s=60)
+    yield driver
+    driver.stop()
+
+
+def _fail(driver, exc):
+    def fn():
+        raise exc
+
+    with pytest.raises(type(exc)):
+        driver._with_retry(fn, on_fail_label="teste", retries=0, backoff_s=0)
+
+
+def test_locator_misses_do_not_open_the_breaker(driver):
+    for _ in range(5):
+        _fail(driver, NoSuchElementException("Unable to find element"))
+    assert driver.breaker.state == retry.CLOSED
+
+
+def test_page_load_timeouts_open_the_breaker(driver):
+    for _ in range(2):
+        _fail(driver, TimeoutException("Timed out waiting for page to load."))
+    assert driver.breaker.state == retry.OPEN
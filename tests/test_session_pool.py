@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from bench.fake_driver import FakeKMM, fake_webdriver
+from kmm.ie_driver import processes
+from kmm.ie_driver.ie_driver import IEDriverConfig, KMMIEDriver
+from kmm.services.session_pool import SessionPool
+
+MB = 1024 * 1024
+
+
+class FakeSession:
+    """Só o que o pool usa de KMMActions: start/stop e driver.memory_bytes/is_alive."""
+
+    def __init__(self, memory_mb: float):
+        self.started = self.stopped = False
+        self.driver = SimpleNamespace(memory_bytes=lambda: int(memory_mb * MB), is_alive=lambda: True)
+
+    def start(self) -> None:
+        self.started = True
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+def test_recycles_session_over_memory_limit():
+    sessions = []
+
+    def factory():
+        sessions.append(FakeSession(memory_mb=800))
+        return sessions[-1]
+
+    pool = SessionPool(factory, size=0, max_transactions=None, max_memory_mb=500, memory_check_every=1)
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+    pool.close()
+
+    assert first is not second
+    assert first.stopped
+    assert len(sessions) == 2
+
+
+def test_keeps_session_under_memory_limit():
+    pool = SessionPool(lambda: FakeSession(memory_mb=100), size=0, max_transactions=None,
+                       max_memory_mb=500, memory_check_every=1)
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+    assert first is second
+    assert not first.stopped
+    pool.close()
+
+
+def test_memory_bytes_sums_the_ie_session_tree(monkeypatch):
+    rows = {100: (1, 10 * MB), 101: (100, 300 * MB), 102: (101, 200 * MB), 900: (1, 999 * MB)}
+    monkeypatch.setattr(processes, "_process_rows", lambda: dict(rows))
+    driver = KMMIEDriver(IEDriverConfig(metrics_dir=None, poll_stats_path=None, kill_processes_on_stop=False))
+    webdriver = fake_webdriver(FakeKMM())
+    webdriver.iedriver = SimpleNamespace(process=SimpleNamespace(pid=100))
+    driver.attach(webdriver)
+    driver._track_session_processes()
+    assert driver.memory_bytes() == 510 * MB
@@ -0,0 +1,19 @@
+from bench.fake_driver import FakeKMM, fake_webdriver
+from kmm.ie_driver.ie_driver import PRINCIPAL_PATH, IEDriverConfig, KMMIEDriver
+
+
+def test_close_window_forgets_the_frame_of_the_closed_window():
+    driver = KMMIEDriver(IEDriverConfig(metrics_dir=None, poll_stats_path=None, kill_processes_on_stop=False))
+    webdriver = fake_webdriver(FakeKMM())
+    driver.attach(webdriver)
+    webdriver.command_executor.handles.append("popup")
+    driver.sync_windows()
+
+    driver.switch_to_handle("popup")
+    driver.switch_to_frame(principal=True)
+    assert driver.frame_path == PRINCIPAL_PATH
+
+    driver.close_window()
+    assert webdriver.window_handles == [driver.home_page_id]
+    assert driver.frame_path is None
+    driver.stop()